@@ -0,0 +1,112 @@
+"""
+基准测试辅助工具
+
+插件依赖 autMan 运行时提供的 middleware 模块。离线运行基准测试时，
+这里用内存版 middleware 替代，并按文件路径加载插件模块（插件文件名为中文，
+不能直接 import）。
+"""
+
+import importlib.util
+import os
+import sys
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "common"))
+
+
+class _Sender:
+    def __init__(self, mw):
+        self.mw = mw
+
+    def getUserID(self):
+        return self.mw.user_id
+
+    def getGroupID(self):
+        return self.mw.group_id
+
+    def getImtype(self):
+        return "bench"
+
+    def getMessage(self):
+        return self.mw.message
+
+    def reply(self, text):
+        self.mw.replies.append(text)
+
+    def listen(self, timeout):
+        return self.mw.inputs.pop(0) if self.mw.inputs else None
+
+
+def install_middleware(message="", user_id="bench_user", group_id=""):
+    """
+    安装内存版 middleware 模块
+    :return: 模块对象，可读取 buckets / replies / calls 等状态
+    """
+    mw = types.ModuleType("middleware")
+    mw.buckets = {}
+    mw.replies = []
+    mw.inputs = []
+    mw.calls = {"bucketGet": 0, "bucketSet": 0, "bucketDel": 0}
+    mw.message = message
+    mw.user_id = user_id
+    mw.group_id = group_id
+
+    def bucketGet(bucket, key):
+        mw.calls["bucketGet"] += 1
+        return mw.buckets.get(bucket, {}).get(key, "")
+
+    def bucketSet(bucket, key, value):
+        mw.calls["bucketSet"] += 1
+        mw.buckets.setdefault(bucket, {})[key] = value
+
+    def bucketDel(bucket, key):
+        mw.calls["bucketDel"] += 1
+        mw.buckets.get(bucket, {}).pop(key, None)
+
+    mw.bucketGet = bucketGet
+    mw.bucketSet = bucketSet
+    mw.bucketDel = bucketDel
+    mw.getSenderID = lambda: "bench"
+    mw.Sender = lambda sender_id: _Sender(mw)
+    mw.push = lambda *args: None
+    mw.aiReplyStream = lambda prompt: ""
+    sys.modules["middleware"] = mw
+    return mw
+
+
+def new_process():
+    """
+    模拟 autMan 为每条消息启动新进程：丢弃进程内共享的存储实例、HTTP 连接池和熔断器，
+    存储桶中的数据（会话缓存、工具缓存等）保留
+    """
+    import autman_http
+    import autman_resilience
+    import autman_storage
+
+    if autman_http._transport is not None:
+        autman_http._transport.close()
+        autman_http._transport = None
+    autman_storage._store = None
+    autman_resilience._breakers.clear()
+
+
+def load_plugin(relpath, name):
+    """按路径加载插件模块（不执行 __main__ 部分）"""
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, relpath))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timeit(fn, repeat=5, number=1):
+    """多次运行取中位数，返回单次耗时（微秒）"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2]
@@ -0,0 +1,128 @@
+"""
+麦当劳插件端到端延迟基准测试
+
+启动本地 MCP 替身服务（mcp_stub.py），把插件的 MCP_URL 指向它，逐条模拟用户命令：
+每次调用都像 autMan 一样是一个"新进程"（重新创建插件、存储实例和连接池），
+存储桶中的数据在调用之间保留。
+
+对每个命令统计：
+- 延迟 p50 / p95 / p99（毫秒，从创建插件到 run() 返回）
+- 每次调用平均发给 MCP 服务的请求数（initialize / tools/call / 通知）
+
+两种场景：
+- 冷：每次调用前清空会话缓存和工具缓存（首次使用、缓存过期）
+- 热：缓存在调用之间保留（会话复用、工具结果缓存生效）
+
+运行：python3 benchmarks/bench_maimai_latency.py [--latency 0.02] [--mode sse|json] [--runs 30] [--no-batch] [--gzip]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import time
+
+from _harness import install_middleware, load_plugin, new_process
+from mcp_stub import MCPStubServer
+
+mw = install_middleware(user_id="bench_user")
+maimai = load_plugin("maimai/麦当劳优惠券.py", "maimai_plugin")
+
+from autman_ratelimit import RATE_BUCKET  # 依赖 middleware，需在 install_middleware 之后导入
+
+# (命令, 需要回复的输入)
+COMMANDS = [
+    ("麦当劳日历", []),
+    ("麦当劳优惠券", ["n"]),
+    ("麦当劳领券", []),
+    ("麦当劳我的优惠券", []),
+    ("麦当劳全部领券", []),
+    ("麦当劳总览", []),
+]
+ACCOUNTS = 3
+CACHE_BUCKETS = [maimai.SESSION_BUCKET, maimai.TOOL_CACHE_BUCKET]
+
+
+def percentile(samples, p):
+    """最近秩百分位数"""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def setup_user():
+    """写入测试用户：ACCOUNTS 个账号，第一个为当前账号"""
+    accounts = {
+        f"账号{i}": {"token": f"bench-token-{i}", "label": f"账号{i}", "created_at": "2026-01-01 00:00:00"}
+        for i in range(1, ACCOUNTS + 1)
+    }
+    user_data = {"accounts": accounts, "active_account": "账号1", "auto_claim_enabled": False, "last_claim_date": None}
+    mw.buckets.clear()
+    mw.buckets[maimai.BUCKET_NAME] = {mw.user_id: json.dumps(user_data, ensure_ascii=False)}
+
+
+def invoke(message, inputs):
+    """模拟一条用户消息，返回耗时（毫秒）"""
+    new_process()
+    mw.buckets.pop(RATE_BUCKET, None)  # 只测延迟，不受限流影响
+    mw.message = message
+    mw.inputs = list(inputs)
+    mw.replies.clear()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        maimai.MaiMaiPlugin().run()
+    elapsed = (time.perf_counter() - start) * 1000
+    if any(reply.startswith("❌") for reply in mw.replies):
+        raise RuntimeError(f"{message} 执行失败: {mw.replies}")
+    return elapsed
+
+
+def bench_command(stub, message, inputs, runs, warm):
+    """
+    :return: (延迟列表, 每次调用的平均请求数, 按方法的平均请求数)
+    """
+    setup_user()
+    if warm:
+        invoke(message, inputs)  # 预热：建立会话、写入工具缓存
+
+    samples = []
+    before = stub.stats()
+    for _ in range(runs):
+        if not warm:
+            for bucket in CACHE_BUCKETS:
+                mw.buckets.pop(bucket, None)
+        samples.append(invoke(message, inputs))
+    after = stub.stats()
+
+    per_method = {k: (after.get(k, 0) - before.get(k, 0)) / runs for k in after if k != "requests"}
+    total = (after.get("requests", 0) - before.get("requests", 0)) / runs
+    return samples, total, per_method
+
+
+def main():
+    parser = argparse.ArgumentParser(description="麦当劳插件端到端延迟基准测试")
+    parser.add_argument("--latency", type=float, default=0.02, help="替身服务每个请求的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="替身服务随机延迟上限（秒）")
+    parser.add_argument("--mode", choices=["sse", "json"], default="sse")
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--no-batch", action="store_true", help="替身服务拒绝 JSON-RPC 批量请求")
+    parser.add_argument("--gzip", action="store_true", help="替身服务以 gzip 压缩响应体")
+    args = parser.parse_args()
+
+    with MCPStubServer(latency=args.latency, jitter=args.jitter, mode=args.mode, batch=not args.no_batch,
+                       gzip=args.gzip) as stub:
+        maimai.MCP_URL = stub.url
+        print(f"MCP 替身服务: {args.mode}, 每个请求延迟 {args.latency * 1000:.0f}ms, 每项 {args.runs} 次\n")
+        print(f"{'命令':<10} | {'场景':<2} | {'p50(ms)':>8} | {'p95(ms)':>8} | {'p99(ms)':>8} | "
+              f"{'请求/次':>7} | {'初始化':>6} | {'工具':>6}")
+        print("-" * 84)
+        for message, inputs in COMMANDS:
+            for warm in (False, True):
+                samples, total, per_method = bench_command(stub, message, inputs, args.runs, warm)
+                print(f"{message:<10} | {'热' if warm else '冷':<2} | {percentile(samples, 50):>8.1f} | "
+                      f"{percentile(samples, 95):>8.1f} | {percentile(samples, 99):>8.1f} | {total:>7.1f} | "
+                      f"{per_method.get('initialize', 0):>6.1f} | {per_method.get('tools/call', 0):>6.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+便便 AI 分析流式输出基准测试
+
+在本地启动智谱AI替身服务（chat/completions，支持 stream: true 的 SSE 响应），
+按固定速度逐个输出 token，模拟大模型生成报告。分别以一次性模式和流式模式运行「便便分析」，统计：
+- 首段：从调用开始到用户收到第一段报告内容的时间（用户感知的等待时间）
+- 完成：从调用开始到 run() 返回的时间
+- 条数：报告内容分几条消息发送
+
+还会核对流式模式分段发送的内容拼接后与一次性模式的报告一致。
+
+运行：python3 benchmarks/bench_poop_stream.py [--token-delay 0.03] [--runs 5]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from _harness import install_middleware, load_plugin, new_process
+
+mw = install_middleware(user_id="bench_user")
+poop = load_plugin("poop/便便.py", "poop_plugin")
+
+REPORT = (
+    "**1. 健康状况评估**：正常。\n\n"
+    "**2. 具体分析**：记录期间平均每天约 1.1 次，处于健康范围内；"
+    "状态以通畅为主，偶有一般和费劲，没有持续的异常趋势。"
+    "拉稀仅出现过一次，可能与饮食有关，目前无需担心。\n\n"
+    "**3. 健康建议**：\n"
+    "- 保持每天 1.5~2 升的饮水量，多吃蔬菜、水果和全谷物，增加膳食纤维。\n"
+    "- 规律作息，每天固定时间如厕，避免久坐。\n"
+    "- 如果出现持续腹泻、便血或明显的排便习惯改变，请及时就医。"
+)
+TOKEN_CHARS = 2  # 每个 token 的字符数
+
+
+class ZhipuStub:
+    """智谱AI chat/completions 替身服务（后台线程运行）"""
+
+    def __init__(self, token_delay, first_token_delay):
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+        # 每次调用前丢弃连接池时 keep-alive 连接会被客户端断开，不打印异常
+        self.server.handle_error = lambda request, client_address: None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/paas/v4/chat/completions"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                tokens = [REPORT[i:i + TOKEN_CHARS] for i in range(0, len(REPORT), TOKEN_CHARS)]
+                time.sleep(stub.first_token_delay)
+                if not body.get("stream"):
+                    time.sleep(stub.token_delay * len(tokens))
+                    data = json.dumps({"choices": [{"message": {"content": REPORT}}]}, ensure_ascii=False)
+                    self._send_json(data.encode("utf-8"))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for token in tokens:
+                    chunk = {"choices": [{"index": 0, "delta": {"content": token}}]}
+                    self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+                    time.sleep(stub.token_delay)
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _send_json(self, data):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, text):
+                data = text.encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TimedReplies(list):
+    """记录每条回复的发送时间"""
+
+    def __init__(self):
+        super().__init__()
+        self.times = []
+
+    def append(self, text):
+        self.times.append(time.perf_counter())
+        super().append(text)
+
+    def clear(self):
+        self.times.clear()
+        super().clear()
+
+
+def setup_user():
+    """写入测试配置和 30 天的记录"""
+    mw.buckets.clear()
+    mw.buckets["otto"] = {"便便.zhipu_api_key": "sk-bench"}
+    new_process()
+    store = poop.get_store()
+    records = poop.PoopRecordStore(mw.user_id, store)
+    now = int(time.time())
+    for day in range(30):
+        process = "D" if day == 7 else "ABAC"[day % 4]
+        timestamp = now - (30 - day) * 86400
+        records.append({
+            "userid": mw.user_id,
+            "datetime": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+            "timestamp": timestamp,
+            "process": process,
+            "process_desc": poop.PROCESS_MAP[process],
+        })
+    store.flush()
+
+
+def invoke(stream):
+    """
+    运行一次「便便分析」
+    :return: (首段耗时 ms, 完成耗时 ms, 报告内容消息数, 拼接的报告)
+    """
+    new_process()
+    for bucket in (poop.AI_CACHE_BUCKET, "autman_ratelimit"):
+        mw.buckets.pop(bucket, None)
+    poop.AI_STREAM = stream
+    mw.message = "便便分析"
+    mw.replies = TimedReplies()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        poop.PoopPlugin().run()
+    elapsed = (time.perf_counter() - start) * 1000
+
+    first = next(i for i, text in enumerate(mw.replies) if text.startswith(poop.ANALYSIS_REPORT_HEADER))
+    last = next(i for i, text in enumerate(mw.replies) if "报告来源" in text)
+    parts = list(mw.replies[first:last + 1])
+    parts[0] = parts[0][len(poop.ANALYSIS_REPORT_HEADER):]
+    parts[-1] = parts[-1].split("━━━━")[0]
+    report = "".join(part.strip() for part in parts)
+    count = last - first + (0 if stream else 1)
+    return (mw.replies.times[first] - start) * 1000, elapsed, count, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="便便 AI 分析流式输出基准测试")
+    parser.add_argument("--token-delay", type=float, default=0.03, help="每个 token 的生成时间（秒）")
+    parser.add_argument("--first-token-delay", type=float, default=0.3, help="第一个 token 之前的延迟（秒）")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    setup_user()
+    with ZhipuStub(args.token_delay, args.first_token_delay) as stub:
+        poop.ZHIPU_API_URL = stub.url
+        print(f"智谱AI替身服务: 报告 {len(REPORT)} 字符, 每 token {TOKEN_CHARS} 字符 / "
+              f"{args.token_delay * 1000:.0f}ms, 首 token 延迟 {args.first_token_delay * 1000:.0f}ms\n")
+        print(f"{'模式':<6} | {'首段(ms)':>9} | {'完成(ms)':>9} | {'条数':>4} | 一致")
+        print("-" * 46)
+        reference = None
+        for stream in (False, True):
+            results = [invoke(stream) for _ in range(args.runs)]
+            first = sorted(r[0] for r in results)[len(results) // 2]
+            total = sorted(r[1] for r in results)[len(results) // 2]
+            report = results[-1][3]
+            if reference is None:
+                reference = report
+            same = "✓" if "".join(report.split()) == "".join(reference.split()) else "✗"
+            print(f"{'流式' if stream else '一次性':<6} | {first:>9.1f} | {total:>9.1f} | {results[-1][2]:>4} | {same}")
+
+
+if __name__ == "__main__":
+    main()
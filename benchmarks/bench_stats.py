@@ -0,0 +1,119 @@
+"""
+统计引擎基准测试
+
+比较在 1k ~ 50k 条合成记录下生成完整统计（状态分布、频率分布、覆盖率、
+平均频率、近7天状态）的耗时：
+- 旧版：按日期分组 + get_status_distribution + calculate_period_stats 三遍扫描
+- 单遍：RecordAggregator 扫描一遍全部记录（重建快照时的开销）
+- 快照：读取已保存的聚合快照，只扫描近7天窗口（show_statistics 实际走的路径）
+
+运行：python3 benchmarks/bench_stats.py
+"""
+
+import json
+import random
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from _harness import install_middleware, load_plugin, timeit
+
+install_middleware()
+poop = load_plugin("poop/便便.py", "poop_plugin")
+PoopAggregates = poop.PoopAggregates
+records_since = poop.records_since
+
+SIZES = [1000, 10000, 50000]
+STATUSES = ["通畅 😊", "一般 😐", "费劲 😣", "拉稀 💧", "用药 💊"]
+START = int(datetime(2020, 1, 1).timestamp())
+
+
+def make_records(n):
+    random.seed(n)
+    records = []
+    timestamp = START
+    for _ in range(n):
+        timestamp += random.randint(3600, 30 * 3600)
+        records.append({
+            "datetime": datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S"),
+            "timestamp": timestamp,
+            "process_desc": random.choice(STATUSES),
+        })
+    return records
+
+
+# ---- 旧版实现（摘自 v1.5.2 show_statistics） ----
+
+def legacy_status(record):
+    if 'process_desc' in record:
+        return record['process_desc'].split()[0] if record['process_desc'] else "未知"
+    return "未知"
+
+
+def legacy_statistics(records, now):
+    records_by_date = defaultdict(list)
+    for record in records:
+        records_by_date[record['datetime'].split(' ')[0]].append(record)
+
+    total_count = len(records)
+    total_days = len(records_by_date)
+    dates = sorted(records_by_date.keys())
+    first = datetime.strptime(dates[0], '%Y-%m-%d')
+    last = datetime.strptime(dates[-1], '%Y-%m-%d')
+    date_span = (last - first).days + 1
+    avg_freq = total_count / total_days
+    coverage = total_days / date_span * 100
+
+    status_dist = Counter(legacy_status(r) for r in records)
+
+    freq_dist = defaultdict(int)
+    for day_records in records_by_date.values():
+        freq_dist[len(day_records)] += 1
+
+    cutoff = now - 7 * 86400
+    recent = Counter(legacy_status(r) for r in [r for r in records if r['timestamp'] >= cutoff])
+    return status_dist, dict(freq_dist), avg_freq, coverage, recent
+
+
+# ---- RecordAggregator ----
+
+def single_pass_statistics(records, now):
+    stats = PoopAggregates.rebuild(records, recent_since=now - 7 * 86400)
+    return stats.categories, stats.freq_hist, stats.avg_per_day, stats.coverage, stats.recent
+
+
+def snapshot_statistics(snapshot_text, records, now):
+    cutoff = now - 7 * 86400
+    stats = PoopAggregates(json.loads(snapshot_text))
+    recent = PoopAggregates(recent_since=cutoff).feed(records_since(records, cutoff))
+    return stats.categories, stats.freq_hist, stats.avg_per_day, stats.coverage, recent.recent
+
+
+def main():
+    print(f"{'记录数':>8} | {'旧版(ms)':>10} | {'单遍(ms)':>10} | {'快照(ms)':>10}")
+    print("-" * 50)
+    for n in SIZES:
+        records = make_records(n)
+        now = records[-1]['timestamp']
+        repeat = 7
+
+        legacy = legacy_statistics(records, now)
+        single = single_pass_statistics(records, now)
+        assert dict(legacy[0]) == single[0]
+        assert legacy[1] == single[1]
+        assert abs(legacy[2] - single[2]) < 1e-9 and abs(legacy[3] - single[3]) < 1e-9
+        assert dict(legacy[4]) == single[4]
+
+        snapshot_text = json.dumps(PoopAggregates.rebuild(records).to_dict(), ensure_ascii=False)
+        snapshot = snapshot_statistics(snapshot_text, records, now)
+        assert snapshot[:2] == single[:2] and snapshot[4] == single[4]
+
+        legacy_us = timeit(lambda: legacy_statistics(records, now), repeat)
+        single_us = timeit(lambda: single_pass_statistics(records, now), repeat)
+        snapshot_us = timeit(lambda: snapshot_statistics(snapshot_text, records, now), repeat)
+        print(f"{n:>8} | {legacy_us / 1000:>10.1f} | {single_us / 1000:>10.1f} | {snapshot_us / 1000:>10.1f}")
+
+    print("\n✅ 结果一致性校验通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+麦当劳工具结果格式化基准测试
+
+比较 format_tool_result 在典型 MCP 工具返回（活动日历、可领优惠券、我的优惠券）上的耗时：
+- 旧版：方法内 import re，六次整段 re.sub，每个 <img> 再做两次 re.search，最后截断
+- 新版：预编译正则逐行单遍处理，输出达到 2000 字符时停止
+
+样例按 MCP 服务返回的格式（### 标题、<img> 标签、Markdown 图片、行尾反斜杠换行、连续空行）
+重建，数量与长度对应日常查询和大量优惠券时的返回。另外校验跨行的 <img> 标签
+落在分段边界时不会被切开（原样的 HTML 不能出现在输出中）。
+
+输出差异：旧版的 \\\s*$ 会跨行匹配，行尾反斜杠之后的空行也被删除（段落被合并），
+新版保留这一个空行，因此校验比较的是去掉空行后的内容（空行计入长度，截断位置可能略有不同）。
+
+运行：python3 benchmarks/bench_tool_format.py
+"""
+
+import random
+import re
+
+from _harness import install_middleware, load_plugin, timeit
+
+install_middleware()
+maimai = load_plugin("maimai/麦当劳优惠券.py", "maimai_plugin")
+format_tool_result = maimai.format_tool_result
+
+PRODUCTS = ["麦辣鸡腿堡", "板烧鸡腿堡", "巨无霸", "麦香鱼", "薯条(中)", "麦旋风", "那么大鸡排", "原味板烧"]
+
+
+# ---- 旧版实现（摘自 v2.0.0 MaiMaiPlugin.format_tool_result） ----
+
+def legacy_format_tool_result(result):
+    if not result or "content" not in result:
+        return "未获取到数据"
+
+    text = ""
+    for item in result["content"]:
+        if item.get("type") == "text":
+            text += item.get("text", "")
+
+    import re
+
+    def replace_img_tag(match):
+        img_tag = match.group(0)
+        src_match = re.search(r'src=["\']([^"\']+)["\']', img_tag, re.IGNORECASE)
+        if src_match:
+            url = src_match.group(1)
+            alt_match = re.search(r'alt=["\']([^"\']+)["\']', img_tag, re.IGNORECASE)
+            alt_text = alt_match.group(1) if alt_match else "查看图片"
+            return f"[{alt_text}]({url})"
+        return ""
+
+    text = re.sub(r'<\s*img[^>]*>', replace_img_tag, text, flags=re.IGNORECASE | re.DOTALL)
+    text = re.sub(r'!\[([^\]]*)\]\(([^)]+)\)', r'[\1](\2)', text)
+    text = re.sub(r'\\\s*$', '', text, flags=re.MULTILINE)
+    text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
+    text = re.sub(r'^###\s+', '', text, flags=re.MULTILINE)
+
+    if len(text) > 2000:
+        text = text[:1997] + "..."
+
+    return text.strip()
+
+
+# ---- 样例 ----
+
+def coupon_block(i, rng):
+    name = rng.choice(PRODUCTS)
+    price = rng.randint(9, 39) + 0.9
+    img = f"https://img.mcd.cn/coupon/{i:04d}.png"
+    if i % 2:
+        image = f'<img src="{img}" alt="{name}" width="120">'
+    else:
+        image = f"![{name}]({img})"
+    return (f"### {i}. {name}优惠券\n"
+            f"{image}\\\n"
+            f"- 价格：{price}元\\\n"
+            f"- 有效期：2026-01-{rng.randint(1, 28):02d} 至 2026-02-{rng.randint(1, 28):02d}\\\n"
+            f"- 使用说明：到店或麦乐送可用  \n\n\n")
+
+
+def make_result(count, seed, title):
+    rng = random.Random(seed)
+    text = f"### {title}\n\n" + "".join(coupon_block(i + 1, rng) for i in range(count))
+    # 服务端常把一段长文本拆成多个 content 项返回
+    cut = len(text) // 2
+    return {"content": [{"type": "text", "text": text[:cut]}, {"type": "text", "text": text[cut:]}]}
+
+
+def make_calendar():
+    rng = random.Random(1)
+    lines = ["### 活动日历", ""]
+    for day in range(1, 31):
+        lines.append(f"### 1月{day}日")
+        lines.append(f'<img src="https://img.mcd.cn/calendar/{day}.jpg" alt="{rng.choice(PRODUCTS)}日">')
+        lines.append(f"今日特惠：{rng.choice(PRODUCTS)} 第二份半价\\")
+        lines.append("")
+        lines.append("")
+    return {"content": [{"type": "text", "text": "\n".join(lines)}]}
+
+
+def make_multiline_images(pad):
+    """<img> 标签跨三行、URL 较长：转换后第一个片段不足 2000 字符，会继续处理第二个片段"""
+    rng = random.Random(pad)
+    blocks = ["### 可领优惠券" + " " * pad, ""]
+    for i in range(1, 41):
+        url = f"https://img.mcd.cn/coupon/2026/campaign/{i:04d}/" + "a" * 60 + ".png"
+        blocks.append(f"### {i}. {rng.choice(PRODUCTS)}优惠券")
+        blocks.append(f'<img\n  src="{url}"\n  alt="券{i}"\n  width="120">')
+        blocks.append(f"- 价格：{rng.randint(9, 39)}.9元")
+        blocks.append("")
+    return {"content": [{"type": "text", "text": "\n".join(blocks)}]}
+
+
+FIXTURES = [
+    ("活动日历", make_calendar()),
+    ("可领优惠券(5张)", make_result(5, 5, "可领优惠券")),
+    ("可领优惠券(40张)", make_result(40, 40, "可领优惠券")),
+    ("我的优惠券(200张)", make_result(200, 200, "我的优惠券")),
+]
+
+
+def same_content(actual, expected):
+    """去掉空行后逐行相同；截断的最后一行只要求是旧版对应行的前缀"""
+    actual = [line for line in actual.split("\n") if line.strip()]
+    expected = [line for line in expected.split("\n") if line.strip()]
+    if len(actual) != len(expected) or actual[:-1] != expected[:-1]:
+        return False
+    last = actual[-1]
+    return last == expected[-1] or (last.endswith("...") and expected[-1].startswith(last[:-3]))
+
+
+def main():
+    print(f"{'样例':<16} | {'输入字符':>8} | {'旧版(us)':>10} | {'新版(us)':>10} | {'加速':>6}")
+    print("-" * 64)
+    for name, result in FIXTURES:
+        expected = legacy_format_tool_result(result)
+        actual = format_tool_result(result)
+        assert same_content(actual, expected), f"{name} 输出不一致"
+
+        size = sum(len(item["text"]) for item in result["content"])
+        legacy_us = timeit(lambda: legacy_format_tool_result(result), repeat=7, number=50)
+        new_us = timeit(lambda: format_tool_result(result), repeat=7, number=50)
+        print(f"{name:<16} | {size:>8} | {legacy_us:>10.1f} | {new_us:>10.1f} | {legacy_us / new_us:>5.1f}x")
+
+    # 片段边界落在跨行 <img> 标签中间的各种位置
+    for pad in range(0, 200, 3):
+        result = make_multiline_images(pad)
+        actual = format_tool_result(result)
+        assert "<img" not in actual and same_content(actual, legacy_format_tool_result(result)), \
+            f"跨行图片标签 (pad={pad}) 输出不一致"
+
+    re.purge()
+    print("\n✅ 输出一致性校验通过（含跨行图片标签）")
+
+
+if __name__ == "__main__":
+    main()
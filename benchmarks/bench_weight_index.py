@@ -0,0 +1,122 @@
+"""
+体重记录索引基准测试
+
+比较旧版"列表 + 线性查找 + 整体排序"与 WeightSeries 有序索引在
+10 ~ 100k 条记录下，当天更新 / 修改 / 删除 / 新增的单次耗时。
+"编码/解码"一行是每条命令读写存储桶时整体编码、解码列数据的耗时（随记录数线性增长，不含在索引操作中）。
+
+运行：python3 benchmarks/bench_weight_index.py
+"""
+
+import random
+
+from _harness import install_middleware, load_plugin, timeit
+
+install_middleware()
+weight = load_plugin("weight_tracker/体重记录.py", "weight_plugin")
+WeightSeries = weight.WeightSeries
+
+SIZES = [10, 100, 1000, 10000, 100000]
+BASE_DAY = 100
+
+
+def make_records(n):
+    return [
+        {"date": WeightSeries.day_to_date(BASE_DAY + i), "weight": 60 + (i % 200) / 10, "timestamp": i}
+        for i in range(n)
+    ]
+
+
+# ---- 旧版实现（摘自 v2.1.1） ----
+
+def legacy_record_today(records, date, value):
+    for i, record in enumerate(records):
+        if record['date'] == date:
+            records[i]['weight'] = value
+            return
+    records.append({'date': date, 'weight': value, 'timestamp': 0})
+    records.sort(key=lambda x: x['date'])
+
+
+def legacy_modify(records, index, value):
+    sorted_records = sorted(records, key=lambda x: x['date'], reverse=True)
+    target = sorted_records[index - 1]
+    for i, r in enumerate(records):
+        if r['date'] == target['date']:
+            records[i]['weight'] = value
+            break
+
+
+def legacy_delete_and_restore(records, index):
+    sorted_records = sorted(records, key=lambda x: x['date'], reverse=True)
+    target = sorted_records[index - 1]
+    for i, r in enumerate(records):
+        if r['date'] == target['date']:
+            del records[i]
+            break
+    records.append(target)
+    records.sort(key=lambda x: x['date'])
+
+
+# ---- WeightSeries ----
+
+def series_record_today(series, day, value):
+    series.upsert(day, value, 0)
+
+
+def series_modify(series, index, value):
+    series.update(len(series) - index, value, 0)
+
+
+def series_delete_and_restore(series, index):
+    i = len(series) - index
+    day, value = series.days[i], series.weight(i)
+    series.remove(i)
+    series.add(day, value, 0)
+
+
+def main():
+    print(f"{'记录数':>8} | {'操作':<10} | {'旧版(µs)':>12} | {'索引(µs)':>10}")
+    print("-" * 52)
+    for n in SIZES:
+        records = make_records(n)
+        series = WeightSeries.from_records(records)
+        last_date = records[-1]['date']
+        last_day = series.days[-1]
+        middle = n // 2 + 1
+        repeat = 3 if n >= 10000 else 7
+
+        rows = [
+            ("当天更新",
+             timeit(lambda: legacy_record_today(records, last_date, 66.6), repeat),
+             timeit(lambda: series_record_today(series, last_day, 66.6), repeat)),
+            ("修改记录",
+             timeit(lambda: legacy_modify(records, middle, 65.5), repeat),
+             timeit(lambda: series_modify(series, middle, 65.5), repeat)),
+            ("删除+恢复",
+             timeit(lambda: legacy_delete_and_restore(records, middle), repeat),
+             timeit(lambda: series_delete_and_restore(series, middle), repeat)),
+        ]
+        for name, legacy_us, series_us in rows:
+            print(f"{n:>8} | {name:<10} | {legacy_us:>12.1f} | {series_us:>10.1f}")
+
+        encoded = series.encode()
+        decode_us = timeit(lambda: WeightSeries.decode(encoded), repeat)
+        encode_us = timeit(lambda: series.encode(), repeat)
+        print(f"{n:>8} | {'编码/解码':<10} | {'-':>12} | {encode_us:>4.0f}/{decode_us:<5.0f}")
+
+    # 正确性抽查
+    series = WeightSeries.from_records(make_records(1000))
+    days = list(series.days)
+    random.seed(1)
+    for _ in range(200):
+        day = random.randint(0, 2000)
+        series.upsert(day, 70.0, 0)
+        if day not in days:
+            days.append(day)
+    assert list(series.days) == sorted(days)
+    print("\n✅ 有序性校验通过")
+
+
+if __name__ == "__main__":
+    main()
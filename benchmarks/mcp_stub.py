@@ -0,0 +1,259 @@
+"""
+本地 MCP 替身服务
+
+实现麦当劳 MCP 服务用到的 Streamable HTTP JSON-RPC 子集，用于离线压测 MCPClient：
+- initialize：分配 Mcp-Session-Id，返回协商的协议版本
+- notifications/*：返回 202
+- tools/call：campaign-calender / available-coupons / auto-bind-coupons / my-coupons
+- 未知或已删除的会话返回 404（客户端应重新初始化）
+- DELETE：清除所有会话（模拟服务端重启）
+- JSON-RPC 批量数组：batch=True 时逐个处理并按 id 返回（SSE 下每个响应一个事件，顺序打乱）；
+  batch=False 时按 MCP 2025-06-18 的行为返回 400 和 Invalid Request 错误
+
+响应格式可选 SSE（text/event-stream，响应前先推送一条服务端通知）或 JSON，
+每个请求可设置固定延迟和随机抖动；gzip=True 时响应体以 Content-Encoding: gzip 压缩发送
+（带 Content-Length，检查客户端逐块读取时是否解压）。
+
+使用说明：
+    from mcp_stub import MCPStubServer
+
+    with MCPStubServer(latency=0.05, mode="sse") as stub:
+        plugin_module.MCP_URL = stub.url
+        ...
+        stub.stats()   # {"requests": HTTP 请求数, "initialize": n, "tools/call": n, "batch": n, ...}
+
+也可以单独运行，供手动调试插件：
+    python3 benchmarks/mcp_stub.py --port 18765 --latency 0.05 --mode json
+"""
+
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PROTOCOL_VERSION = "2025-06-18"
+
+TOOL_RESULTS = {
+    "campaign-calender": "### 活动日历\n\n" + "".join(
+        f"### 1月{day}日\n<img src=\"https://img.mcd.cn/calendar/{day}.jpg\" alt=\"第{day}天\">\n今日特惠：第二份半价\\\n\n"
+        for day in range(1, 15)
+    ),
+    "available-coupons": "### 可领优惠券\n\n" + "".join(
+        f"### {i}. 优惠券 {i}\n![优惠券 {i}](https://img.mcd.cn/coupon/{i}.png)\\\n- 价格：{9 + i}.9元\n\n"
+        for i in range(1, 11)
+    ),
+    "auto-bind-coupons": "### 领券结果\n\n成功领取 10 张优惠券\\\n失败 0 张\n",
+    "my-coupons": "### 我的优惠券\n\n" + "".join(
+        f"### {i}. 优惠券 {i}\n- 有效期至 2026-02-{i:02d}\n\n" for i in range(1, 21)
+    ),
+}
+
+
+class MCPStubServer:
+    """本地 MCP 替身服务（后台线程运行）"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, mode="sse", batch=True, gzip=False):
+        """
+        :param port: 监听端口，0 表示自动分配
+        :param latency: 每个请求的固定延迟（秒）
+        :param jitter: 在固定延迟上增加 0 ~ jitter 秒的随机延迟
+        :param mode: 响应格式，"sse" 或 "json"
+        :param batch: 是否接受 JSON-RPC 批量请求
+        :param gzip: 是否压缩响应体
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.mode = mode
+        self.batch = batch
+        self.gzip = gzip
+        self.sessions = set()
+        self.counts = {}
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/mcp"
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                stub.handle_post(self, body)
+
+            def do_DELETE(self):
+                stub.reset_sessions()
+                self._send(200, b"")
+
+            def _send(self, status, data, content_type="application/json", headers=None):
+                headers = dict(headers or {})
+                if stub.gzip and data:
+                    data = gzip.compress(data)
+                    headers["Content-Encoding"] = "gzip"
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def _count(self, name, request=True):
+        """计数：name 为方法名，request 表示是否同时计为一次 HTTP 请求"""
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+            if request:
+                self.counts["requests"] = self.counts.get("requests", 0) + 1
+
+    def handle_post(self, handler, body):
+        """处理一个 HTTP 请求（单个 JSON-RPC 消息或批量数组）"""
+        self._count("batch" if isinstance(body, list) else body.get("method", ""))
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        session_id = handler.headers.get("Mcp-Session-Id")
+        if isinstance(body, list):
+            self._handle_batch(handler, body, session_id)
+            return
+
+        headers = {}
+        if body.get("method") == "initialize":
+            session_id = uuid.uuid4().hex
+            with self.lock:
+                self.sessions.add(session_id)
+            headers["Mcp-Session-Id"] = session_id
+        elif session_id not in self.sessions:
+            handler._send(404, b"")
+            return
+
+        message = self._dispatch(body)
+        if message is None:
+            # 通知没有响应
+            handler._send(202, b"")
+            return
+        self._reply(handler, [message], headers)
+
+    def _handle_batch(self, handler, body, session_id):
+        if not self.batch:
+            error = {"jsonrpc": "2.0", "id": None,
+                     "error": {"code": -32600, "message": "Invalid Request: batching is not supported"}}
+            handler._send(400, json.dumps(error).encode("utf-8"))
+            return
+        if session_id not in self.sessions:
+            handler._send(404, b"")
+            return
+
+        for item in body:
+            self._count(item.get("method", ""), request=False)
+        messages = [message for message in map(self._dispatch, body) if message is not None]
+        if not messages:
+            handler._send(202, b"")
+            return
+        if self.mode == "sse":
+            # 响应顺序与请求无关，客户端需要按 id 匹配
+            random.shuffle(messages)
+            self._reply(handler, messages, {})
+        else:
+            data = json.dumps(messages, ensure_ascii=False).encode("utf-8")
+            handler._send(200, data, "application/json")
+
+    def _dispatch(self, body):
+        """
+        处理一个 JSON-RPC 消息
+        :return: 响应消息；通知返回 None
+        """
+        method = body.get("method", "")
+        if "id" not in body:
+            return None
+
+        if method == "initialize":
+            result = {
+                "protocolVersion": PROTOCOL_VERSION,
+                "capabilities": {"tools": {}},
+                "serverInfo": {"name": "mcp-stub", "version": "1.0"},
+            }
+        elif method == "tools/call":
+            name = body.get("params", {}).get("name")
+            if name not in TOOL_RESULTS:
+                return {"jsonrpc": "2.0", "id": body["id"],
+                        "error": {"code": -32602, "message": f"Unknown tool: {name}"}}
+            result = {"content": [{"type": "text", "text": TOOL_RESULTS[name]}]}
+        else:
+            return {"jsonrpc": "2.0", "id": body["id"],
+                    "error": {"code": -32601, "message": f"Method not found: {method}"}}
+        return {"jsonrpc": "2.0", "id": body["id"], "result": result}
+
+    def _reply(self, handler, messages, headers):
+        if self.mode == "sse":
+            # 真实服务会在响应前推送进度等通知，客户端需要按 id 找到响应
+            notice = {"jsonrpc": "2.0", "method": "notifications/message", "params": {"level": "info"}}
+            events = [notice] + messages
+            data = "".join(f"event: message\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                           for event in events).encode("utf-8")
+            handler._send(200, data, "text/event-stream", headers)
+        else:
+            handler._send(200, json.dumps(messages[0], ensure_ascii=False).encode("utf-8"), "application/json", headers)
+
+    def reset_sessions(self):
+        """清除所有会话（模拟服务端重启）"""
+        with self.lock:
+            self.sessions.clear()
+
+    def stats(self):
+        """请求计数的副本"""
+        with self.lock:
+            return dict(self.counts)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 MCP 替身服务")
+    parser.add_argument("--port", type=int, default=18765)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="随机延迟上限（秒）")
+    parser.add_argument("--mode", choices=["sse", "json"], default="sse")
+    parser.add_argument("--no-batch", action="store_true", help="拒绝 JSON-RPC 批量请求")
+    parser.add_argument("--gzip", action="store_true", help="以 gzip 压缩响应体")
+    args = parser.parse_args()
+
+    stub = MCPStubServer(port=args.port, latency=args.latency, jitter=args.jitter, mode=args.mode,
+                         batch=not args.no_batch, gzip=args.gzip)
+    print(f"MCP 替身服务: {stub.url} ({args.mode}, 延迟 {args.latency}s)")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+autMan 插件共享对话状态
+
+功能：把多步对话的当前步骤保存到存储桶，插件发出提示后立即退出，
+用户的下一条回复触发新的进程并从保存的步骤继续，不再用 sender.listen() 占着进程等待。
+
+使用说明：
+    from autman_dialog import Dialog
+
+    dialog = Dialog(store, "poop", user_id, chat_of(sender))
+
+    # 发出提示后保存步骤
+    sender.reply("确认吗？(y/n)")
+    dialog.save("confirm", {"foo": 1})
+
+    # 下一条消息到达时
+    state = dialog.load()
+    if state:
+        ...  # 按 state["step"] 和 state["data"] 继续
+    elif dialog.expired:
+        sender.reply("⏱️ 操作超时，已自动取消")
+
+注意：回复消息（y/n/q、A-E、数字等）需要在插件头部额外添加 rule 才能触发插件；
+没有进行中的对话时插件应静默退出。同一条单字符消息会同时触发多个插件，
+所以超时提示只发给确实在回复这个对话的消息（见 Dialog.load），其余情况静默清除。
+"""
+
+import time
+
+DIALOG_BUCKET = "autman_dialog"
+DIALOG_TTL = 60  # 每一步等待回复的时间（秒）
+DIALOG_EXPIRED_GRACE = 300  # 超时后多久内的回复还会收到超时提示（秒），更晚的回复静默清除
+
+
+def chat_of(sender):
+    """消息所在的会话（平台 + 群号，私聊群号为空）"""
+    return f"{sender.getImtype()}:{sender.getGroupID() or ''}"
+
+
+class Dialog:
+    """某个用户在某个插件中的多步对话状态"""
+
+    def __init__(self, store, plugin, user_id, chat="", ttl=DIALOG_TTL):
+        """
+        :param store: autman_storage 的存储实例
+        :param plugin: 插件标识，用于区分不同插件的对话
+        :param user_id: 用户ID
+        :param chat: 当前消息所在的会话（见 chat_of），对话只接受同一会话中的回复
+        :param ttl: 每一步的超时时间（秒）
+        """
+        self.store = store
+        self.plugin = plugin
+        self.key = f"{plugin}/{user_id}"
+        self.latest_key = f"_latest/{user_id}"  # 用户最近一次收到的对话提示来自哪个插件
+        self.chat = chat
+        self.ttl = ttl
+        self.expired = False
+
+    def load(self):
+        """
+        读取进行中的对话
+        :return: {"step": 步骤, "data": 数据} 或 None
+            已超时时状态会被清除；只有这条消息确实是在回复这个对话时 expired 才为 True（需要提示超时）
+        """
+        state = self.store.get(DIALOG_BUCKET, self.key)
+        if state is None:
+            return None
+
+        if not isinstance(state, dict) or "step" not in state:
+            self.clear()
+            return None
+
+        # 其他会话（如另一个群）中的回复不属于这个对话
+        if state.get("chat") != self.chat:
+            if time.time() > state.get("expires_at", 0):
+                self.clear()
+            return None
+
+        if time.time() > state.get("expires_at", 0):
+            self.expired = self._is_reply_to_expired(state)
+            self.clear()
+            return None
+
+        state.setdefault("data", {})
+        return state
+
+    def _is_reply_to_expired(self, state):
+        """
+        超时的对话是否应该提示：超时不久，且用户最近收到的对话提示来自本插件
+        （否则这条消息多半是在回复其他插件，如 A 插件超时后用户回答 B 插件的 y/n）
+        """
+        if time.time() > state.get("expires_at", 0) + DIALOG_EXPIRED_GRACE:
+            return False
+        return self.store.get(DIALOG_BUCKET, self.latest_key) == self.plugin
+
+    def save(self, step, data=None):
+        """保存当前步骤，超时时间从现在重新计算"""
+        self.store.set(DIALOG_BUCKET, self.key, {
+            "step": step,
+            "data": data or {},
+            "chat": self.chat,
+            "expires_at": int(time.time()) + self.ttl,
+        })
+        self.store.set(DIALOG_BUCKET, self.latest_key, self.plugin)
+
+    def clear(self):
+        """结束对话"""
+        self.store.delete(DIALOG_BUCKET, self.key)
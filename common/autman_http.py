@@ -0,0 +1,173 @@
+"""
+autMan 插件共享 HTTP 传输层
+
+功能：为插件提供带连接池的 HTTP 请求
+- 同一进程内复用 requests.Session，按主机保持 keep-alive 连接池
+- 连接池大小有上限，避免并发请求时无限制地建立连接
+- 每个请求都带 (连接超时, 读取超时)
+- 统计：请求次数、新建连接次数、复用连接次数（确认握手次数是否减少）
+- SSE：iter_sse_events() 边接收边解析事件流，调用方拿到需要的事件即可关闭连接
+
+使用说明：
+    from autman_http import get_transport
+
+    http = get_transport()
+    response = http.post(url, headers=headers, json=payload)
+    ...
+    print(http.summary())
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CONNECT_TIMEOUT = 5   # 建立连接超时（秒）
+READ_TIMEOUT = 30     # 读取响应超时（秒）
+POOL_CONNECTIONS = 4  # 缓存连接池的主机数
+POOL_MAXSIZE = 8      # 每个主机最多保持的连接数
+SSE_CHUNK_SIZE = 4096             # SSE 每次读取的字节数
+SSE_MAX_EVENT_BYTES = 4 * 1024 * 1024  # 单个 SSE 事件的最大字节数
+
+
+class HttpTransport:
+    """带连接池的 HTTP 客户端"""
+
+    def __init__(self, pool_maxsize=POOL_MAXSIZE, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT)):
+        """
+        :param pool_maxsize: 每个主机最多保持的连接数
+        :param timeout: 默认超时 (连接超时, 读取超时)
+        """
+        self.timeout = timeout
+        self.adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=pool_maxsize)
+        self.session = requests.Session()
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+        self.requests = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        """
+        发送请求
+        :param timeout: (连接超时, 读取超时)，不传时使用默认值
+        :return: requests.Response（stream=True 时使用完需要 close()）
+        """
+        self.requests += 1
+        return self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def connection_stats(self):
+        """
+        连接统计（来自 urllib3 连接池）
+        :return: {"requests": 请求数, "connections": 新建连接数, "reused": 复用连接的请求数}
+        """
+        pools = self.adapter.poolmanager.pools
+        sent = 0
+        connections = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            sent += pool.num_requests
+            connections += pool.num_connections
+        return {
+            "requests": self.requests,
+            "connections": connections,
+            "reused": max(0, sent - connections),
+        }
+
+    def summary(self):
+        """连接统计摘要"""
+        s = self.connection_stats()
+        return f"请求 {s['requests']} 次, 新建连接 {s['connections']} 次, 复用连接 {s['reused']} 次"
+
+    def close(self):
+        self.session.close()
+
+
+def _iter_arrived_chunks(response):
+    """
+    按到达顺序产出响应数据，不等待凑满固定大小
+    - chunked 编码：每个 HTTP chunk 到达即产出
+    - 其他：urllib3 2.x 的 read1() 返回已到达的数据；旧版本退回固定大小读取
+    都按 Content-Encoding 解压（requests 打开原始响应时 decode_content=False，直接读取需要显式指定）
+    """
+    raw = response.raw
+    if getattr(raw, "chunked", False):
+        yield from response.iter_content(chunk_size=None)
+    elif hasattr(raw, "read1"):
+        while True:
+            chunk = raw.read1(SSE_CHUNK_SIZE, decode_content=True)
+            if not chunk:
+                break
+            yield chunk
+    else:
+        yield from response.iter_content(chunk_size=SSE_CHUNK_SIZE)
+
+
+def iter_sse_events(response, max_event_bytes=SSE_MAX_EVENT_BYTES):
+    """
+    逐块读取 SSE 响应，每收到一个完整事件就产出其 data 内容
+    :param response: stream=True 的 requests.Response
+    :param max_event_bytes: 单个事件的最大字节数，超过时抛出异常，避免超大输出占满内存
+    :return: 生成器，产出每个事件的 data 字符串（多行 data 以换行连接）
+    """
+    buffer = bytearray()
+    scanned = 0  # buffer 中已确认没有换行符的长度，避免长行被反复扫描
+    data_lines = []
+    event_bytes = 0
+
+    for chunk in _iter_arrived_chunks(response):
+        if not chunk:
+            continue
+        buffer.extend(chunk)
+        while True:
+            end = buffer.find(b"\n", scanned)
+            if end < 0:
+                scanned = len(buffer)
+                break
+            line = bytes(buffer[:end]).rstrip(b"\r")
+            del buffer[:end + 1]
+            scanned = 0
+
+            if not line:
+                # 空行：事件结束
+                if data_lines:
+                    yield "\n".join(data_lines)
+                    data_lines = []
+                    event_bytes = 0
+                continue
+
+            if line.startswith(b"data:"):
+                value = line[5:]
+                if value.startswith(b" "):
+                    value = value[1:]
+                event_bytes += len(value)
+                if event_bytes > max_event_bytes:
+                    raise Exception(f"SSE 事件超过 {max_event_bytes} 字节")
+                data_lines.append(value.decode("utf-8"))
+            # event:/id:/retry: 以及注释行不需要处理
+
+        if event_bytes + len(buffer) > max_event_bytes:
+            raise Exception(f"SSE 事件超过 {max_event_bytes} 字节")
+
+    # 连接关闭时最后一个事件可能没有空行结尾
+    line = bytes(buffer).rstrip(b"\r")
+    if line.startswith(b"data:"):
+        value = line[5:]
+        data_lines.append((value[1:] if value.startswith(b" ") else value).decode("utf-8"))
+    if data_lines:
+        yield "\n".join(data_lines)
+
+
+_transport = None
+
+
+def get_transport():
+    """获取当前进程共享的 HTTP 传输实例"""
+    global _transport
+    if _transport is None:
+        _transport = HttpTransport()
+    return _transport
@@ -0,0 +1,146 @@
+"""
+autMan 插件共享日志
+
+功能：分级日志，替代热路径上的 print 调试输出
+- 级别 DEBUG < INFO < WARNING < ERROR，默认 WARNING；低于当前级别的调用只做一次整数比较就返回，
+  消息和字段都不会格式化
+- 级别由环境变量 AUTMAN_LOG_LEVEL 设置（debug / info / warning / error），也可以调用 set_level()
+- 结构化字段：log.info("AI 分析完成", length=123) 输出 "[便便插件] INFO AI 分析完成 length=123"；
+  字段值可以是无参函数（如 store.summary），只在真正输出时才调用
+- 采样：sample=0.1 时只输出约 10% 的调用，用于高频路径
+- 脱敏：Secret(密钥) 只输出前 4 位和长度，Excerpt(长文本) 只输出开头和总长度，都在输出时才计算
+
+使用说明：
+    from autman_log import get_logger, Excerpt, Secret
+
+    log = get_logger("便便插件")
+    log.debug("完整提示词", prompt=Excerpt(prompt))
+    log.info("读取配置", api_key=Secret(api_key))
+    log.debug("存储统计", summary=store.summary, sample=0.1)
+    log.warning("保存失败", error=e)
+"""
+
+import json
+import os
+import random
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+DEFAULT_LEVEL = WARNING
+EXCERPT_LENGTH = 60  # Excerpt 默认保留的字符数
+
+
+def parse_level(value, default=DEFAULT_LEVEL):
+    """把级别名称（不区分大小写）或数字转换为级别，无法识别时返回 default"""
+    if isinstance(value, int):
+        return value
+    value = str(value or "").strip()
+    if value.isdigit():
+        return int(value)
+    for level, name in LEVEL_NAMES.items():
+        if value.upper() == name:
+            return level
+    return default
+
+
+_level = parse_level(os.environ.get("AUTMAN_LOG_LEVEL"))
+
+
+def set_level(level):
+    """设置当前进程的日志级别（级别名称或数字）"""
+    global _level
+    _level = parse_level(level)
+
+
+def get_level():
+    return _level
+
+
+class Secret:
+    """密钥等敏感值：只输出前 4 位和长度"""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        value = str(self.value or "")
+        if not value:
+            return "<空>"
+        return f"{value[:4]}***({len(value)}位)"
+
+
+class Excerpt:
+    """提示词、响应等长文本：只输出开头和总长度"""
+
+    __slots__ = ("text", "limit")
+
+    def __init__(self, text, limit=EXCERPT_LENGTH):
+        self.text = text
+        self.limit = limit
+
+    def __str__(self):
+        text = str(self.text or "")
+        head = text[:self.limit]
+        if len(text) <= self.limit:
+            return head
+        return f"{head}…(共{len(text)}字)"
+
+
+def _format_value(value):
+    if callable(value):
+        value = value()
+    text = str(value)
+    # 含空白的值加引号（换行转义为 \n），保持一行一条、key=value 可以按空格切分
+    if not text or any(ch.isspace() for ch in text):
+        return json.dumps(text, ensure_ascii=False)
+    return text
+
+
+class Logger:
+    """带名称的日志记录器，输出 "[名称] 级别 消息 key=value ..." 到标准输出（autMan 会采集）"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def enabled(self, level):
+        """某个级别是否会输出，用于跳过只为日志准备数据的代码"""
+        return level >= _level
+
+    def _log(self, level, message, sample, fields):
+        if sample is not None and random.random() >= sample:
+            return
+        line = f"[{self.name}] {LEVEL_NAMES.get(level, level)} {message}"
+        if fields:
+            line += " " + " ".join(f"{key}={_format_value(value)}" for key, value in fields.items())
+        print(line)
+
+    def debug(self, message, sample=None, **fields):
+        if DEBUG >= _level:
+            self._log(DEBUG, message, sample, fields)
+
+    def info(self, message, sample=None, **fields):
+        if INFO >= _level:
+            self._log(INFO, message, sample, fields)
+
+    def warning(self, message, sample=None, **fields):
+        if WARNING >= _level:
+            self._log(WARNING, message, sample, fields)
+
+    def error(self, message, sample=None, **fields):
+        if ERROR >= _level:
+            self._log(ERROR, message, sample, fields)
+
+
+_loggers = {}
+
+
+def get_logger(name):
+    """获取指定名称的日志记录器（同一进程内共享）"""
+    if name not in _loggers:
+        _loggers[name] = Logger(name)
+    return _loggers[name]
@@ -0,0 +1,116 @@
+"""
+autMan 插件共享限流器
+
+功能：用令牌桶限制调用外部服务（智谱AI、aiReplyStream、MCP 等）的频率
+- 每个用户一个令牌桶，整个插件共用一个全局令牌桶，两者都有令牌时才放行
+- 令牌按速率（每分钟）持续补充，最多积累 burst 个，允许短时间的连续调用
+- 状态保存在存储桶中，跨调用（跨进程）生效
+- 两种处理方式：拒绝（max_wait=0，立即抛出 RateLimited）或排队
+  （预留令牌后等待，等待时间超过 max_wait 时拒绝）
+
+使用说明：
+    from autman_ratelimit import RateLimiter, RateLimited
+
+    limiter = RateLimiter("zhipuai", user_per_minute=0.2, user_burst=2, global_per_minute=10, global_burst=5)
+    try:
+        limiter.acquire(user_id)               # 拒绝模式
+        limiter.acquire(user_id, max_wait=10)  # 排队模式
+    except RateLimited as e:
+        sender.reply(f"⏳ {e}")
+"""
+
+import threading
+import time
+
+from autman_log import get_logger
+from autman_storage import get_store
+
+RATE_BUCKET = "autman_ratelimit"  # 令牌桶状态，key 为 名称/user/用户ID 或 名称/global
+
+log = get_logger("限流")
+
+
+class RateLimited(Exception):
+    """超过频率限制"""
+
+    def __init__(self, scope, retry_after):
+        """
+        :param scope: "user" 或 "global"
+        :param retry_after: 建议的等待时间（秒）
+        """
+        if scope == "user":
+            message = f"请求太频繁，请 {retry_after} 秒后再试"
+        else:
+            message = f"当前使用人数较多，请 {retry_after} 秒后再试"
+        super().__init__(message)
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """每用户 + 全局的令牌桶限流器"""
+
+    def __init__(self, name, user_per_minute, user_burst, global_per_minute, global_burst, store=None):
+        """
+        :param name: 限流器名称（区分不同插件或服务）
+        :param user_per_minute: 每个用户每分钟补充的令牌数，0 表示不限制单个用户
+        :param user_burst: 每个用户最多积累的令牌数
+        :param global_per_minute: 全局每分钟补充的令牌数，0 表示不限制全局
+        :param global_burst: 全局最多积累的令牌数
+        :param store: 存储实例，默认使用进程共享实例
+        """
+        self.name = name
+        self.user_rate = user_per_minute / 60
+        self.user_burst = user_burst
+        self.global_rate = global_per_minute / 60
+        self.global_burst = global_burst
+        self.store = store or get_store()
+        self._lock = threading.Lock()
+
+    def _read(self, key, rate, burst, now):
+        """读取令牌桶并按经过的时间补充，返回当前令牌数"""
+        # 其他进程可能刚消耗过令牌，丢弃缓存重新读取
+        self.store.invalidate(RATE_BUCKET, key)
+        state = self.store.get(RATE_BUCKET, key)
+        if not isinstance(state, dict):
+            return float(burst)
+        elapsed = max(0, now - state.get("updated", now))
+        return min(float(burst), state.get("tokens", burst) + elapsed * rate)
+
+    def acquire(self, user_id=None, max_wait=0):
+        """
+        取得一次调用的许可
+        :param user_id: 用户ID，为空时只检查全局令牌桶（如定时任务）
+        :param max_wait: 最多排队等待的秒数，0 表示没有令牌时立即拒绝
+        :raises RateLimited: 没有令牌且等待时间超过 max_wait
+        """
+        with self._lock:
+            now = time.time()
+            buckets = [("global", f"{self.name}/global", self.global_rate, self.global_burst)]
+            if user_id:
+                buckets.insert(0, ("user", f"{self.name}/user/{user_id}", self.user_rate, self.user_burst))
+            # 补充速率为 0 的令牌桶不限制（否则令牌耗尽后永远无法补充）
+            buckets = [bucket for bucket in buckets if bucket[2] > 0]
+
+            wait = 0
+            states = []
+            for scope, key, rate, burst in buckets:
+                tokens = self._read(key, rate, burst, now)
+                needed = 0 if tokens >= 1 else (1 - tokens) / rate
+                if needed > max_wait:
+                    raise RateLimited(scope, int(needed) + 1)
+                wait = max(wait, needed)
+                states.append((key, tokens))
+
+            # 预留令牌（排队时令牌数可以为负，后来者需要等待更久）
+            for key, tokens in states:
+                self.store.set(RATE_BUCKET, key, {"tokens": round(tokens - 1, 3), "updated": now})
+            try:
+                # 只立即保存令牌桶，插件的其他待写入数据仍在调用结束时合并写入
+                self.store.flush([(RATE_BUCKET, key) for key, _ in states])
+            except Exception as e:
+                log.warning("保存令牌桶失败", error=e)
+
+        if wait > 0:
+            log.info("排队等待", name=self.name, wait=f"{wait:.1f}s")
+            time.sleep(wait)
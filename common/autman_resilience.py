@@ -0,0 +1,184 @@
+"""
+autMan 插件共享容错层
+
+功能：为外部服务调用（MCP、智谱AI 等）提供重试和熔断
+- 可重试的错误（连接失败、连接超时、HTTP 429/502/503/504）按指数退避 + 随机抖动重试
+- 读取超时不重试（请求可能已被服务端处理，如领券），但计入熔断
+- 总耗时上限：重试不会让一次调用的总耗时超过 max_elapsed
+- 每个服务端点一个熔断器，状态保存在存储桶中，跨调用生效：
+  连续失败达到阈值后熔断，冷却期内直接失败，不再等待超时；
+  冷却结束后放行请求，成功则恢复，失败则立即再次熔断
+
+使用说明：
+    from autman_resilience import RETRYABLE_STATUS, RetryableHTTPError, call_with_resilience, get_breaker
+
+    def send():
+        response = http.post(url, ...)
+        if response.status_code in RETRYABLE_STATUS:
+            raise RetryableHTTPError(response.status_code)
+        return response
+
+    response = call_with_resilience(get_breaker("open.bigmodel.cn"), send)
+"""
+
+import random
+import threading
+import time
+
+import requests
+
+from autman_log import get_logger
+from autman_storage import get_store
+
+CIRCUIT_BUCKET = "autman_circuit"  # 熔断器状态，key 为端点
+FAILURE_THRESHOLD = 5   # 连续失败多少次后熔断
+RESET_TIMEOUT = 60      # 熔断后的冷却时间（秒）
+MAX_RETRIES = 2         # 最多重试次数
+BASE_DELAY = 0.5        # 第一次重试的退避上限（秒），之后每次翻倍
+MAX_DELAY = 4.0         # 单次退避的上限（秒）
+MAX_ELAPSED = 20        # 包括重试在内的总耗时上限（秒）
+RETRYABLE_STATUS = {429, 502, 503, 504}
+
+log = get_logger("容错")
+
+
+class CircuitOpenError(Exception):
+    """熔断冷却期内，请求没有发出"""
+
+    def __init__(self, endpoint, retry_in):
+        super().__init__(f"{endpoint} 暂时不可用，约 {retry_in} 秒后重试")
+        self.endpoint = endpoint
+        self.retry_in = retry_in
+
+
+class RetryableHTTPError(Exception):
+    """服务端返回可重试的 HTTP 状态码"""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def is_retryable(error):
+    """是否可以安全重试（请求没有到达服务端，或服务端明确要求稍后重试）"""
+    if isinstance(error, RetryableHTTPError):
+        return True
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ReadTimeout):
+        return False
+    return isinstance(error, requests.exceptions.ConnectionError)
+
+
+def is_failure(error):
+    """是否计入熔断（服务端不可用的迹象）"""
+    return is_retryable(error) or isinstance(error, requests.exceptions.Timeout)
+
+
+def backoff_delay(attempt, base=BASE_DELAY, cap=MAX_DELAY):
+    """指数退避 + 全抖动：0 ~ min(cap, base * 2^attempt) 秒"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """某个服务端点的熔断器（状态保存在存储桶中）"""
+
+    def __init__(self, store, endpoint, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        """
+        :param store: autman_storage 的存储实例
+        :param endpoint: 端点标识（如主机名）
+        :param failure_threshold: 连续失败多少次后熔断
+        :param reset_timeout: 熔断后的冷却时间（秒）
+        """
+        self.store = store
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+
+    def _state(self):
+        state = self.store.get(CIRCUIT_BUCKET, self.endpoint)
+        return state if isinstance(state, dict) else {"failures": 0, "opened_at": 0}
+
+    def retry_in(self):
+        """距离冷却结束的秒数，未熔断时为 0"""
+        opened_at = self._state().get("opened_at", 0)
+        if not opened_at:
+            return 0
+        return max(0, int(opened_at + self.reset_timeout - time.time()) + 1)
+
+    def before_call(self):
+        """
+        发出请求前检查
+        :raises CircuitOpenError: 熔断冷却期内
+        """
+        with self._lock:
+            retry_in = self.retry_in()
+        if retry_in:
+            raise CircuitOpenError(self.endpoint, retry_in)
+
+    def record_success(self):
+        """请求成功：清除失败计数（状态没有变化时不写入）"""
+        with self._lock:
+            state = self._state()
+            if state.get("failures") or state.get("opened_at"):
+                if state.get("opened_at"):
+                    log.info("已恢复，关闭熔断", endpoint=self.endpoint)
+                self.store.delete(CIRCUIT_BUCKET, self.endpoint)
+
+    def record_failure(self):
+        """请求失败：连续失败达到阈值时熔断（冷却结束后的第一次失败立即再次熔断）"""
+        with self._lock:
+            state = dict(self._state())
+            state["failures"] = state.get("failures", 0) + 1
+            if state["failures"] >= self.failure_threshold:
+                state["opened_at"] = int(time.time())
+                log.warning("连续失败，熔断", endpoint=self.endpoint, failures=state["failures"],
+                            reset_timeout=self.reset_timeout)
+            self.store.set(CIRCUIT_BUCKET, self.endpoint, state)
+
+
+def call_with_resilience(breaker, fn, retries=MAX_RETRIES, max_elapsed=MAX_ELAPSED):
+    """
+    通过熔断器调用 fn，可重试的错误按退避重试
+    :param breaker: CircuitBreaker
+    :param fn: 发出请求的函数，失败时抛出 requests 异常或 RetryableHTTPError
+    :param retries: 最多重试次数
+    :param max_elapsed: 总耗时上限（秒），下一次重试会超过上限时不再重试
+    :return: fn 的返回值
+    :raises CircuitOpenError: 熔断冷却期内（没有发出请求）
+    """
+    breaker.before_call()
+    start = time.time()
+    attempt = 0
+    while True:
+        try:
+            result = fn()
+        except Exception as e:
+            if not is_failure(e):
+                raise
+            breaker.record_failure()
+            if not is_retryable(e) or attempt >= retries or breaker.retry_in():
+                raise
+            delay = backoff_delay(attempt)
+            if time.time() - start + delay > max_elapsed:
+                raise
+            log.info("请求失败，退避后重试", endpoint=breaker.endpoint, attempt=attempt + 1, error=e,
+                     delay=f"{delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+        breaker.record_success()
+        return result
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(endpoint, store=None):
+    """获取端点的熔断器（同一进程内共享，线程池中的调用共用一个实例）"""
+    with _breakers_lock:
+        if endpoint not in _breakers:
+            _breakers[endpoint] = CircuitBreaker(store or get_store(), endpoint)
+        return _breakers[endpoint]
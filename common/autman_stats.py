@@ -0,0 +1,206 @@
+"""
+autMan 插件共享统计引擎
+
+功能：单遍扫描记录，同时得到报表需要的全部统计
+- 分类分布（便便状态、肚子疼地点等）
+- 每天各分类次数、每天次数分布（频率直方图）
+- 首末日期、跨度、覆盖率、平均频率
+- 最近时段（如近7天）的分类次数
+
+统计结果可序列化后存入存储桶，随记录增删调用 add()/remove() 增量维护。
+
+使用说明：
+    from autman_stats import RecordAggregator
+
+    stats = RecordAggregator(category_of, recent_since=now - 7 * 86400, category_field="process_desc")
+    stats.feed(records)
+    stats.total, stats.categories, stats.freq_hist, stats.recent
+"""
+
+from collections import Counter
+from datetime import datetime
+
+SNAPSHOT_VERSION = 2
+
+
+class RecordAggregator:
+    """
+    单遍记录统计器
+
+    记录需要包含 'datetime'（YYYY-MM-DD HH:MM:SS）和 'timestamp'（秒）字段。
+    """
+
+    def __init__(self, category_of, recent_since=None, data=None, category_field=None):
+        """
+        :param category_of: 从记录中提取分类的函数
+        :param recent_since: 最近时段的起始时间戳，None 表示不统计
+        :param data: to_dict() 生成的快照，用于恢复已有统计
+        :param category_field: 分类只取决于记录的这个字段时传入（category_of 只读取该字段），
+            feed() 按字段值计数，每个不同的值只调用一次 category_of
+        """
+        data = data or {}
+        self.category_of = category_of
+        self.category_field = category_field
+        self.recent_since = recent_since
+        self.total = data.get("total", 0)
+        self.days = data.get("days", {})
+        self.categories = data.get("categories", {})
+        self.first_date = data.get("first_date")
+        self.last_date = data.get("last_date")
+        self.freq_hist = {int(k): v for k, v in data.get("freq_hist", {}).items()}
+        self.recent = {}
+        self.recent_total = 0
+
+    @classmethod
+    def from_records(cls, records, category_of, recent_since=None, category_field=None):
+        """扫描一遍记录得到统计"""
+        return cls(category_of, recent_since, category_field=category_field).feed(records)
+
+    def feed(self, records):
+        """
+        批量计入记录（单遍）
+        空统计器先取出日期和分类两列（设置了 category_field 时每个不同的字段值只调用一次 category_of），
+        再用一个紧凑循环累加每天各分类次数：同一天的连续记录（记录通常按时间排序）只查找一次当天的字典；
+        每天次数、分类分布、频率分布和最近时段都由 Counter 直接统计。已有数据时逐条 add()
+        """
+        if self.total:
+            for record in records:
+                self.add(record)
+            return self
+
+        category_of = self.category_of
+        field = self.category_field
+        if not isinstance(records, list):
+            records = list(records)
+        dates = [record['datetime'][:10] for record in records]
+        if field is None:
+            labels = [category_of(record) for record in records]
+        else:
+            values = [record.get(field) for record in records]
+            resolved = {value: category_of({field: value}) for value in set(values)}
+            labels = [resolved[value] for value in values]
+
+        days = self.days
+        prev_date = None
+        day = None
+        for date_str, category in zip(dates, labels):
+            if date_str != prev_date:
+                day = days.get(date_str)
+                if day is None:
+                    day = days[date_str] = {}
+                prev_date = date_str
+            day[category] = day.get(category, 0) + 1
+
+        self.categories.update(Counter(labels))
+        day_totals = Counter(dates)
+        self.freq_hist.update(Counter(day_totals.values()))
+        self.total = len(labels)
+
+        since = self.recent_since
+        if since is not None:
+            self.recent.update(Counter([category for record, category in zip(records, labels)
+                                        if record['timestamp'] >= since]))
+            self.recent_total = sum(self.recent.values())
+        if days:
+            self.first_date = min(days)
+            self.last_date = max(days)
+        return self
+
+    def _move_hist(self, old_count, new_count):
+        if old_count > 0:
+            self.freq_hist[old_count] -= 1
+            if self.freq_hist[old_count] == 0:
+                del self.freq_hist[old_count]
+        if new_count > 0:
+            self.freq_hist[new_count] = self.freq_hist.get(new_count, 0) + 1
+
+    def add(self, record):
+        """计入一条记录"""
+        date_str = record['datetime'][:10]
+        category = self.category_of(record)
+        day = self.days.setdefault(date_str, {})
+        old_count = sum(day.values())
+        day[category] = day.get(category, 0) + 1
+        self._move_hist(old_count, old_count + 1)
+
+        self.categories[category] = self.categories.get(category, 0) + 1
+        self.total += 1
+        if self.first_date is None or date_str < self.first_date:
+            self.first_date = date_str
+        if self.last_date is None or date_str > self.last_date:
+            self.last_date = date_str
+
+        if self.recent_since is not None and record['timestamp'] >= self.recent_since:
+            self.recent[category] = self.recent.get(category, 0) + 1
+            self.recent_total += 1
+
+    def remove(self, record):
+        """移除一条记录（用于增量维护快照，不影响最近时段统计）"""
+        date_str = record['datetime'][:10]
+        category = self.category_of(record)
+        day = self.days.get(date_str)
+        if not day or category not in day:
+            return
+        old_count = sum(day.values())
+        day[category] -= 1
+        if day[category] == 0:
+            del day[category]
+        self._move_hist(old_count, old_count - 1)
+
+        self.categories[category] -= 1
+        if self.categories[category] == 0:
+            del self.categories[category]
+        self.total -= 1
+
+        if not day:
+            del self.days[date_str]
+            if date_str in (self.first_date, self.last_date):
+                self.first_date = min(self.days) if self.days else None
+                self.last_date = max(self.days) if self.days else None
+
+    def day_count(self, date_str):
+        """某天的次数"""
+        return sum(self.days.get(date_str, {}).values())
+
+    @property
+    def total_days(self):
+        """有记录的天数"""
+        return len(self.days)
+
+    @property
+    def date_span(self):
+        """首末日期之间的跨度天数（含首尾）"""
+        if not self.first_date:
+            return 0
+        first = datetime.strptime(self.first_date, '%Y-%m-%d')
+        last = datetime.strptime(self.last_date, '%Y-%m-%d')
+        return (last - first).days + 1
+
+    @property
+    def avg_per_day(self):
+        """按有记录天数计算的平均频率"""
+        return self.total / self.total_days if self.total_days > 0 else 0
+
+    @property
+    def coverage(self):
+        """有记录天数占跨度的百分比"""
+        span = self.date_span
+        return self.total_days / span * 100 if span > 0 else 0
+
+    def category_percent(self, counts=None):
+        """分类占比（百分比）"""
+        counts = self.categories if counts is None else counts
+        total = sum(counts.values())
+        return {category: count / total * 100 for category, count in counts.items()} if total else {}
+
+    def to_dict(self):
+        """序列化为快照（不含最近时段统计）"""
+        return {
+            "version": SNAPSHOT_VERSION,
+            "total": self.total,
+            "days": self.days,
+            "categories": self.categories,
+            "first_date": self.first_date,
+            "last_date": self.last_date,
+            "freq_hist": {str(k): v for k, v in self.freq_hist.items()},
+        }
@@ -0,0 +1,216 @@
+"""
+autMan 插件共享存储层
+
+功能：为所有插件提供统一的存储桶读写
+- 读穿透缓存：同一次调用内，每个 (桶, key) 只执行一次 bucketGet + json.loads
+- 写合并：同一 key 的多次保存在 flush() 时合并为一次 bucketSet
+- 统计：记录实际读写次数以及缓存/合并节省的次数
+- 时间索引：按 timestamp 升序维护记录列表，用二分查找回答"最近N天"
+- 线程安全：读写都在锁内进行，可在线程池中共享同一个实例
+
+使用说明：
+    from autman_storage import get_store
+
+    store = get_store()
+    data = store.get(BUCKET_NAME, user_id, {"records": []})
+    data["records"].append(record)
+    store.set(BUCKET_NAME, user_id, data)
+    ...
+    store.flush()  # 插件 run() 结束时调用（进程退出时也会自动调用）
+
+注意：get() 返回的是缓存中的对象本身，修改后需调用 set() 才会写回存储桶。
+"""
+
+import atexit
+import json
+import threading
+
+import middleware
+
+from autman_log import get_logger
+
+# 标记已删除的 key
+_DELETED = object()
+
+log = get_logger("存储")
+
+
+class BucketStore:
+    """带读缓存和写合并的存储桶访问器"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cache = {}  # (bucket, key) -> 解析后的值，None 表示不存在
+        self._dirty = {}  # (bucket, key) -> 待写入的值或 _DELETED
+        self.stats = {
+            "reads": 0,         # 实际 bucketGet 次数
+            "reads_saved": 0,   # 命中缓存省下的 bucketGet 次数
+            "writes": 0,        # 实际 bucketSet/bucketDel 次数
+            "writes_saved": 0,  # 合并省下的 bucketSet/bucketDel 次数
+        }
+
+    def _load(self, bucket, key, parse):
+        with self._lock:
+            return self._load_locked(bucket, key, parse)
+
+    def _load_locked(self, bucket, key, parse):
+        cache_key = (bucket, key)
+        if cache_key in self._cache:
+            self.stats["reads_saved"] += 1
+            return self._cache[cache_key]
+
+        self.stats["reads"] += 1
+        raw = middleware.bucketGet(bucket, key)
+        if not raw or raw == '':
+            value = None
+        elif parse:
+            try:
+                value = json.loads(raw)
+            except Exception:
+                value = None
+        else:
+            value = raw
+        self._cache[cache_key] = value
+        return value
+
+    def get(self, bucket, key, default=None):
+        """
+        读取 JSON 值
+        :param default: 不存在或解析失败时的返回值
+        """
+        value = self._load(bucket, key, parse=True)
+        return default if value is None else value
+
+    def get_text(self, bucket, key, default=""):
+        """读取原始字符串值（如插件配置项）"""
+        value = self._load(bucket, key, parse=False)
+        return default if value is None else value
+
+    def set(self, bucket, key, value):
+        """保存 JSON 值（延迟到 flush() 写入）"""
+        cache_key = (bucket, key)
+        with self._lock:
+            if cache_key in self._dirty:
+                self.stats["writes_saved"] += 1
+                del self._dirty[cache_key]  # 移到末尾，flush() 按最后修改的顺序写入
+            self._cache[cache_key] = value
+            self._dirty[cache_key] = value
+
+    def delete(self, bucket, key):
+        """删除 key（延迟到 flush() 执行）"""
+        cache_key = (bucket, key)
+        with self._lock:
+            if cache_key in self._dirty:
+                self.stats["writes_saved"] += 1
+                del self._dirty[cache_key]
+            self._cache[cache_key] = None
+            self._dirty[cache_key] = _DELETED
+
+    def invalidate(self, bucket, key):
+        """丢弃缓存，下次读取时重新从存储桶获取（如需读取其他进程的写入）；有未写入的修改时保留"""
+        with self._lock:
+            if (bucket, key) not in self._dirty:
+                self._cache.pop((bucket, key), None)
+
+    def flush(self, keys=None):
+        """
+        把待写入的值写回存储桶
+        :param keys: 只写入这些 (桶, key)，默认全部（如限流器只需立即保存自己的状态，其余写入仍等待合并）
+        :raises Exception: 写入失败时抛出；按 set()/delete() 的顺序写入，失败后停止，
+            失败的和之后的写入都保留到下次 flush()（如迁移时先写新数据、最后删旧 key，写失败时旧数据不会被删）
+        """
+        with self._lock:
+            if keys is None:
+                pending = self._dirty
+                self._dirty = {}
+            else:
+                pending = {k: self._dirty.pop(k) for k in keys if k in self._dirty}
+
+            items = list(pending.items())
+            for i, ((bucket, key), value) in enumerate(items):
+                try:
+                    if value is _DELETED:
+                        middleware.bucketDel(bucket, key)
+                    else:
+                        middleware.bucketSet(bucket, key, json.dumps(value, ensure_ascii=False))
+                    self.stats["writes"] += 1
+                except Exception as e:
+                    for cache_key, rest in items[i:]:
+                        self._dirty.setdefault(cache_key, rest)
+                    raise Exception(f"保存失败: {e}")
+
+    def summary(self):
+        """读写统计摘要"""
+        s = self.stats
+        return (f"读取 {s['reads']} 次(缓存节省 {s['reads_saved']} 次), "
+                f"写入 {s['writes']} 次(合并节省 {s['writes_saved']} 次)")
+
+
+def ensure_timestamp_order(records):
+    """
+    确保记录按 timestamp 升序排列
+    :return: 是否进行了排序（旧数据可能是乱序的）
+    """
+    for i in range(1, len(records)):
+        if records[i - 1]['timestamp'] > records[i]['timestamp']:
+            records.sort(key=lambda x: x['timestamp'])
+            return True
+    return False
+
+
+def bisect_timestamp(records, timestamp):
+    """在按 timestamp 升序排列的记录中，二分查找第一条 timestamp >= 指定值的位置"""
+    lo, hi = 0, len(records)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if records[mid]['timestamp'] < timestamp:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def insert_by_timestamp(records, record):
+    """按 timestamp 有序插入（通常追加在末尾）"""
+    if not records or records[-1]['timestamp'] <= record['timestamp']:
+        records.append(record)
+    else:
+        records.insert(bisect_timestamp(records, record['timestamp'] + 1), record)
+
+
+def remove_by_timestamp(records, record):
+    """
+    从升序记录中删除与指定记录相同的一条
+    :return: 是否找到并删除
+    """
+    i = bisect_timestamp(records, record['timestamp'])
+    while i < len(records) and records[i]['timestamp'] == record['timestamp']:
+        if records[i] == record:
+            del records[i]
+            return True
+        i += 1
+    return False
+
+
+def records_since(records, timestamp):
+    """升序记录中 timestamp >= 指定值的部分，只复制窗口内的记录"""
+    return records[bisect_timestamp(records, timestamp):]
+
+
+_store = None
+
+
+def _flush_at_exit():
+    try:
+        _store.flush()
+    except Exception as e:
+        log.error("退出时保存失败", error=e)
+
+
+def get_store():
+    """获取当前进程共享的存储实例"""
+    global _store
+    if _store is None:
+        _store = BucketStore()
+        atexit.register(_flush_at_exit)
+    return _store
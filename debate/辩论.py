@@ -21,14 +21,27 @@ autMan 插件 - 辩论助手
 """
 
 import middleware
-import time
-import json
 from datetime import datetime
+import os
+import sys
+
+# 共享模块：部署时与插件放在同一目录，仓库中位于 common/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from autman_storage import get_store
+from autman_ratelimit import RateLimiter, RateLimited
+from autman_log import get_logger
 
 # 配置常量
 BUCKET_NAME = "debate_sessions"
 VERSION = "v1.0.0"
 INPUT_TIMEOUT = 60000  # 60秒超时
+# AI 回复限流（每分钟补充的令牌数 / 最多积累的令牌数）
+AI_USER_PER_MINUTE = 6      # 对手平均 10 秒一次
+AI_USER_BURST = 3
+AI_GLOBAL_PER_MINUTE = 20   # 所有群的辩论合计
+AI_GLOBAL_BURST = 5
+AI_MAX_WAIT = 10            # 没有令牌时最多排队等待的秒数，超过则提示稍后再发
+log = get_logger("辩论插件")
 
 # 辩论主题库
 DEBATE_TOPICS = [
@@ -50,6 +63,7 @@ class DebatePlugin:
         """初始化插件"""
         sender_id = middleware.getSenderID()
         self.sender = middleware.Sender(sender_id)
+        self.store = get_store()
         self.user_id = self.sender.getUserID()
         self.group_id = self.sender.getGroupID()
         self.imtype = self.sender.getImtype()
@@ -64,28 +78,23 @@ class DebatePlugin:
     
     def get_debate_session(self):
         """获取当前辩论会话"""
-        session_key = self.get_session_key()
-        try:
-            data = middleware.bucketGet(BUCKET_NAME, session_key)
-            if not data or data == '':
-                return None
-            return json.loads(data)
-        except Exception as e:
+        session = self.store.get(BUCKET_NAME, self.get_session_key())
+        if not isinstance(session, dict):
             return None
+        return session
     
     def save_debate_session(self, session_data):
         """保存辩论会话"""
-        session_key = self.get_session_key()
         try:
-            data = json.dumps(session_data, ensure_ascii=False)
-            middleware.bucketSet(BUCKET_NAME, session_key, data)
+            self.store.set(BUCKET_NAME, self.get_session_key(), session_data)
+            self.store.flush()
         except Exception as e:
             self.sender.reply(f"❌ 保存会话失败：{e}")
     
     def clear_debate_session(self):
         """清除辩论会话"""
-        session_key = self.get_session_key()
-        middleware.bucketSet(BUCKET_NAME, session_key, "")
+        self.store.delete(BUCKET_NAME, self.get_session_key())
+        self.store.flush()
     
     def show_help(self):
         """显示帮助信息"""
@@ -288,6 +297,14 @@ class DebatePlugin:
         if self.user_id != session['opponent_id']:
             return False
         
+        # 限流：对手连续发言时排队，等待过久则提示
+        try:
+            RateLimiter("debate_ai", AI_USER_PER_MINUTE, AI_USER_BURST,
+                        AI_GLOBAL_PER_MINUTE, AI_GLOBAL_BURST, self.store).acquire(self.user_id, AI_MAX_WAIT)
+        except RateLimited as e:
+            self.sender.reply(f"⏳ 发言太快了，{e}")
+            return True
+        
         # 生成回复
         response = self.generate_debate_response(session, message)
         
@@ -309,6 +326,14 @@ class DebatePlugin:
             self.sender.reply("❌ 生成回复失败，请稍后重试")
             return True
     
+    def flush_storage(self):
+        """写回本次调用中尚未保存的修改"""
+        try:
+            self.store.flush()
+        except Exception as e:
+            self.sender.reply(f"❌ {e}")
+        log.debug("存储统计", summary=self.store.summary)
+    
     def run(self):
         """主程序入口"""
         try:
@@ -327,6 +352,8 @@ class DebatePlugin:
         
         except Exception as e:
             self.sender.reply(f"❌ 插件执行错误：{e}")
+        finally:
+            self.flush_storage()
 
 
 # 主程序入口
@@ -1,6 +1,7 @@
 # [disable:false]
 # [rule: ^麦当劳(.*)$]
-# [cron: 0 9 * * *]
+# [rule: ^(\d{1,2}|[yYnNqQ])$]
+# [cron: */10 9 * * *]
 # [admin: false]
 # [price: 0.00]
 # [version: 2.1.0]
@@ -19,33 +20,165 @@ autMan 插件 - 麦当劳优惠券管理（Python 版本）
 - 麦当劳日历：查看活动日历
 - 麦当劳优惠券：查看可领优惠券
 - 麦当劳领券：一键领取所有优惠券
-- 麦当劳我的优惠券：查看已领优惠券
+- 麦当劳全部领券：为所有账号同时领券
+- 麦当劳我的优惠券：查看新增的已领优惠券
+- 麦当劳我的优惠券全部：查看全部已领优惠券
+- 麦当劳总览：账号状态、活动日历和我的优惠券（一次请求）
 - 麦当劳帮助：显示帮助信息
 """
 
 import middleware
-import requests
+import hashlib
 import json
+import random
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
+from urllib.parse import urlparse
+import os
+import sys
+
+# 共享模块：部署时与插件放在同一目录，仓库中位于 common/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from autman_storage import get_store
+from autman_dialog import Dialog, chat_of
+from autman_http import CONNECT_TIMEOUT, READ_TIMEOUT, get_transport, iter_sse_events
+from autman_resilience import RETRYABLE_STATUS, RetryableHTTPError, call_with_resilience, get_breaker
+from autman_ratelimit import RateLimited, RateLimiter
+from autman_log import get_logger
 
 # 配置常量
 MCP_URL = "https://mcp.mcd.cn/mcp-servers/mcd-mcp"
 MCP_PROTOCOL_VERSION = "2025-06-18"
 BUCKET_NAME = "maimai"
+SESSION_BUCKET = "maimai_mcp_session"  # MCP 会话缓存（key 为 Token 的哈希）
+SESSION_TTL = 1800  # 会话缓存有效期（秒）
+TOOL_CACHE_BUCKET = "maimai_tool_cache"  # 工具结果缓存
+# 工具结果缓存有效期（秒），未列出的工具不缓存
+TOOL_CACHE_TTL = {
+    "campaign-calender": 6 * 3600,  # 活动日历：所有用户相同，每天最多变化一次
+    "available-coupons": 120,
+    "my-coupons": 120,
+}
+REGISTRY_BUCKET = "maimai_registry"  # 自动领券用户索引
+REGISTRY_KEY = "auto_claim"          # {用户ID: {"imtype": 平台, "group_id": 群号}}
+CURSOR_KEY = "cron_cursor"           # 当天定时任务进度 {"date": 日期, "done": [用户ID]}
+CRON_CONCURRENCY = 4      # 定时任务同时领券的账号数
+CRON_JITTER = 2.0         # 每个账号领券前的随机等待上限（秒），错开请求
+CRON_TIME_BUDGET = 480    # 单次定时任务的时间上限（秒），未完成的用户由下一次触发继续
+CURSOR_SAVE_EVERY = 20    # 每完成多少个用户保存一次进度
+CLAIM_ALL_WORKERS = 4          # 全部领券时同时领券的账号数
+CLAIM_ACCOUNT_TIMEOUT = 30     # 全部领券的总超时时间（秒），到时仍未完成的账号（包括排队中的）记为超时
+# MCP 调用限流（每分钟补充的令牌数 / 最多积累的令牌数），只计实际发出的工具调用，缓存命中不计
+MCP_USER_PER_MINUTE = 6
+MCP_USER_BURST = 6          # 连续发送命令时允许的突发次数
+MCP_GLOBAL_PER_MINUTE = 60
+MCP_GLOBAL_BURST = 20
+MCP_MAX_WAIT = 5            # 没有令牌时最多排队等待的秒数，超过则拒绝
+OVERVIEW_SECTION_LENGTH = 900   # 总览中每个部分的最大长度
+SNAPSHOT_BUCKET = "maimai_coupon_snapshot"  # 每个账号上次看到的优惠券指纹（key 为 Token 哈希/类型）
+GLOBAL_TOOLS = {"campaign-calender"}  # 与账号无关、所有用户共享缓存的工具
+# 调用后需要清除缓存的工具
+TOOL_CACHE_INVALIDATES = {
+    "auto-bind-coupons": ["available-coupons", "my-coupons"],
+}
 VERSION = "v2.0.0"
 INPUT_TIMEOUT = 60000  # 60秒超时
+DIALOG_REPLY_PATTERN = r'^(\d{1,2}|[yYnNqQ])$'  # 对话中的回复，与头部 rule 保持一致
+TOOL_RESULT_MAX_LENGTH = 2000  # 工具结果回复的最大长度
+
+# 工具结果格式化使用的正则（模块加载时编译一次）
+IMG_TAG_PATTERN = re.compile(r'<\s*img[^>]*>', re.IGNORECASE)
+IMG_OPEN_PATTERN = re.compile(r'<\s*img', re.IGNORECASE)
+IMG_SRC_PATTERN = re.compile(r'src=["\']([^"\']+)["\']', re.IGNORECASE)
+IMG_ALT_PATTERN = re.compile(r'alt=["\']([^"\']+)["\']', re.IGNORECASE)
+MARKDOWN_IMAGE_PATTERN = re.compile(r'!\[([^\]]*)\]\(([^)]+)\)')
+TRAILING_BACKSLASH_PATTERN = re.compile(r'\\[ \t]*$', re.MULTILINE)
+BLANK_LINES_PATTERN = re.compile(r'\n(?:[ \t\r\f\v]*\n){2,}')
+HEADING_PATTERN = re.compile(r'^###[ \t]+', re.MULTILINE)
+ENTRY_SPLIT_PATTERN = re.compile(r'\n(?=#{1,6}[ \t])|\n[ \t]*\n')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+log = get_logger("麦当劳插件")
+
+
+class MCPSessionExpired(Exception):
+    """服务端不再认可当前会话（需要重新初始化）"""
+
+
+_CACHE_MISS = object()
 
 
 class MCPClient:
     """麦当劳 MCP 客户端"""
     
-    def __init__(self, token):
-        """初始化客户端"""
+    def __init__(self, token, store=None, timeout=None, rate_limit=None, deadline=None):
+        """
+        初始化客户端
+        :param token: MCP Token
+        :param store: 存储实例，提供时会话会缓存到 SESSION_BUCKET，供后续调用复用
+        :param timeout: 每个请求的 (连接超时, 读取超时)，不传时使用传输层默认值
+        :param rate_limit: 每次实际发出工具调用前调用的函数（限流），超过限制时抛出异常
+        :param deadline: 截止时间戳，所有请求（包括初始化和重试）的超时都不超过剩余时间，到时直接失败
+        """
         self.token = token
+        self.store = store
+        self.timeout = timeout
+        self.deadline = deadline
+        self.rate_limit = rate_limit
         self.session_id = None
+        self.protocol_version = MCP_PROTOCOL_VERSION
         self.initialized = False
+        self.session_reused = False
+        self.batch_supported = True  # 服务端拒绝过批量请求后为 False
         self.request_id = 1
+        self.http = get_transport()
+        # 缓存使用 Token 的哈希作为 key，不直接保存 Token
+        self.token_key = hashlib.sha256((token or "").encode("utf-8")).hexdigest()[:32]
+        self._load_session()
+    
+    def _session_key(self):
+        """会话缓存的 key"""
+        return self.token_key
+    
+    def _load_session(self):
+        """读取缓存的会话，未过期时跳过初始化"""
+        if not self.store or not self.token:
+            return
+        
+        cached = self.store.get(SESSION_BUCKET, self._session_key())
+        if not isinstance(cached, dict) or time.time() > cached.get("expires_at", 0):
+            return
+        
+        self.session_id = cached.get("session_id")
+        self.protocol_version = cached.get("protocol_version", MCP_PROTOCOL_VERSION)
+        self.batch_supported = cached.get("batch_supported", True)
+        self.initialized = True
+        self.session_reused = True
+    
+    def _save_session(self):
+        """缓存当前会话"""
+        if not self.store or not self.token:
+            return
+        
+        self.store.set(SESSION_BUCKET, self._session_key(), {
+            "session_id": self.session_id,
+            "protocol_version": self.protocol_version,
+            "batch_supported": self.batch_supported,
+            "expires_at": int(time.time()) + SESSION_TTL
+        })
+    
+    def reset_session(self):
+        """丢弃当前会话（包括缓存），下次调用时重新初始化"""
+        self.session_id = None
+        self.protocol_version = MCP_PROTOCOL_VERSION
+        self.initialized = False
+        self.session_reused = False
+        self.batch_supported = True
+        if self.store and self.token:
+            self.store.delete(SESSION_BUCKET, self._session_key())
     
     def initialize(self):
         """初始化 MCP 会话"""
@@ -71,6 +204,10 @@ class MCPClient:
         try:
             response = self._send_rpc(init_message, expect_response=True)
             if response and "error" not in response:
+                # 记录协商的协议版本
+                result = response.get("result") or {}
+                self.protocol_version = result.get("protocolVersion") or MCP_PROTOCOL_VERSION
+                
                 # 发送 initialized 通知
                 notify_message = {
                     "jsonrpc": "2.0",
@@ -78,14 +215,95 @@ class MCPClient:
                 }
                 self._send_rpc(notify_message, expect_response=False)
                 self.initialized = True
+                self._save_session()
                 return True
         except Exception as e:
             raise Exception(f"初始化失败: {e}")
         
         return False
     
+    def _cache_key(self, tool_name, args):
+        """工具结果缓存的 key：全局工具所有用户共享，其余按 Token 区分"""
+        args_key = hashlib.sha256(json.dumps(args or {}, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+        scope = "global" if tool_name in GLOBAL_TOOLS else self.token_key
+        return f"{scope}/{tool_name}/{args_key}"
+    
+    def _get_cached(self, tool_name, args):
+        """读取工具结果缓存，未命中时返回 _CACHE_MISS"""
+        if not self.store or not TOOL_CACHE_TTL.get(tool_name):
+            return _CACHE_MISS
+        cached = self.store.get(TOOL_CACHE_BUCKET, self._cache_key(tool_name, args))
+        if isinstance(cached, dict) and time.time() < cached.get("expires_at", 0):
+            return cached.get("result")
+        return _CACHE_MISS
+    
+    def _remember(self, tool_name, args, result):
+        """缓存工具结果（错误结果不缓存），并清除被该工具改变的缓存"""
+        if not self.store:
+            return
+        ttl = TOOL_CACHE_TTL.get(tool_name)
+        if ttl and not (isinstance(result, dict) and result.get("isError")):
+            self.store.set(TOOL_CACHE_BUCKET, self._cache_key(tool_name, args), {
+                "result": result,
+                "expires_at": int(time.time()) + ttl
+            })
+        for stale_tool in TOOL_CACHE_INVALIDATES.get(tool_name, []):
+            self.store.delete(TOOL_CACHE_BUCKET, self._cache_key(stale_tool, {}))
+    
     def call_tool(self, tool_name, args=None):
-        """调用 MCP 工具"""
+        """
+        调用 MCP 工具
+        配置了 TOOL_CACHE_TTL 的工具先查缓存；调用会改变数据的工具后清除相关缓存
+        """
+        cached = self._get_cached(tool_name, args)
+        if cached is not _CACHE_MISS:
+            return cached
+        
+        if self.rate_limit:
+            self.rate_limit()
+        result = self._call_tool_with_session(tool_name, args)
+        self._remember(tool_name, args, result)
+        return result
+    
+    def call_tools(self, calls):
+        """
+        调用多个 MCP 工具
+        未命中缓存的调用合并为一个 JSON-RPC 批量请求；服务端不支持批量时逐个调用
+        :param calls: [(工具名, 参数), ...]
+        :return: 与 calls 顺序一致的结果列表
+        """
+        results = [self._get_cached(name, args) for name, args in calls]
+        pending = [i for i, result in enumerate(results) if result is _CACHE_MISS]
+        
+        if len(pending) > 1 and self.batch_supported:
+            if self.rate_limit:
+                self.rate_limit()
+            batch_results = self._call_batch_with_session([calls[i] for i in pending])
+            if batch_results is not None:
+                for i, result in zip(pending, batch_results):
+                    results[i] = result
+                    self._remember(calls[i][0], calls[i][1], result)
+                return results
+        
+        for i in pending:
+            results[i] = self.call_tool(*calls[i])
+        return results
+    
+    def _call_tool_with_session(self, tool_name, args):
+        """调用工具，复用的会话已失效时重新初始化并重试一次"""
+        try:
+            return self._call_tool(tool_name, args)
+        except MCPSessionExpired:
+            if not self.session_reused:
+                raise Exception("工具调用失败: 会话已失效")
+            log.info("缓存的 MCP 会话已失效，重新初始化")
+            self.reset_session()
+            try:
+                return self._call_tool(tool_name, args)
+            except MCPSessionExpired:
+                raise Exception("工具调用失败: 会话已失效")
+    
+    def _call_tool(self, tool_name, args):
         if not self.initialize():
             raise Exception("会话初始化失败")
         
@@ -106,15 +324,107 @@ class MCPClient:
                 raise Exception(response["error"].get("message", "工具调用失败"))
             
             return response.get("result")
+        except MCPSessionExpired:
+            raise
         except Exception as e:
             raise Exception(f"工具调用失败: {e}")
     
-    def _send_rpc(self, message, expect_response=True):
-        """发送 JSON-RPC 请求"""
+    def _call_batch_with_session(self, calls):
+        """批量调用工具，复用的会话已失效时重新初始化并重试一次"""
+        try:
+            return self._call_batch(calls)
+        except MCPSessionExpired:
+            if not self.session_reused:
+                raise Exception("工具调用失败: 会话已失效")
+            log.info("缓存的 MCP 会话已失效，重新初始化")
+            self.reset_session()
+            try:
+                return self._call_batch(calls)
+            except MCPSessionExpired:
+                raise Exception("工具调用失败: 会话已失效")
+    
+    def _call_batch(self, calls):
+        """
+        在一个 HTTP 请求中发送多个 tools/call，按 id 匹配响应
+        :return: 与 calls 顺序一致的结果列表；服务端不支持批量请求时返回 None
+        """
+        if not self.initialize():
+            raise Exception("会话初始化失败")
+        
+        messages = []
+        for tool_name, args in calls:
+            messages.append({
+                "jsonrpc": "2.0",
+                "id": self.request_id,
+                "method": "tools/call",
+                "params": {
+                    "name": tool_name,
+                    "arguments": args or {}
+                }
+            })
+            self.request_id += 1
+        
+        response = self._post(messages)
+        try:
+            if self.session_id and response.status_code == 404:
+                raise MCPSessionExpired(f"HTTP {response.status_code}")
+            
+            responses = {}
+            if response.status_code < 400:
+                ids = [message["id"] for message in messages]
+                content_type = response.headers.get("content-type", "")
+                if "text/event-stream" in content_type:
+                    responses = self._read_sse_batch(response, ids)
+                else:
+                    parsed = response.json()
+                    if isinstance(parsed, list):
+                        responses = {item.get("id"): item for item in parsed if isinstance(item, dict)}
+        except MCPSessionExpired:
+            raise
+        except Exception as e:
+            raise Exception(f"网络请求失败: {e}")
+        finally:
+            response.close()
+        
+        if not any(message["id"] in responses for message in messages):
+            # HTTP 错误、单个错误对象或没有任何匹配的响应：服务端不支持批量请求（MCP 2025-06-18 已移除）
+            log.info("服务端不支持批量请求，改为逐个调用")
+            self.batch_supported = False
+            self._save_session()
+            return None
+        
+        results = []
+        for message in messages:
+            item = responses.get(message["id"])
+            if item is None:
+                raise Exception(f"工具调用失败: 批量响应缺少 id {message['id']}")
+            if "error" in item:
+                raise Exception(f"工具调用失败: {item['error'].get('message', '工具调用失败')}")
+            results.append(item.get("result"))
+        return results
+    
+    def _check_deadline(self):
+        """
+        检查截止时间
+        :return: 本次请求的 (连接超时, 读取超时)，没有截止时间时为 self.timeout
+        """
+        if self.deadline is None:
+            return self.timeout
+        remaining = self.deadline - time.time()
+        if remaining <= 0:
+            raise Exception("已超过截止时间")
+        connect, read = self.timeout or (CONNECT_TIMEOUT, READ_TIMEOUT)
+        return (min(connect, remaining), min(read, remaining))
+    
+    def _post(self, payload):
+        """
+        POST 一个 JSON-RPC 消息或批量数组（流式读取，使用完需要 close()）
+        连接失败和 429/502/503/504 退避重试；MCP 服务持续不可用时熔断，直接失败不再等待超时
+        """
         headers = {
             "Accept": "application/json, text/event-stream",
             "Content-Type": "application/json",
-            "MCP-Protocol-Version": MCP_PROTOCOL_VERSION
+            "MCP-Protocol-Version": self.protocol_version
         }
         
         if self.token:
@@ -123,13 +433,31 @@ class MCPClient:
         if self.session_id:
             headers["Mcp-Session-Id"] = self.session_id
         
-        try:
-            response = requests.post(
+        def send():
+            response = self.http.post(
                 MCP_URL,
                 headers=headers,
-                json=message,
-                timeout=30
+                json=payload,
+                stream=True,
+                timeout=self._check_deadline()
             )
+            if response.status_code in RETRYABLE_STATUS:
+                response.close()
+                raise RetryableHTTPError(response.status_code)
+            return response
+        
+        try:
+            return call_with_resilience(get_breaker(urlparse(MCP_URL).netloc, self.store), send)
+        except Exception as e:
+            raise Exception(f"网络请求失败: {e}")
+    
+    def _send_rpc(self, message, expect_response=True):
+        """发送 JSON-RPC 请求"""
+        response = self._post(message)
+        try:
+            # 带着会话 ID 却收到 404/400：会话已过期或服务端已重启
+            if self.session_id and response.status_code in (400, 404):
+                raise MCPSessionExpired(f"HTTP {response.status_code}")
             
             # 检查会话 ID
             new_session_id = response.headers.get("Mcp-Session-Id") or response.headers.get("mcp-session-id")
@@ -142,45 +470,160 @@ class MCPClient:
             # 解析响应
             content_type = response.headers.get("content-type", "")
             if "text/event-stream" in content_type:
-                return self._parse_sse_response(response.text, message.get("id"))
+                return self._read_sse_response(response, message.get("id"))
             else:
                 return response.json()
         
+        except MCPSessionExpired:
+            raise
         except Exception as e:
             raise Exception(f"网络请求失败: {e}")
+        finally:
+            # 提前拿到结果时直接关闭流，不再等待服务端结束
+            response.close()
     
-    def _parse_sse_response(self, text, request_id):
-        """解析 SSE 响应"""
-        events = []
-        data_lines = []
-        
-        for line in text.split('\n'):
-            line = line.strip()
-            if line.startswith("data:"):
-                data_lines.append(line[5:].strip())
-            elif line == "":
-                if data_lines:
-                    events.append('\n'.join(data_lines))
-                    data_lines = []
-        
-        if data_lines:
-            events.append('\n'.join(data_lines))
-        
-        # 查找匹配的响应
+    def _read_sse_response(self, response, request_id):
+        """边接收边解析 SSE 响应，收到 id 匹配的 JSON-RPC 响应后立即返回"""
         last_event = None
-        for event_data in events:
+        for event_data in iter_sse_events(response):
+            self._check_deadline()
             try:
                 parsed = json.loads(event_data)
-                last_event = parsed
-                if request_id is not None and parsed.get("id") == request_id:
-                    return parsed
-            except:
+            except ValueError:
+                continue
+            if not isinstance(parsed, dict):
                 continue
+            last_event = parsed
+            # 服务端发起的请求/通知带 method，不是本次请求的响应
+            if request_id is not None and parsed.get("id") == request_id and "method" not in parsed:
+                return parsed
         
         if last_event:
             return last_event
         
         raise Exception("未找到有效的 JSON-RPC 响应")
+    
+    def _read_sse_batch(self, response, ids):
+        """边接收边解析批量请求的 SSE 响应，收齐所有 id 的响应后立即返回"""
+        wanted = set(ids)
+        responses = {}
+        for event_data in iter_sse_events(response):
+            self._check_deadline()
+            try:
+                parsed = json.loads(event_data)
+            except ValueError:
+                continue
+            # 每个事件可以是单个响应，也可以是响应数组
+            for item in parsed if isinstance(parsed, list) else [parsed]:
+                if isinstance(item, dict) and item.get("id") in wanted and "method" not in item:
+                    responses[item["id"]] = item
+            if len(responses) == len(wanted):
+                break
+        return responses
+
+
+def _replace_img_tag(match):
+    """HTML 图片标签转换为 [alt](url) 文本链接，没有 src 时移除"""
+    img_tag = match.group(0)
+    src_match = IMG_SRC_PATTERN.search(img_tag)
+    if not src_match:
+        return ""
+    alt_match = IMG_ALT_PATTERN.search(img_tag)
+    return f"[{alt_match.group(1) if alt_match else '查看图片'}]({src_match.group(1)})"
+
+
+def _line_end(text, pos):
+    """pos 所在行结束（含换行符）的位置"""
+    end = text.find("\n", pos)
+    return len(text) if end < 0 else end + 1
+
+
+def _iter_windows(text, size):
+    """
+    按行边界把文本切成约 size 个字符的片段
+    跨行的 <img ...> 标签不会被切开：片段末尾有未闭合的 <img 时延长到标签结束所在的行
+    """
+    start = 0
+    while start < len(text):
+        end = _line_end(text, start + size)
+        while end < len(text):
+            open_at = text.rfind("<", start, end)
+            if open_at < 0 or text.find(">", open_at, end) >= 0 or not IMG_OPEN_PATTERN.match(text, open_at):
+                break
+            close_at = text.find(">", end)
+            end = len(text) if close_at < 0 else _line_end(text, close_at)
+        yield text[start:end]
+        start = end
+
+
+def format_tool_result(result, max_length=TOOL_RESULT_MAX_LENGTH):
+    """
+    把工具返回结果转换为聊天消息文本
+    - 图片（HTML <img> 和 Markdown ![]()）转换为 [alt](url) 文本链接
+    - 去掉行尾的反斜杠、### 标题标记，连续多个空行合并为一个
+    - 按行分段处理，输出超过 max_length 后不再处理剩余内容，截断并以 ... 结尾
+    :param result: tools/call 的 result
+    :return: 格式化后的文本
+    """
+    if not result or "content" not in result:
+        return "未获取到数据"
+    
+    text = "".join(item.get("text", "") for item in result["content"] if item.get("type") == "text")
+    
+    parts = []
+    length = 0
+    pending = ""  # 上一片段末尾的空白，与下一片段一起合并空行
+    for window in _iter_windows(text, max_length):
+        if "<" in window:
+            window = IMG_TAG_PATTERN.sub(_replace_img_tag, window)
+        if "![" in window:
+            window = MARKDOWN_IMAGE_PATTERN.sub(r'[\1](\2)', window)
+        if "\\" in window:
+            window = TRAILING_BACKSLASH_PATTERN.sub("", window)
+        if "###" in window:
+            window = HEADING_PATTERN.sub("", window)
+        window = BLANK_LINES_PATTERN.sub("\n\n", pending + window)
+        
+        body = window.rstrip()
+        pending = window[len(body):]
+        if not length:
+            body = body.lstrip()
+        parts.append(body)
+        length += len(body)
+        if length > max_length:
+            break
+    
+    text = "".join(parts)
+    if len(text) > max_length:
+        text = text[:max_length - 3] + "..."
+    return text
+
+
+def coupon_entries(result):
+    """
+    把优惠券列表拆分为条目并计算指纹
+    以标题行或空行分隔条目；只有一行标题的条目（列表标题）不计入
+    :param result: tools/call 的 result
+    :return: [(指纹, 条目原文), ...]
+    """
+    if not result or "content" not in result:
+        return []
+    
+    text = "".join(item.get("text", "") for item in result["content"] if item.get("type") == "text")
+    entries = []
+    for block in ENTRY_SPLIT_PATTERN.split(text):
+        block = block.strip()
+        if not block or ("\n" not in block and block.startswith("#")):
+            continue
+        normalized = WHITESPACE_PATTERN.sub(" ", block)
+        fingerprint = hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:12]
+        entries.append((fingerprint, block))
+    return entries
+
+
+def format_coupon_entries(entries):
+    """格式化部分条目（与 format_tool_result 输出一致）"""
+    return format_tool_result({"content": [{"type": "text", "text": "\n\n".join(block for _, block in entries)}]})
 
 
 class MaiMaiPlugin:
@@ -190,42 +633,48 @@ class MaiMaiPlugin:
         """初始化插件"""
         sender_id = middleware.getSenderID()
         self.sender = middleware.Sender(sender_id)
+        self.store = get_store()
         self.user_id = self.sender.getUserID()
         self.message = self.sender.getMessage().strip()
+        self.dialog = Dialog(self.store, BUCKET_NAME, self.user_id, chat_of(self.sender))
+        self.clients = {}  # Token -> MCPClient，同一次调用内复用
+        self.limiter = RateLimiter("maimai_mcp", MCP_USER_PER_MINUTE, MCP_USER_BURST,
+                                   MCP_GLOBAL_PER_MINUTE, MCP_GLOBAL_BURST, self.store)
+        self.rate_limit_lock = threading.Lock()
+        self.rate_limit_acquired = False  # 本条命令是否已经占用了令牌
         # 定时任务时消息为空
         self.is_cron = (not self.message or self.message == "")
     
-    def get_user_data(self):
-        """获取用户数据"""
-        try:
-            data = middleware.bucketGet(BUCKET_NAME, self.user_id)
-            if not data or data == '':
-                return {
-                    "accounts": {},
-                    "active_account": None,
-                    "auto_claim_enabled": False,
-                    "last_claim_date": None
-                }
-            return json.loads(data)
-        except:
+    def get_user_data(self, user_id=None):
+        """
+        获取用户数据
+        :param user_id: 用户ID，默认为当前用户
+        """
+        user_data = self.store.get(BUCKET_NAME, user_id or self.user_id)
+        if not isinstance(user_data, dict):
             return {
                 "accounts": {},
                 "active_account": None,
                 "auto_claim_enabled": False,
                 "last_claim_date": None
             }
+        return user_data
     
-    def save_user_data(self, user_data):
-        """保存用户数据"""
+    def save_user_data(self, user_data, user_id=None):
+        """
+        保存用户数据
+        :param user_id: 用户ID，默认为当前用户
+        """
         try:
-            data = json.dumps(user_data, ensure_ascii=False)
-            middleware.bucketSet(BUCKET_NAME, self.user_id, data)
+            self.store.set(BUCKET_NAME, user_id or self.user_id, user_data)
+            self.store.flush()
         except Exception as e:
             self.sender.reply(f"❌ 保存失败: {e}")
     
-    def get_active_account(self):
-        """获取活跃账号"""
-        user_data = self.get_user_data()
+    def get_active_account(self, user_data=None):
+        """获取活跃账号（默认读取当前用户的数据）"""
+        if user_data is None:
+            user_data = self.get_user_data()
         active_name = user_data.get("active_account")
         
         if not active_name or active_name not in user_data["accounts"]:
@@ -236,50 +685,25 @@ class MaiMaiPlugin:
             "data": user_data["accounts"][active_name]
         }
     
+    def get_client(self, token):
+        """获取 Token 对应的 MCP 客户端（复用本次调用及缓存中的会话）"""
+        if token not in self.clients:
+            self.clients[token] = MCPClient(token, self.store, rate_limit=self.acquire_rate_limit)
+        return self.clients[token]
+    
+    def acquire_rate_limit(self):
+        """
+        用户命令发出 MCP 工具调用前限流：每条命令只占用一个令牌，无论实际发出多少次调用
+        （全部领券时各账号的调用共用这个令牌；定时任务有自己的并发控制，不经过这里）
+        """
+        with self.rate_limit_lock:
+            if not self.rate_limit_acquired:
+                self.limiter.acquire(self.user_id, MCP_MAX_WAIT)
+                self.rate_limit_acquired = True
+    
     def format_tool_result(self, result):
         """格式化工具返回结果"""
-        if not result or "content" not in result:
-            return "未获取到数据"
-        
-        text = ""
-        for item in result["content"]:
-            if item.get("type") == "text":
-                text += item.get("text", "")
-        
-        import re
-        
-        # 提取并转换 HTML 图片标签为文本链接
-        def replace_img_tag(match):
-            img_tag = match.group(0)
-            # 提取 src 属性
-            src_match = re.search(r'src=["\']([^"\']+)["\']', img_tag, re.IGNORECASE)
-            if src_match:
-                url = src_match.group(1)
-                # 提取 alt 属性（如果有）
-                alt_match = re.search(r'alt=["\']([^"\']+)["\']', img_tag, re.IGNORECASE)
-                alt_text = alt_match.group(1) if alt_match else "查看图片"
-                return f"[{alt_text}]({url})"
-            return ""
-        
-        text = re.sub(r'<\s*img[^>]*>', replace_img_tag, text, flags=re.IGNORECASE | re.DOTALL)
-        
-        # Markdown 图片语法已经是 ![alt](url) 格式，转换为 [alt](url)
-        text = re.sub(r'!\[([^\]]*)\]\(([^)]+)\)', r'[\1](\2)', text)
-        
-        # 移除行尾的反斜杠
-        text = re.sub(r'\\\s*$', '', text, flags=re.MULTILINE)
-        
-        # 清理多余的空行
-        text = re.sub(r'\n\s*\n\s*\n+', '\n\n', text)
-        
-        # 移除 Markdown 标题语法（###）
-        text = re.sub(r'^###\s+', '', text, flags=re.MULTILINE)
-        
-        # 限制长度
-        if len(text) > 2000:
-            text = text[:1997] + "..."
-        
-        return text.strip()
+        return format_tool_result(result)
     
     def show_help(self):
         """显示帮助信息"""
@@ -291,13 +715,16 @@ class MaiMaiPlugin:
         help_text += "• 麦当劳日历 - 查看活动日历\n"
         help_text += "• 麦当劳优惠券 - 查看可领优惠券\n"
         help_text += "• 麦当劳领券 - 一键领取所有优惠券\n"
-        help_text += "• 麦当劳我的优惠券 - 查看已领优惠券\n\n"
+        help_text += "• 麦当劳全部领券 - 为所有账号同时领券\n"
+        help_text += "• 麦当劳我的优惠券 - 查看新增的已领优惠券\n"
+        help_text += "• 麦当劳我的优惠券全部 - 查看全部已领优惠券\n\n"
         help_text += "👤 账号管理:\n"
         help_text += "• 麦当劳管理 - 进入账号管理菜单\n\n"
         help_text += "⏰ 自动领券:\n"
         help_text += "• 麦当劳开启自动领券 - 每天自动领券\n"
         help_text += "• 麦当劳关闭自动领券 - 关闭自动领券\n"
-        help_text += "• 麦当劳状态 - 查看账号状态\n\n"
+        help_text += "• 麦当劳状态 - 查看账号状态\n"
+        help_text += "• 麦当劳总览 - 账号状态、活动日历和我的优惠券\n\n"
         help_text += "🔑 获取 MCP Token:\n"
         help_text += "访问 https://open.mcd.cn/mcp/doc\n"
         help_text += "注册并获取您的 MCP Token\n\n"
@@ -321,7 +748,9 @@ class MaiMaiPlugin:
             message += "• 麦当劳日历\n"
             message += "• 麦当劳优惠券\n"
             message += "• 麦当劳领券\n"
+            message += "• 麦当劳全部领券\n"
             message += "• 麦当劳我的优惠券\n"
+            message += "• 麦当劳总览\n"
             message += "• 麦当劳管理\n"
         else:
             message += "⚠️ 未配置账号\n\n"
@@ -352,15 +781,11 @@ class MaiMaiPlugin:
         message += "请回复数字选择操作:"
         
         self.sender.reply(message)
-        
-        # 等待用户输入
-        user_input = self.sender.listen(INPUT_TIMEOUT)
-        
-        if user_input is None:
-            self.sender.reply("⏱️ 操作超时，已自动取消")
-            return
-        
-        choice = user_input.strip().lower()
+        self.dialog.save("manage")
+    
+    def on_manage_choice(self, choice):
+        """账号管理菜单：处理选择"""
+        self.dialog.clear()
         
         if choice == "q":
             self.sender.reply("👋 已退出账号管理")
@@ -378,7 +803,7 @@ class MaiMaiPlugin:
             self.sender.reply("❌ 无效选择\n\n请回复 1-4 或 q")
     
     def add_account(self):
-        """添加账号"""
+        """添加账号（名称和 Token 是自由文本，无法用 rule 匹配，仍在当前进程中等待输入）"""
         self.sender.reply("📝 请输入账号名称（如：主账号）:\n\n回复 q 取消")
         
         account_name = self.sender.listen(INPUT_TIMEOUT)
@@ -445,23 +870,26 @@ class MaiMaiPlugin:
         message += "q - 取消\n\n请回复数字选择账号:"
         
         self.sender.reply(message)
-        
-        user_input = self.sender.listen(INPUT_TIMEOUT)
-        
-        if user_input is None:
-            self.sender.reply("⏱️ 操作超时，已自动取消")
-            return
-        
-        choice = user_input.strip().lower()
+        self.dialog.save("switch", {"account_names": account_names})
+    
+    def on_switch_choice(self, choice, account_names):
+        """切换账号：处理选择"""
+        self.dialog.clear()
         
         if choice == "q":
             self.sender.reply("👋 已取消切换")
             return
         
+        user_data = self.get_user_data()
+        accounts = user_data.get("accounts", {})
+        
         try:
             index = int(choice) - 1
             if 0 <= index < len(account_names):
                 selected_name = account_names[index]
+                if selected_name not in accounts:
+                    self.sender.reply("❌ 账号不存在")
+                    return
                 user_data["active_account"] = selected_name
                 self.save_user_data(user_data)
                 self.sender.reply(f"✅ 已切换到账号「{accounts[selected_name]['label']}」")
@@ -506,46 +934,78 @@ class MaiMaiPlugin:
         message += "q - 取消\n\n请回复数字选择要删除的账号:"
         
         self.sender.reply(message)
-        
-        user_input = self.sender.listen(INPUT_TIMEOUT)
-        
-        if user_input is None:
-            self.sender.reply("⏱️ 操作超时，已自动取消")
-            return
-        
-        choice = user_input.strip().lower()
-        
+        self.dialog.save("delete", {"account_names": account_names})
+    
+    def on_delete_choice(self, choice, account_names):
+        """删除账号：处理选择，并请求二次确认"""
         if choice == "q":
+            self.dialog.clear()
             self.sender.reply("👋 已取消删除")
             return
         
+        accounts = self.get_user_data().get("accounts", {})
+        
         try:
             index = int(choice) - 1
-            if 0 <= index < len(account_names):
-                selected_name = account_names[index]
-                selected_label = accounts[selected_name]['label']
-                
-                # 二次确认
-                self.sender.reply(f"⚠️ 确认要删除账号「{selected_label}」吗?\n\ny - 确认\nn - 取消")
-                
-                confirm = self.sender.listen(INPUT_TIMEOUT)
-                
-                if confirm and confirm.strip().lower() == "y":
-                    del user_data["accounts"][selected_name]
-                    
-                    # 如果删除的是活跃账号，切换到第一个可用账号
-                    if user_data.get("active_account") == selected_name:
-                        remaining = list(user_data["accounts"].keys())
-                        user_data["active_account"] = remaining[0] if remaining else None
-                    
-                    self.save_user_data(user_data)
-                    self.sender.reply(f"✅ 账号「{selected_label}」已删除")
-                else:
-                    self.sender.reply("❌ 已取消删除")
-            else:
-                self.sender.reply("❌ 无效选择")
         except ValueError:
+            index = -1
+        
+        if not 0 <= index < len(account_names) or account_names[index] not in accounts:
+            self.dialog.clear()
             self.sender.reply("❌ 无效选择")
+            return
+        
+        selected_name = account_names[index]
+        selected_label = accounts[selected_name]['label']
+        
+        # 二次确认
+        self.sender.reply(f"⚠️ 确认要删除账号「{selected_label}」吗?\n\ny - 确认\nn - 取消")
+        self.dialog.save("delete_confirm", {"account_name": selected_name})
+    
+    def on_delete_confirm(self, confirm, selected_name):
+        """删除账号：处理二次确认"""
+        self.dialog.clear()
+        
+        user_data = self.get_user_data()
+        if confirm != "y" or selected_name not in user_data["accounts"]:
+            self.sender.reply("❌ 已取消删除")
+            return
+        
+        selected_label = user_data["accounts"][selected_name]['label']
+        del user_data["accounts"][selected_name]
+        
+        # 如果删除的是活跃账号，切换到第一个可用账号
+        if user_data.get("active_account") == selected_name:
+            remaining = list(user_data["accounts"].keys())
+            user_data["active_account"] = remaining[0] if remaining else None
+        
+        self.save_user_data(user_data)
+        self.sender.reply(f"✅ 账号「{selected_label}」已删除")
+    
+    def resume_dialog(self):
+        """
+        处理对话中的回复（数字、y/n/q）
+        没有进行中的对话时静默退出，对话已超时则提示
+        """
+        state = self.dialog.load()
+        if state is None:
+            if self.dialog.expired:
+                self.sender.reply("⏱️ 操作超时，已自动取消")
+            return
+        
+        step = state["step"]
+        data = state["data"]
+        choice = self.message.lower()
+        if step == "manage":
+            self.on_manage_choice(choice)
+        elif step == "switch":
+            self.on_switch_choice(choice, data.get("account_names", []))
+        elif step == "delete":
+            self.on_delete_choice(choice, data.get("account_names", []))
+        elif step == "delete_confirm":
+            self.on_delete_confirm(choice, data.get("account_name"))
+        else:
+            self.dialog.clear()
     
     def query_calendar(self):
         """查询活动日历"""
@@ -557,7 +1017,7 @@ class MaiMaiPlugin:
         
         try:
             self.sender.reply("🔍 正在查询活动日历...")
-            client = MCPClient(active_account['data']['token'])
+            client = self.get_client(active_account['data']['token'])
             result = client.call_tool("campaign-calender", {})
             formatted = self.format_tool_result(result)
             self.sender.reply(f"📅 活动日历\n━━━━━━━━━━━━━━━\n\n{formatted}")
@@ -574,7 +1034,7 @@ class MaiMaiPlugin:
         
         try:
             self.sender.reply("🔍 正在查询可领优惠券...")
-            client = MCPClient(active_account['data']['token'])
+            client = self.get_client(active_account['data']['token'])
             result = client.call_tool("available-coupons", {})
             formatted = self.format_tool_result(result)
             
@@ -611,15 +1071,86 @@ class MaiMaiPlugin:
         
         try:
             self.sender.reply("🎁 正在领取优惠券...")
-            client = MCPClient(active_account['data']['token'])
+            client = self.get_client(active_account['data']['token'])
             result = client.call_tool("auto-bind-coupons", {})
             formatted = self.format_tool_result(result)
             self.sender.reply(f"✅ 领券结果\n━━━━━━━━━━━━━━━\n\n{formatted}")
         except Exception as e:
             self.sender.reply(f"❌ 领取失败: {e}")
     
-    def query_my_coupons(self):
-        """查询我的优惠券"""
+    def claim_all_accounts(self):
+        """
+        为当前用户的所有账号同时领券，合并为一条消息回复
+        - 线程池限制同时领券的账号数，总耗时约等于最慢的账号
+        - 从开始起超过 CLAIM_ACCOUNT_TIMEOUT 仍未完成的账号（包括还在排队的）记为超时，不再等待；
+          截止时间同时传给 MCPClient，超时账号的请求也会在截止时失败，及时让出线程
+        """
+        user_data = self.get_user_data()
+        accounts = user_data.get("accounts") or {}
+        
+        if not accounts:
+            self.sender.reply("❌ 未配置账号\n\n发送「麦当劳管理」添加账号")
+            return
+        
+        try:
+            self.acquire_rate_limit()
+        except RateLimited as e:
+            self.sender.reply(f"❌ 领券失败: {e}")
+            return
+        
+        self.sender.reply(f"🎁 正在为 {len(accounts)} 个账号领券...")
+        begin = time.time()
+        deadline = begin + CLAIM_ACCOUNT_TIMEOUT
+        results = {}  # 账号名称 -> (状态, 内容)
+        
+        def claim(token):
+            client = MCPClient(token, self.store, timeout=(CONNECT_TIMEOUT, CLAIM_ACCOUNT_TIMEOUT),
+                               rate_limit=self.acquire_rate_limit, deadline=deadline)
+            return self.format_tool_result(client.call_tool("auto-bind-coupons", {}))
+        
+        pool = ThreadPoolExecutor(max_workers=min(CLAIM_ALL_WORKERS, len(accounts)))
+        futures = {}
+        try:
+            futures = {pool.submit(claim, account.get("token")): name for name, account in accounts.items()}
+            finished, pending = wait(futures, timeout=max(0, deadline - time.time()))
+            
+            for future in finished:
+                name = futures[future]
+                try:
+                    results[name] = ("success", future.result())
+                except Exception as e:
+                    results[name] = ("failed", str(e))
+            for future in pending:
+                results[futures[future]] = ("timeout", f"超过 {CLAIM_ACCOUNT_TIMEOUT} 秒未完成")
+        finally:
+            # 取消还在排队的账号，超时的请求仍在线程中运行（到截止时间后失败退出），不等待其结束
+            # （cancel_futures 参数需要 Python 3.9，这里逐个取消以兼容 3.6）
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=False)
+        
+        icons = {"success": "✅", "failed": "❌", "timeout": "⏱️"}
+        counts = {status: 0 for status in icons}
+        active_name = user_data.get("active_account")
+        message = "🎁 全部账号领券结果\n━━━━━━━━━━━━━━━\n"
+        for name, account in accounts.items():
+            status, content = results[name]
+            counts[status] += 1
+            label = account.get("label", name)
+            if name == active_name:
+                label += "（当前）"
+            message += f"\n{icons[status]} {label}\n{content}\n"
+        
+        message += "\n━━━━━━━━━━━━━━━\n"
+        message += (f"成功 {counts['success']} 个, 失败 {counts['failed']} 个, 超时 {counts['timeout']} 个, "
+                    f"耗时 {time.time() - begin:.1f} 秒")
+        self.sender.reply(message)
+    
+    def query_my_coupons(self, show_all=False):
+        """
+        查询我的优惠券
+        与上次查看相比只显示新增的优惠券；首次查看或 show_all 时显示完整列表
+        """
         active_account = self.get_active_account()
         
         if not active_account:
@@ -628,13 +1159,58 @@ class MaiMaiPlugin:
         
         try:
             self.sender.reply("🔍 正在查询我的优惠券...")
-            client = MCPClient(active_account['data']['token'])
+            client = self.get_client(active_account['data']['token'])
             result = client.call_tool("my-coupons", {})
-            formatted = self.format_tool_result(result)
-            self.sender.reply(f"🎫 我的优惠券\n━━━━━━━━━━━━━━━\n\n{formatted}")
+            entries = coupon_entries(result)
+            new_entries = self.diff_coupon_snapshot(client.token_key, "mine", entries)
+            
+            if show_all or new_entries is None or not entries:
+                formatted = self.format_tool_result(result)
+                self.sender.reply(f"🎫 我的优惠券\n━━━━━━━━━━━━━━━\n\n{formatted}")
+                return
+            
+            message = f"🎫 我的优惠券（共 {len(entries)} 项）\n━━━━━━━━━━━━━━━\n\n"
+            if new_entries:
+                message += f"🆕 新增 {len(new_entries)} 项:\n\n{format_coupon_entries(new_entries)}\n\n"
+            else:
+                message += "没有新增的优惠券\n\n"
+            message += f"其余 {len(entries) - len(new_entries)} 项与上次查看相同\n"
+            message += "💡 发送「麦当劳我的优惠券全部」查看完整列表"
+            self.sender.reply(message)
         except Exception as e:
             self.sender.reply(f"❌ 查询失败: {e}")
     
+    def diff_coupon_snapshot(self, token_key, kind, entries, save=True):
+        """
+        与账号上次保存的优惠券指纹比较
+        :param token_key: MCPClient.token_key
+        :param kind: 列表类型（available / mine）
+        :param entries: coupon_entries() 的结果
+        :param save: 是否同时保存本次的指纹
+        :return: 新增的条目列表；没有上次的记录时返回 None
+        """
+        snapshot = self.store.get(SNAPSHOT_BUCKET, f"{token_key}/{kind}")
+        seen = set(snapshot["fingerprints"]) if isinstance(snapshot, dict) else None
+        if save:
+            self.save_coupon_snapshot(token_key, kind, entries)
+        
+        if seen is None:
+            return None
+        return [(fingerprint, block) for fingerprint, block in entries if fingerprint not in seen]
+    
+    def save_coupon_snapshot(self, token_key, kind, entries):
+        """保存账号本次看到的优惠券指纹"""
+        self.store.set(SNAPSHOT_BUCKET, f"{token_key}/{kind}", {
+            "fingerprints": [fingerprint for fingerprint, _ in entries],
+            "date": datetime.now().strftime("%Y-%m-%d"),
+            "updated_at": int(time.time())
+        })
+    
+    def coupon_snapshot_date(self, token_key, kind):
+        """账号优惠券快照的保存日期（YYYY-MM-DD），没有快照时返回 None"""
+        snapshot = self.store.get(SNAPSHOT_BUCKET, f"{token_key}/{kind}")
+        return snapshot.get("date") if isinstance(snapshot, dict) else None
+    
     def enable_auto_claim(self):
         """开启自动领券"""
         active_account = self.get_active_account()
@@ -645,6 +1221,7 @@ class MaiMaiPlugin:
         
         user_data = self.get_user_data()
         user_data["auto_claim_enabled"] = True
+        self.update_registry(enrolled=True)
         self.save_user_data(user_data)
         self.sender.reply("✅ 自动领券已开启\n\n每天 09:00 自动领取优惠券")
     
@@ -652,9 +1229,35 @@ class MaiMaiPlugin:
         """关闭自动领券"""
         user_data = self.get_user_data()
         user_data["auto_claim_enabled"] = False
+        self.update_registry(enrolled=False)
         self.save_user_data(user_data)
         self.sender.reply("✅ 自动领券已关闭")
     
+    def show_overview(self):
+        """总览：账号状态、活动日历和我的优惠券，两个工具合并为一个批量请求"""
+        user_data = self.get_user_data()
+        active_account = self.get_active_account(user_data)
+        
+        if not active_account:
+            self.sender.reply("❌ 未配置账号\n\n发送「麦当劳管理」添加账号")
+            return
+        
+        try:
+            self.sender.reply("🔍 正在查询总览...")
+            client = self.get_client(active_account['data']['token'])
+            calendar, my_coupons = client.call_tools([("campaign-calender", {}), ("my-coupons", {})])
+            
+            message = "🍔 麦当劳总览\n━━━━━━━━━━━━━━━\n\n"
+            message += f"👤 当前账号: {active_account['data']['label']}\n"
+            message += f"🔄 自动领券: {'已开启 ✅' if user_data['auto_claim_enabled'] else '已关闭 ❌'}\n"
+            if user_data.get("last_claim_date"):
+                message += f"📅 上次领券: {user_data['last_claim_date']}\n"
+            message += f"\n📅 活动日历\n━━━━━━━━━━━━━━━\n{format_tool_result(calendar, OVERVIEW_SECTION_LENGTH)}\n"
+            message += f"\n🎫 我的优惠券\n━━━━━━━━━━━━━━━\n{format_tool_result(my_coupons, OVERVIEW_SECTION_LENGTH)}"
+            self.sender.reply(message)
+        except Exception as e:
+            self.sender.reply(f"❌ 查询失败: {e}")
+    
     def show_status(self):
         """查看账号状态"""
         active_account = self.get_active_account()
@@ -674,35 +1277,152 @@ class MaiMaiPlugin:
         
         self.sender.reply(message)
     
-    def handle_cron_task(self):
-        """处理定时任务"""
-        # 这里需要遍历所有用户，但 Python 插件可能无法获取所有用户
-        # 简化处理：只处理当前触发的用户
-        user_data = self.get_user_data()
+    def get_registry(self):
+        """读取自动领券用户索引"""
+        registry = self.store.get(REGISTRY_BUCKET, REGISTRY_KEY)
+        return registry if isinstance(registry, dict) else {}
+    
+    def update_registry(self, enrolled):
+        """把当前用户加入/移出自动领券索引（随 save_user_data 一起写入）"""
+        # 其他用户可能刚修改过索引，先丢弃缓存重新读取
+        self.store.invalidate(REGISTRY_BUCKET, REGISTRY_KEY)
+        registry = self.get_registry()
+        if enrolled:
+            registry[self.user_id] = {
+                "imtype": self.sender.getImtype(),
+                "group_id": self.sender.getGroupID() or ""
+            }
+        else:
+            registry.pop(self.user_id, None)
+        self.store.set(REGISTRY_BUCKET, REGISTRY_KEY, registry)
+    
+    def claim_for_account(self, token, deadline):
+        """
+        定时任务中为单个账号领券（在线程池中执行，只做网络请求和缓存读写）
+        先查询可领优惠券，与上次领券时的列表比较：
+        - 今天已经领过且没有新增时跳过领券（如进度未保存时的重复触发）
+        - 更早领过且没有新增时仍然领券（每天重新发放的优惠券内容相同），但不推送消息
+        :return: 推送内容；没有新优惠券时返回空字符串；超过时间上限时返回 None
+        """
+        if time.time() > deadline:
+            return None
+        time.sleep(random.uniform(0, CRON_JITTER))
+        client = MCPClient(token, self.store)
         
-        if not user_data.get("auto_claim_enabled"):
-            return
+        entries = coupon_entries(client.call_tool("available-coupons", {}))
+        new_entries = self.diff_coupon_snapshot(client.token_key, "available", entries, save=False)
+        today = datetime.now().strftime("%Y-%m-%d")
+        if new_entries == [] and self.coupon_snapshot_date(client.token_key, "available") == today:
+            return ""
+        
+        result = client.call_tool("auto-bind-coupons", {})
+        if isinstance(result, dict) and result.get("isError"):
+            raise Exception(self.format_tool_result(result))
+        # 领券成功后才记录，失败时下次仍会重试
+        self.save_coupon_snapshot(client.token_key, "available", entries)
         
+        if new_entries == []:
+            return ""
+        if new_entries is None:
+            formatted = self.format_tool_result(result)
+        else:
+            formatted = f"🆕 新上架 {len(new_entries)} 项:\n\n{format_coupon_entries(new_entries)}"
+        return f"🎁 自动领券成功\n━━━━━━━━━━━━━━━\n\n{formatted}"
+    
+    def push_message(self, entry, user_id, content):
+        """向用户推送消息"""
+        try:
+            middleware.push(entry.get("imtype", ""), entry.get("group_id", ""), user_id, "", content)
+        except Exception as e:
+            log.warning("推送失败", user_id=user_id, error=e)
+    
+    def handle_cron_task(self):
+        """
+        处理定时任务：为索引中所有开启自动领券的用户领券
+        - 线程池限制并发，每个账号领券前随机等待，避免集中请求 MCP 服务
+        - 当天进度保存在 CURSOR_KEY 中，超过时间上限或进程中断时由下一次触发继续
+        - 可领优惠券与上次领券时相同的账号不推送消息；当天已经领过的账号跳过领券
+        """
         today = datetime.now().strftime("%Y-%m-%d")
+        registry = self.get_registry()
         
-        if user_data.get("last_claim_date") == today:
-            return
+        # 兼容索引建立前开启自动领券的用户：触发定时任务的用户自动加入索引
+        if self.user_id and self.user_id not in registry and self.get_user_data().get("auto_claim_enabled"):
+            self.update_registry(enrolled=True)
+            registry = self.get_registry()
         
-        active_account = self.get_active_account()
-        if not active_account:
+        cursor = self.store.get(REGISTRY_BUCKET, CURSOR_KEY)
+        done = set(cursor["done"]) if isinstance(cursor, dict) and cursor.get("date") == today else set()
+        
+        # 筛选今天需要领券的用户
+        jobs = []
+        for user_id in sorted(registry):
+            if user_id in done:
+                continue
+            user_data = self.get_user_data(user_id)
+            active_account = self.get_active_account(user_data)
+            if (not user_data.get("auto_claim_enabled") or user_data.get("last_claim_date") == today
+                    or not active_account):
+                done.add(user_id)
+                continue
+            jobs.append((user_id, active_account['data']['token']))
+        
+        if not jobs:
+            self.save_cron_cursor(today, done)
             return
         
+        log.info("定时领券开始", pending=len(jobs), done=len(done))
+        deadline = time.time() + CRON_TIME_BUDGET
+        claimed = skipped = failed = 0
+        
+        with ThreadPoolExecutor(max_workers=CRON_CONCURRENCY) as pool:
+            futures = {pool.submit(self.claim_for_account, token, deadline): user_id for user_id, token in jobs}
+            for future in as_completed(futures):
+                user_id = futures[future]
+                entry = registry.get(user_id, {})
+                try:
+                    content = future.result()
+                    if content is None:
+                        # 超过时间上限，留给下一次触发
+                        continue
+                    if content:
+                        # 领券期间用户可能修改了账号：丢弃筛选时的缓存重新读取，只更新领券日期
+                        self.store.invalidate(BUCKET_NAME, user_id)
+                        user_data = self.get_user_data(user_id)
+                        user_data["last_claim_date"] = today
+                        self.store.set(BUCKET_NAME, user_id, user_data)
+                        self.push_message(entry, user_id, content)
+                        claimed += 1
+                    else:
+                        skipped += 1
+                except Exception as e:
+                    self.push_message(entry, user_id, f"❌ 自动领券失败: {e}")
+                    failed += 1
+                
+                done.add(user_id)
+                if (claimed + skipped + failed) % CURSOR_SAVE_EVERY == 0:
+                    self.save_cron_cursor(today, done)
+        
+        self.save_cron_cursor(today, done)
+        (log.warning if failed else log.info)("定时领券结束", claimed=claimed, skipped=skipped, failed=failed,
+                                              remaining=len([u for u in registry if u not in done]))
+    
+    def save_cron_cursor(self, today, done):
+        """保存当天定时任务进度"""
         try:
-            client = MCPClient(active_account['data']['token'])
-            result = client.call_tool("auto-bind-coupons", {})
-            formatted = self.format_tool_result(result)
-            
-            user_data["last_claim_date"] = today
-            self.save_user_data(user_data)
-            
-            self.sender.reply(f"🎁 自动领券成功\n━━━━━━━━━━━━━━━\n\n{formatted}")
+            self.store.set(REGISTRY_BUCKET, CURSOR_KEY, {"date": today, "done": sorted(done)})
+            self.store.flush()
+        except Exception as e:
+            log.error("保存定时任务进度失败", error=e)
+    
+    def flush_storage(self):
+        """写回本次调用中尚未保存的修改"""
+        try:
+            self.store.flush()
         except Exception as e:
-            self.sender.reply(f"❌ 自动领券失败: {e}")
+            self.sender.reply(f"❌ {e}")
+        log.debug("存储统计", summary=self.store.summary)
+        log.debug("连接统计", summary=get_transport().summary)
     
     def run(self):
         """主程序入口"""
@@ -712,6 +1432,11 @@ class MaiMaiPlugin:
                 self.handle_cron_task()
                 return
             
+            # 对话中的回复
+            if re.match(DIALOG_REPLY_PATTERN, self.message):
+                self.resume_dialog()
+                return
+            
             # 命令路由
             if self.message == "麦当劳":
                 self.show_main_menu()
@@ -725,19 +1450,27 @@ class MaiMaiPlugin:
                 self.query_available_coupons()
             elif self.message == "麦当劳领券":
                 self.auto_bind_coupons()
+            elif self.message == "麦当劳全部领券":
+                self.claim_all_accounts()
             elif self.message == "麦当劳我的优惠券":
                 self.query_my_coupons()
+            elif self.message == "麦当劳我的优惠券全部":
+                self.query_my_coupons(show_all=True)
             elif self.message == "麦当劳开启自动领券":
                 self.enable_auto_claim()
             elif self.message == "麦当劳关闭自动领券":
                 self.disable_auto_claim()
             elif self.message == "麦当劳状态":
                 self.show_status()
+            elif self.message == "麦当劳总览":
+                self.show_overview()
             else:
                 self.sender.reply("❓ 未识别的命令\n\n💡 发送「麦当劳帮助」查看使用说明")
         
         except Exception as e:
             self.sender.reply(f"❌ 插件执行错误: {e}")
+        finally:
+            self.flush_storage()
 
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 # [disable:false]
 # [rule: ^(性格测试.*|[IE][NS][TF][JP])$]
+# [rule: ^[yYnNqQaAbB]$]
 # [admin: false]
 # [price: 0.00]
 # [version: 1.2.0]
@@ -22,13 +23,23 @@ autMan 插件 - MBTI性格测试
 
 import middleware
 import time
-import json
+import re
 from datetime import datetime
+import os
+import sys
+
+# 共享模块：部署时与插件放在同一目录，仓库中位于 common/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from autman_storage import get_store
+from autman_dialog import Dialog, chat_of
+from autman_log import get_logger
 
 # 配置常量
 BUCKET_NAME = "personality_test"
 VERSION = "v1.2.0"
 INPUT_TIMEOUT = 60000  # 60秒超时
+DIALOG_REPLY_PATTERN = r'^[yYnNqQaAbB]$'  # 对话中的回复，与头部 rule 保持一致
+log = get_logger("性格测试插件")
 
 
 # MBTI测试题目 - 每个维度4道题
@@ -389,6 +400,7 @@ class PersonalityTestPlugin:
         """初始化插件"""
         sender_id = middleware.getSenderID()
         self.sender = middleware.Sender(sender_id)
+        self.store = get_store()
         self.user_id = self.sender.getUserID()
         try:
             self.username = self.user_id
@@ -396,6 +408,7 @@ class PersonalityTestPlugin:
             self.username = self.user_id
         self.imtype = self.sender.getImtype()
         self.message = self.sender.getMessage().strip()
+        self.dialog = Dialog(self.store, BUCKET_NAME, self.user_id, chat_of(self.sender))
     
     def get_user_confirmation(self, prompt):
         """
@@ -439,17 +452,12 @@ class PersonalityTestPlugin:
         获取用户的所有记录
         :return: 记录列表
         """
-        try:
-            data = middleware.bucketGet(BUCKET_NAME, self.user_id)
-            if not data or data == '':
-                return []
-            
-            records = json.loads(data)
-            # 按时间戳降序排序
-            records.sort(key=lambda x: x['timestamp'], reverse=True)
-            return records
-        except Exception as e:
+        records = self.store.get(BUCKET_NAME, self.user_id, [])
+        if not isinstance(records, list):
             return []
+        # 按时间戳降序排序
+        records.sort(key=lambda x: x['timestamp'], reverse=True)
+        return records
     
     def save_user_records(self, records):
         """
@@ -457,8 +465,8 @@ class PersonalityTestPlugin:
         :param records: 记录列表
         """
         try:
-            data = json.dumps(records, ensure_ascii=False)
-            middleware.bucketSet(BUCKET_NAME, self.user_id, data)
+            self.store.set(BUCKET_NAME, self.user_id, records)
+            self.store.flush()
         except Exception as e:
             self.sender.reply(f"❌ 保存失败：{e}")
     
@@ -542,56 +550,56 @@ class PersonalityTestPlugin:
         return result
     
     def start_test(self):
-        """开始性格测试"""
-        # 第一步：获取确认
-        confirmation = self.get_user_confirmation("🧠 欢迎参加MBTI性格测试！\n\n本测试包含16道题，每题选择A或B。\n请根据第一直觉作答，无对错之分。\n\n确认开始测试吗？")
-        
-        if not confirmation:
+        """开始性格测试（第一步：确认，回复由 resume_dialog 处理）"""
+        self.sender.reply("🧠 欢迎参加MBTI性格测试！\n\n本测试包含16道题，每题选择A或B。\n请根据第一直觉作答，无对错之分。\n\n确认开始测试吗？\n\n请输入：\n  y - 确认\n  n - 取消\n  q - 退出")
+        self.dialog.save("test_confirm")
+    
+    def ask_question(self, answers):
+        """显示下一道题，并保存已作答的答案"""
+        i = len(answers) + 1
+        question = QUESTIONS[i - 1]
+        question_text = f"📝 第{i}/16题\n\n"
+        question_text += f"{question['question']}\n\n"
+        question_text += f"A. {question['options']['A']}\n"
+        question_text += f"B. {question['options']['B']}\n\n"
+        question_text += "请输入 A 或 B（输入 q 退出测试）："
+        
+        self.sender.reply(question_text)
+        self.dialog.save("test_question", {"answers": answers})
+    
+    def on_test_confirm(self, confirmation):
+        """测试流程：处理确认回复"""
+        if confirmation == "y":
+            # 开始答题
+            self.ask_question([])
             return
         
+        self.dialog.clear()
         if confirmation == "q":
             self.sender.reply("👋 已退出测试")
+        elif confirmation == "n":
+            self.sender.reply("❌ 已取消测试")
+        else:
+            self.sender.reply("❓ 无效的输入，已取消测试")
+    
+    def on_test_answer(self, answer, answers):
+        """测试流程：记录一道题的答案，答完16题后计算结果"""
+        if answer == "Q":
+            self.dialog.clear()
+            self.sender.reply("👋 已退出测试")
             return
         
-        if confirmation == "n":
-            self.sender.reply("❌ 已取消测试")
+        if answer not in ["A", "B"]:
+            self.dialog.clear()
+            self.sender.reply("❌ 无效的选项，测试已取消\n\n💡 请输入 A 或 B")
             return
         
-        if confirmation != "y":
-            self.sender.reply("❓ 无效的输入，已取消测试")
+        answers = answers + [answer]
+        if len(answers) < len(QUESTIONS):
+            self.ask_question(answers)
             return
         
-        # 开始答题
-        answers = []
-        
-        for i, question in enumerate(QUESTIONS, 1):
-            # 显示题目
-            question_text = f"📝 第{i}/16题\n\n"
-            question_text += f"{question['question']}\n\n"
-            question_text += f"A. {question['options']['A']}\n"
-            question_text += f"B. {question['options']['B']}\n\n"
-            question_text += "请输入 A 或 B（输入 q 退出测试）："
-            
-            self.sender.reply(question_text)
-            
-            # 等待用户输入
-            user_input = self.sender.listen(INPUT_TIMEOUT)
-            
-            if user_input is None:
-                self.sender.reply("⏱️ 操作超时，测试已取消")
-                return
-            
-            answer = user_input.strip().upper()
-            
-            if answer == "Q":
-                self.sender.reply("👋 已退出测试")
-                return
-            
-            if answer not in ["A", "B"]:
-                self.sender.reply("❌ 无效的选项，测试已取消\n\n💡 请输入 A 或 B")
-                return
-            
-            answers.append(answer)
+        self.dialog.clear()
         
         # 计算结果
         personality_type, scores = self.calculate_personality_type(answers)
@@ -617,6 +625,25 @@ class PersonalityTestPlugin:
         result_text = self.format_test_result(personality_type, scores)
         self.sender.reply(result_text)
     
+    def resume_dialog(self):
+        """
+        处理对话中的回复（y/n/q、A/B）
+        没有进行中的对话时静默退出，对话已超时则提示
+        """
+        state = self.dialog.load()
+        if state is None:
+            if self.dialog.expired:
+                self.sender.reply("⏱️ 操作超时，测试已取消")
+            return
+        
+        step = state["step"]
+        if step == "test_confirm":
+            self.on_test_confirm(self.message.lower())
+        elif step == "test_question":
+            self.on_test_answer(self.message.upper(), state["data"].get("answers", []))
+        else:
+            self.dialog.clear()
+    
     def view_records(self):
         """查看历史记录"""
         records = self.get_user_records()
@@ -770,9 +797,22 @@ class PersonalityTestPlugin:
         
         self.sender.reply(result)
     
+    def flush_storage(self):
+        """写回本次调用中尚未保存的修改"""
+        try:
+            self.store.flush()
+        except Exception as e:
+            self.sender.reply(f"❌ {e}")
+        log.debug("存储统计", summary=self.store.summary)
+    
     def run(self):
         """主程序入口"""
         try:
+            # 对话中的回复
+            if re.match(DIALOG_REPLY_PATTERN, self.message):
+                self.resume_dialog()
+                return
+            
             # 路由到对应功能
             if self.message == "性格测试帮助":
                 self.show_help()
@@ -797,6 +837,8 @@ class PersonalityTestPlugin:
         
         except Exception as e:
             self.sender.reply(f"❌ 插件执行错误：{e}")
+        finally:
+            self.flush_storage()
 
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 # [disable:false]
 # [rule: ^便便(.*)$]
+# [rule: ^[yYnNqQa-eA-E]$]
 # [admin: false]
 # [price: 0.00]
 # [version: 1.5.2]
@@ -20,6 +21,7 @@ autMan 插件 - 便便记录
 - 便便记录：查看所有历史记录
 - 便便删除：删除指定的历史记录
 - 便便分析：AI分析便便健康状况（需配置智谱AI）
+- 便便重建统计：重新计算聚合统计数据
 - 便便帮助：显示帮助信息
 
 配置说明：
@@ -31,78 +33,127 @@ autMan 插件 - 便便记录
 import middleware
 import time
 import json
-import requests
+import hashlib
+import re
 from datetime import datetime
+from urllib.parse import urlparse
+import os
+import sys
+
+# 共享模块：部署时与插件放在同一目录，仓库中位于 common/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from autman_storage import get_store, insert_by_timestamp, records_since, remove_by_timestamp
+from autman_stats import RecordAggregator, SNAPSHOT_VERSION
+from autman_dialog import Dialog, chat_of
+from autman_http import get_transport, iter_sse_events
+from autman_resilience import (RETRYABLE_STATUS, CircuitOpenError, RetryableHTTPError,
+                               call_with_resilience, get_breaker)
+from autman_ratelimit import RateLimiter, RateLimited
+from autman_log import Excerpt, Secret, get_logger
 
 # 配置常量
 BUCKET_NAME = "poop"
 VERSION = "v1.5.2"
 INPUT_TIMEOUT = 60000  # 60秒超时
+DIALOG_REPLY_PATTERN = r'^[yYnNqQa-eA-E]$'  # 对话中的回复，与头部 rule 保持一致
+ZHIPU_API_URL = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
+DEFAULT_MODEL = "glm-4-flash"
+# 插件配置（智谱AI）可能的位置：(桶名, key 前缀)，按顺序查找第一个有密钥的
+CONFIG_LOCATIONS = [
+    ("otto", "便便."),
+    ("poop", "便便."),
+    ("便便", "便便."),
+    ("otto", ""),
+    ("poop", ""),
+    ("便便", ""),
+]
+CONFIG_CACHE_KEY = "_config"   # BUCKET_NAME 中记住找到配置的位置（桶名和 key 前缀，不含取值）
+CONFIG_CACHE_VERSION = 2       # CONFIG_LOCATIONS 或记录格式变化时加 1，旧记录自动失效
+AUTH_ERROR_STATUS = (401, 403)  # 智谱AI返回这些状态码时密钥无效，重新查找配置
+# AI 分析限流（每分钟补充的令牌数 / 最多积累的令牌数），超过时直接拒绝
+AI_USER_PER_MINUTE = 0.2    # 每个用户平均 5 分钟一次
+AI_USER_BURST = 2
+AI_GLOBAL_PER_MINUTE = 10   # 所有用户合计
+AI_GLOBAL_BURST = 5
+# AI 分析结果缓存：数据摘要、模型和提示词都没有变化时直接返回上次的报告
+AI_CACHE_BUCKET = "poop_ai_cache"
+AI_CACHE_TTL = 24 * 3600      # 缓存有效期（秒）
+AI_CACHE_MAX_ENTRIES = 200    # 最多保存的报告数，超过时淘汰最久未使用的
+# 流式接收AI回复，按句子边界分段转发到聊天；False 时等待完整结果后一次性发送
+AI_STREAM = True
+STREAM_FLUSH_MIN_CHARS = 80   # 第一段之后，累计到句末且不少于这么多字符才发送一段，避免刷屏
+STREAM_FLUSH_MAX_CHARS = 300  # 一直没有句末时，累计到这么多字符强制发送
+SENTENCE_END_PATTERN = re.compile(r'[。！？!?；\n]')
+ANALYSIS_REPORT_HEADER = "🏥 便便健康分析报告\n\n━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+log = get_logger("便便插件")
+ai_log = get_logger("ZhipuAI")
+PROCESS_MAP = {
+    "A": "通畅 😊",
+    "B": "一般 😐",
+    "C": "费劲 😣",
+    "D": "拉稀 💧",
+    "E": "用药 💊"
+}
 
 
-class ZhipuAI:
-    """智谱AI API 封装类"""
-    
-    def __init__(self, api_key, model="glm-4-flash"):
-        self.api_key = api_key
-        self.model = model
-        self.api_url = "https://open.bigmodel.cn/api/paas/v4/chat/completions"
-    
-    def analyze_poop_health(self, records, custom_prompt=""):
+class PoopSummary:
+    """
+    AI分析用的数据摘要，由聚合快照一次构建
+
+    同一个对象用于给用户预览、替换提示词中的 {data} 和计算缓存 key，三者内容一致：
+    - first_date / last_date / date_span：记录时段
+    - total / avg_freq：总次数和平均频率（按跨度天数）
+    - distribution：[(状态, 次数, 百分比)]
+    - text：格式化后的摘要文本
+    """
+
+    TITLE = "便便记录完整数据："
+
+    def __init__(self, aggregates):
         """
-        分析便便健康状况
-        :param records: 便便记录列表
-        :param custom_prompt: 自定义提示词
-        :return: AI分析结果
+        :param aggregates: 全部记录的聚合统计（PoopAggregates）
         """
-        # 准备数据摘要
-        from collections import Counter
-        from datetime import datetime as dt, timedelta
-        
-        # 使用全部记录进行分析
-        if not records:
-            return "暂无记录，无法进行分析。"
-        
-        # 统计状态分布
-        status_list = []
-        for record in records:
-            if 'process_desc' in record:
-                status = record['process_desc'].split()[0] if record['process_desc'] else "未知"
-            else:
-                status = "未知"
-            status_list.append(status)
-        
-        status_dist = Counter(status_list)
-        total_count = len(records)
-        
-        # 计算时间跨度和平均频率
-        dates = sorted(set([r['datetime'].split(' ')[0] for r in records]))
-        first_date = dates[0]
-        last_date = dates[-1]
-        date_span = (dt.strptime(last_date, '%Y-%m-%d') - dt.strptime(first_date, '%Y-%m-%d')).days + 1
-        avg_freq = total_count / date_span if date_span > 0 else total_count
-        
-        # 构建数据摘要
-        data_summary = f"便便记录完整数据：\n"
-        data_summary += f"- 记录时段：{first_date} 至 {last_date} (共{date_span}天)\n"
-        data_summary += f"- 总次数：{total_count}次\n"
-        data_summary += f"- 平均频率：{avg_freq:.2f}次/天\n"
-        data_summary += f"- 状态分布：\n"
-        for status, count in status_dist.items():
-            percent = count / total_count * 100
-            data_summary += f"  • {status}：{count}次 ({percent:.1f}%)\n"
-        
-        # 构建提示词
-        if custom_prompt:
-            # 如果自定义提示词包含{data}占位符,则替换
-            if "{data}" in custom_prompt:
-                prompt = custom_prompt.replace("{data}", data_summary)
-            else:
-                # 如果没有占位符,强制在开头添加数据摘要
-                prompt = f"{data_summary}\n\n{custom_prompt}"
-                print(f"[ZhipuAI] ⚠️ 自定义提示词未包含{{data}}占位符,已自动添加数据摘要")
-        else:
-            prompt = f"""你是一位专业的健康顾问，请根据以下便便记录数据进行健康分析：
+        self.first_date = aggregates.first_date
+        self.last_date = aggregates.last_date
+        self.date_span = aggregates.date_span
+        self.total = aggregates.total
+        self.avg_freq = self.total / self.date_span if self.date_span > 0 else self.total
+        self.distribution = [
+            (status, aggregates.categories[status], percent)
+            for status, percent in aggregates.category_percent().items()
+        ]
+        self.text = self._format()
+
+    def _format(self):
+        summary = f"{self.TITLE}\n"
+        summary += f"- 记录时段：{self.first_date} 至 {self.last_date} (共{self.date_span}天)\n"
+        summary += f"- 总次数：{self.total}次\n"
+        summary += f"- 平均频率：{self.avg_freq:.2f}次/天\n"
+        summary += f"- 状态分布：\n"
+        for status, count, percent in self.distribution:
+            summary += f"  • {status}：{count}次 ({percent:.1f}%)\n"
+        return summary
+
+    def __str__(self):
+        return self.text
+
+
+def build_analysis_prompt(summary, custom_prompt=""):
+    """
+    构建发送给AI的提示词
+    :param summary: 数据摘要（PoopSummary）
+    :param custom_prompt: 自定义提示词，{data} 会被替换为数据摘要
+    :return: 提示词
+    """
+    data_summary = summary.text
+    if custom_prompt:
+        # 如果自定义提示词包含{data}占位符,则替换
+        if "{data}" in custom_prompt:
+            return custom_prompt.replace("{data}", data_summary)
+        # 如果没有占位符,强制在开头添加数据摘要
+        ai_log.warning("自定义提示词未包含{data}占位符，已自动添加数据摘要")
+        return f"{data_summary}\n\n{custom_prompt}"
+    return f"""你是一位专业的健康顾问，请根据以下便便记录数据进行健康分析：
 
 {data_summary}
 
@@ -116,47 +167,512 @@ class ZhipuAI:
 - 控制在250字以内
 - 给出实用的建议
 - 如有异常情况，建议就医"""
+
+
+def analysis_cache_key(summary, model, prompt):
+    """AI分析缓存的 key：数据摘要（PoopSummary）、模型和提示词的哈希，任何一项变化都不会命中旧报告"""
+    content = json.dumps([summary.text, model, prompt], ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:32]
+
+
+class AnalysisCache:
+    """
+    AI分析报告缓存（按内容寻址，所有用户共享）
+
+    存储结构（桶 AI_CACHE_BUCKET）：
+    - <哈希>：{"report": 报告, "model": 模型, "created_at": 生成时间}
+    - index：{哈希: 最近使用时间}，用于过期清理和按最久未使用淘汰
+    """
+
+    INDEX_KEY = "index"
+
+    def __init__(self, store, ttl=AI_CACHE_TTL, max_entries=AI_CACHE_MAX_ENTRIES):
+        self.store = store
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+    def _index(self):
+        index = self.store.get(AI_CACHE_BUCKET, self.INDEX_KEY)
+        return dict(index) if isinstance(index, dict) else {}
+
+    def get(self, key):
+        """
+        读取缓存的报告
+        :return: 缓存条目，未命中或已过期时返回 None
+        """
+        entry = self.store.get(AI_CACHE_BUCKET, key)
+        index = self._index()
+        if not isinstance(entry, dict) or time.time() - entry.get("created_at", 0) > self.ttl:
+            if entry is not None or key in index:
+                self.store.delete(AI_CACHE_BUCKET, key)
+                index.pop(key, None)
+                self.store.set(AI_CACHE_BUCKET, self.INDEX_KEY, index)
+            return None
+        index[key] = int(time.time())
+        self.store.set(AI_CACHE_BUCKET, self.INDEX_KEY, index)
+        return entry
+
+    def put(self, key, report, model):
+        """保存报告，并清理过期条目、淘汰超出上限的最久未使用条目"""
+        now = int(time.time())
+        self.store.set(AI_CACHE_BUCKET, key, {"report": report, "model": model, "created_at": now})
+        index = self._index()
+        index[key] = now
+        # 最近使用时间早于有效期的条目一定已过期（生成时间不晚于使用时间）
+        stale = [k for k, used in index.items() if now - used > self.ttl]
+        overflow = len(index) - len(stale) - self.max_entries
+        if overflow > 0:
+            live = sorted((used, k) for k, used in index.items() if now - used <= self.ttl)
+            stale += [k for _, k in live[:overflow]]
+        for stale_key in stale:
+            self.store.delete(AI_CACHE_BUCKET, stale_key)
+            index.pop(stale_key, None)
+        self.store.set(AI_CACHE_BUCKET, self.INDEX_KEY, index)
+
+
+class StreamFlusher:
+    """
+    把流式收到的文本按句子边界分段转发
+    - 第一句完整后立即发送，等待时间只取决于第一句的生成速度
+    - 之后累计到句末且不少于 min_chars 个字符时发送一段
+    - 一直没有句末时，累计到 max_chars 个字符强制发送
+    """
+
+    def __init__(self, on_flush, min_chars=STREAM_FLUSH_MIN_CHARS, max_chars=STREAM_FLUSH_MAX_CHARS):
+        """
+        :param on_flush: 发送一段文本的函数
+        :param min_chars: 第一段之后每段的最少字符数
+        :param max_chars: 没有句末时强制发送的字符数
+        """
+        self.on_flush = on_flush
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.pending = ""
+        self.flushed = 0            # 已发送的段数
+        self.first_flush_at = None  # 第一段的发送时间
+
+    def _emit(self, text):
+        text = text.strip()
+        if not text:
+            return
+        if self.first_flush_at is None:
+            self.first_flush_at = time.time()
+        self.flushed += 1
+        self.on_flush(text)
+
+    def feed(self, text):
+        """追加收到的文本，凑够一段时发送"""
+        self.pending += text
+        while self.pending:
+            min_chars = self.min_chars if self.flushed else 1
+            boundary = 0
+            for match in SENTENCE_END_PATTERN.finditer(self.pending):
+                boundary = match.end()
+            if boundary and boundary >= min_chars:
+                chunk, self.pending = self.pending[:boundary], self.pending[boundary:]
+            elif len(self.pending) >= self.max_chars:
+                chunk, self.pending = self.pending[:self.max_chars], self.pending[self.max_chars:]
+            else:
+                break
+            self._emit(chunk)
+
+    def close(self):
+        """发送剩余的文本"""
+        self._emit(self.pending)
+        self.pending = ""
+
+
+class ZhipuAuthError(Exception):
+    """智谱AI密钥无效或无权限（HTTP 401/403）"""
+
+
+class ZhipuAI:
+    """智谱AI API 封装类"""
+    
+    def __init__(self, api_key, model="glm-4-flash"):
+        self.api_key = api_key
+        self.model = model
+        self.api_url = ZHIPU_API_URL
+    
+    def _log_prompt(self, prompt):
+        """调试日志：提示词只输出开头和长度"""
+        ai_log.debug("准备调用 API", model=self.model, prompt_length=len(prompt), prompt=Excerpt(prompt, 200))
+    
+    def _send(self, prompt, stream=False):
+        """
+        发送 chat/completions 请求（连接失败和 429/5xx 退避重试；持续失败时熔断，冷却期内直接失败）
+        :param prompt: 提示词
+        :param stream: 是否请求流式（SSE）响应，此时响应使用完需要 close()
+        :return: requests.Response
+        """
+        payload = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}]
+        }
+        if stream:
+            payload["stream"] = True
         
-        # 调试日志：输出数据摘要
-        print(f"[ZhipuAI] ========== 数据摘要 ==========")
-        print(data_summary)
-        print(f"[ZhipuAI] ========== 完整提示词 ==========")
-        print(prompt)
-        print(f"[ZhipuAI] ========== 开始调用 API ==========")
-        print(f"[ZhipuAI] 准备调用 API")
-        print(f"[ZhipuAI] 模型: {self.model}")
-        print(f"[ZhipuAI] 提示词长度: {len(prompt)}")
-        
-        try:
-            print(f"[ZhipuAI] 发送 POST 请求到: {self.api_url}")
-            response = requests.post(
+        def send():
+            response = get_transport().post(
                 self.api_url,
                 headers={
                     "Authorization": f"Bearer {self.api_key}",
                     "Content-Type": "application/json"
                 },
-                json={
-                    "model": self.model,
-                    "messages": [{"role": "user", "content": prompt}]
-                },
-                timeout=30
+                json=payload,
+                stream=stream
             )
-            
-            print(f"[ZhipuAI] 响应状态码: {response.status_code}")
+            if response.status_code in RETRYABLE_STATUS:
+                response.close()
+                raise RetryableHTTPError(response.status_code)
+            return response
+        
+        ai_log.debug("发送 POST 请求", url=self.api_url, stream=stream)
+        return call_with_resilience(get_breaker(urlparse(self.api_url).netloc), send)
+    
+    def analyze_poop_health(self, prompt):
+        """
+        分析便便健康状况（等待完整结果）
+        :param prompt: 提示词（见 build_analysis_prompt）
+        :return: AI分析结果
+        """
+        self._log_prompt(prompt)
+        try:
+            response = self._send(prompt)
+            ai_log.debug("收到响应", status=response.status_code)
             
             if response.status_code == 200:
                 data = response.json()
-                print(f"[ZhipuAI] 响应数据: {data.keys() if isinstance(data, dict) else 'not dict'}")
                 if data.get('choices'):
                     result = data['choices'][0]['message']['content']
-                    print(f"[ZhipuAI] 成功获取分析结果，长度: {len(result)}")
+                    ai_log.debug("成功获取分析结果", length=len(result))
                     return result
             
-            print(f"[ZhipuAI] API 调用失败，响应内容: {response.text[:200]}")
+            ai_log.warning("API 调用失败", status=response.status_code, body=Excerpt(response.text, 200))
+            if response.status_code in AUTH_ERROR_STATUS:
+                raise ZhipuAuthError(f"智谱AI调用失败: {response.text}")
             raise Exception(f"智谱AI调用失败: {response.text}")
+        except ZhipuAuthError:
+            raise
+        except CircuitOpenError as e:
+            ai_log.warning("熔断中，跳过请求", error=e)
+            raise Exception(f"智谱AI调用失败: {e}")
+        except Exception as e:
+            ai_log.error("调用异常", error=e)
+            raise Exception(f"智谱AI调用失败: {e}")
+    
+    def stream_poop_health(self, prompt, on_text):
+        """
+        流式分析便便健康状况：逐块读取 SSE 响应，按句子边界把已生成的内容交给 on_text
+        :param prompt: 提示词（见 build_analysis_prompt）
+        :param on_text: 收到一段完整内容时调用，参数为该段文本（见 StreamFlusher）
+        :return: 完整的AI分析结果（用于缓存）
+        """
+        self._log_prompt(prompt)
+        start = time.time()
+        response = None
+        try:
+            response = self._send(prompt, stream=True)
+            ai_log.debug("收到响应", status=response.status_code)
+            if response.status_code != 200:
+                ai_log.warning("API 调用失败", status=response.status_code, body=Excerpt(response.text, 200))
+                if response.status_code in AUTH_ERROR_STATUS:
+                    raise ZhipuAuthError(f"智谱AI调用失败: {response.text}")
+                raise Exception(response.text)
+            
+            flusher = StreamFlusher(on_text)
+            parts = []
+            for event_data in iter_sse_events(response):
+                if event_data.strip() == "[DONE]":
+                    break
+                data = json.loads(event_data)
+                if data.get("error"):
+                    raise Exception(data["error"])
+                choices = data.get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    parts.append(content)
+                    flusher.feed(content)
+            flusher.close()
+            
+            result = "".join(parts).strip()
+            if not result:
+                raise Exception("没有返回分析内容")
+            ai_log.info("流式接收完成", length=len(result), segments=flusher.flushed,
+                        first_segment=f"{flusher.first_flush_at - start:.1f}s" if flusher.first_flush_at else "-",
+                        elapsed=f"{time.time() - start:.1f}s")
+            return result
+        except ZhipuAuthError:
+            raise
+        except CircuitOpenError as e:
+            ai_log.warning("熔断中，跳过请求", error=e)
+            raise Exception(f"智谱AI调用失败: {e}")
         except Exception as e:
-            print(f"[ZhipuAI] 异常: {str(e)}")
+            ai_log.error("调用异常", error=e)
             raise Exception(f"智谱AI调用失败: {e}")
+        finally:
+            if response is not None:
+                response.close()
+
+
+class PoopAggregates(RecordAggregator):
+    """
+    便便记录的增量聚合快照（分类为便便状态，见 RecordAggregator）
+
+    随每次新增/删除记录增量更新，统计页面直接读取而无需扫描历史记录：
+    - total：总次数
+    - days：每天各状态次数 {日期: {状态: 次数}}
+    - categories：各状态总次数
+    - first_date / last_date：最早/最晚记录日期
+    - freq_hist：每天次数的分布 {每天次数: 天数}
+    """
+
+    def __init__(self, data=None, recent_since=None):
+        super().__init__(self.status_of, recent_since, data, category_field="process_desc")
+
+    @staticmethod
+    def status_of(record):
+        """提取记录的状态（如"通畅"）"""
+        if record.get('process_desc'):
+            return record['process_desc'].split()[0]
+        return "未知"
+
+    @classmethod
+    def rebuild(cls, records, recent_since=None):
+        """扫描一遍记录重新计算"""
+        return cls(recent_since=recent_since).feed(records)
+
+
+class PoopRecordStore:
+    """
+    按月分片的便便记录存储
+
+    存储结构（桶 BUCKET_NAME）：
+    - <用户ID>/manifest：清单，记录已有月份和总条数
+    - <用户ID>/YYYY-MM：当月记录，按时间戳升序排列
+    - <用户ID>/stats：聚合快照（见 PoopAggregates）
+    - <用户ID>：旧版单键存储，首次访问时自动迁移到分片
+    """
+
+    def __init__(self, user_id, store):
+        self.user_id = user_id
+        self.store = store
+
+    def _manifest_key(self):
+        return f"{self.user_id}/manifest"
+
+    def _shard_key(self, month):
+        return f"{self.user_id}/{month}"
+
+    def _stats_key(self):
+        return f"{self.user_id}/stats"
+
+    @staticmethod
+    def month_of(record):
+        """记录所属月份（YYYY-MM）"""
+        return record['datetime'][:7]
+
+    def manifest(self):
+        """读取清单，不存在时尝试迁移旧版数据"""
+        manifest = self.store.get(BUCKET_NAME, self._manifest_key())
+        if manifest is None:
+            manifest = self._migrate_legacy()
+        return manifest
+
+    def _migrate_legacy(self):
+        """把旧版单键记录拆分到按月分片"""
+        manifest = {"version": 2, "months": [], "count": 0}
+        legacy = self.store.get(BUCKET_NAME, self.user_id)
+        if not legacy:
+            return manifest
+
+        shards = {}
+        for record in legacy:
+            shards.setdefault(self.month_of(record), []).append(record)
+
+        for month, records in shards.items():
+            records.sort(key=lambda x: x['timestamp'])
+            self.store.set(BUCKET_NAME, self._shard_key(month), records)
+
+        manifest["months"] = sorted(shards.keys())
+        manifest["count"] = len(legacy)
+        self.store.set(BUCKET_NAME, self._manifest_key(), manifest)
+        self.store.delete(BUCKET_NAME, self.user_id)
+        log.info("已迁移旧记录到月度分片", records=len(legacy), shards=len(shards))
+        return manifest
+
+    def count(self):
+        """记录总数（只读清单）"""
+        return self.manifest()["count"]
+
+    def months(self):
+        """已有记录的月份（升序）"""
+        return list(self.manifest()["months"])
+
+    def load_month(self, month):
+        """读取单个月份分片"""
+        return self.store.get(BUCKET_NAME, self._shard_key(month), [])
+
+    def load_since(self, timestamp):
+        """
+        读取 timestamp 之后的记录（升序）
+        只读取覆盖该时段的分片，并用二分查找截取窗口
+        """
+        month = datetime.fromtimestamp(timestamp).strftime('%Y-%m')
+        return records_since(self.load_since_month(month), timestamp)
+
+    def load_since_month(self, month):
+        """读取指定月份及之后的记录（升序），更早的分片不会被读取"""
+        records = []
+        for m in self.months():
+            if m >= month:
+                records.extend(self.load_month(m))
+        return records
+
+    def load_all(self):
+        """读取全部记录（升序）"""
+        records = []
+        for month in self.months():
+            records.extend(self.load_month(month))
+        return records
+
+    def aggregates(self):
+        """读取聚合快照，缺失、版本过旧或与清单条数不一致时自动重建"""
+        data = self.store.get(BUCKET_NAME, self._stats_key())
+        if data is not None and data.get("version") == SNAPSHOT_VERSION and data.get("total") == self.count():
+            return PoopAggregates(data)
+        return self.rebuild_aggregates()
+
+    def rebuild_aggregates(self):
+        """扫描全部分片重建聚合快照"""
+        aggregates = PoopAggregates.rebuild(self.load_all())
+        self.store.set(BUCKET_NAME, self._stats_key(), aggregates.to_dict())
+        return aggregates
+
+    def _update_aggregates(self, record, added):
+        data = self.store.get(BUCKET_NAME, self._stats_key())
+        if data is None or data.get("version") != SNAPSHOT_VERSION:
+            # 快照不存在或版本过旧时下次读取会重建
+            return
+        aggregates = PoopAggregates(data)
+        if added:
+            aggregates.add(record)
+        else:
+            aggregates.remove(record)
+        self.store.set(BUCKET_NAME, self._stats_key(), aggregates.to_dict())
+
+    def append(self, record):
+        """追加一条记录，只写入当月分片和清单"""
+        manifest = self.manifest()
+        month = self.month_of(record)
+        shard = self.load_month(month)
+        insert_by_timestamp(shard, record)
+        self.store.set(BUCKET_NAME, self._shard_key(month), shard)
+
+        if month not in manifest["months"]:
+            manifest["months"].append(month)
+            manifest["months"].sort()
+        manifest["count"] += 1
+        self.store.set(BUCKET_NAME, self._manifest_key(), manifest)
+        self._update_aggregates(record, added=True)
+
+    def remove(self, record):
+        """删除一条记录，只改写其所在月份分片和清单"""
+        manifest = self.manifest()
+        month = self.month_of(record)
+        shard = self.load_month(month)
+        if not remove_by_timestamp(shard, record):
+            return False
+
+        if shard:
+            self.store.set(BUCKET_NAME, self._shard_key(month), shard)
+        else:
+            self.store.delete(BUCKET_NAME, self._shard_key(month))
+            manifest["months"].remove(month)
+        manifest["count"] = max(0, manifest["count"] - 1)
+        self.store.set(BUCKET_NAME, self._manifest_key(), manifest)
+        self._update_aggregates(record, added=False)
+        return True
+
+
+class PoopConfig:
+    """
+    插件配置（智谱AI密钥、模型、提示词），第一次用到时才读取
+
+    - 按 CONFIG_LOCATIONS 查找配置，找到后只把位置（桶名和 key 前缀）记在 BUCKET_NAME/CONFIG_CACHE_KEY 中，
+      密钥不复制到其他桶；之后的调用直接从记住的位置读取取值，管理员修改配置立即生效
+    - 记录带版本号：版本不符、或记住的位置读不到密钥时重新查找
+    - 密钥无效（ZhipuAuthError）时 invalidate()，下次重新查找；网络错误、限流和熔断不影响记住的位置
+    - 未配置时不记录，配置后立即生效
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._values = None
+        self.scanned = []  # 本次查找过的位置 [(桶名, key, 是否有值)]，用于未配置时的调试信息
+
+    def _read_location(self, bucket, prefix):
+        """读取某个位置的配置，没有密钥时返回 None"""
+        api_key = self.store.get_text(bucket, f"{prefix}zhipu_api_key")
+        if not api_key:
+            return None
+        return {
+            "bucket": bucket,
+            "prefix": prefix,
+            "api_key": api_key,
+            "model": self.store.get_text(bucket, f"{prefix}zhipu_model") or DEFAULT_MODEL,
+            "prompt": self.store.get_text(bucket, f"{prefix}ai_prompt") or "",
+        }
+
+    def _resolve(self):
+        cached = self.store.get(BUCKET_NAME, CONFIG_CACHE_KEY)
+        if isinstance(cached, dict) and cached.get("version") == CONFIG_CACHE_VERSION and cached.get("bucket"):
+            values = self._read_location(cached["bucket"], cached.get("prefix", ""))
+            if values:
+                return values
+
+        for bucket, prefix in CONFIG_LOCATIONS:
+            values = self._read_location(bucket, prefix)
+            self.scanned.append((bucket, f"{prefix}zhipu_api_key", bool(values)))
+            if values:
+                log.info("读取到智谱AI配置", bucket=bucket, key=f"{prefix}zhipu_api_key", api_key=Secret(values["api_key"]))
+                self.store.set(BUCKET_NAME, CONFIG_CACHE_KEY,
+                               {"version": CONFIG_CACHE_VERSION, "bucket": bucket, "prefix": prefix})
+                return values
+
+        if cached is not None:
+            self.store.delete(BUCKET_NAME, CONFIG_CACHE_KEY)
+        return {"api_key": "", "model": DEFAULT_MODEL, "prompt": ""}
+
+    @property
+    def values(self):
+        if self._values is None:
+            self._values = self._resolve()
+        return self._values
+
+    @property
+    def api_key(self):
+        return self.values["api_key"]
+
+    @property
+    def model(self):
+        return self.values["model"]
+
+    @property
+    def prompt(self):
+        return self.values["prompt"]
+
+    def invalidate(self):
+        """丢弃记住的配置，下次重新查找"""
+        self._values = None
+        self.store.delete(BUCKET_NAME, CONFIG_CACHE_KEY)
+
+    def debug_text(self):
+        """未配置时的调试信息（使用查找时的结果，不再重复读取）"""
+        debug_msg = "🔍 配置读取调试:\n\n"
+        for bucket, key, found in self.scanned:
+            debug_msg += f"bucketGet('{bucket}', '{key}'): {'✅有值' if found else '❌无值'}\n"
+        return debug_msg
 
 
 class PoopPlugin:
@@ -164,6 +680,7 @@ class PoopPlugin:
         """初始化插件"""
         sender_id = middleware.getSenderID()
         self.sender = middleware.Sender(sender_id)
+        self.store = get_store()
         self.user_id = self.sender.getUserID()
         # 使用用户ID作为用户名
         try:
@@ -172,42 +689,11 @@ class PoopPlugin:
             self.username = self.user_id
         self.imtype = self.sender.getImtype()
         self.message = self.sender.getMessage().strip()
+        self.records = PoopRecordStore(self.user_id, self.store)
+        self.dialog = Dialog(self.store, BUCKET_NAME, self.user_id, chat_of(self.sender))
         
-        
-        # 从插件头部注释读取配置 - 尝试多种可能的组合
-        # 可能的组合: (桶名, key格式)
-        config_attempts = [
-            ("otto", "便便.zhipu_api_key"),
-            ("poop", "便便.zhipu_api_key"),
-            ("便便", "便便.zhipu_api_key"),
-            ("otto", "zhipu_api_key"),
-            ("poop", "zhipu_api_key"),
-            ("便便", "zhipu_api_key"),
-        ]
-        
-        self.zhipu_api_key = ""
-        self.zhipu_model = "glm-4-flash"
-        self.ai_prompt = ""
-        
-        # 尝试读取配置
-        for bucket, key_prefix in config_attempts:
-            api_key = middleware.bucketGet(bucket, key_prefix if "zhipu_api_key" in key_prefix else f"{key_prefix}")
-            if api_key:
-                self.zhipu_api_key = api_key
-                self.zhipu_model = middleware.bucketGet(bucket, key_prefix.replace("zhipu_api_key", "zhipu_model")) or "glm-4-flash"
-                self.ai_prompt = middleware.bucketGet(bucket, key_prefix.replace("zhipu_api_key", "ai_prompt")) or ""
-                print(f"[便便插件] ✅ 成功从桶 '{bucket}' 读取配置, key格式: '{key_prefix}'")
-                break
-        
-        # 如果还是没读到,输出调试信息
-        if not self.zhipu_api_key and self.message == "便便分析":
-            debug_msg = "🔍 配置读取调试:\n\n"
-            for bucket, key in config_attempts:
-                test_key = key if "zhipu_api_key" in key else f"{key}"
-                value = middleware.bucketGet(bucket, test_key) or ""
-                debug_msg += f"bucketGet('{bucket}', '{test_key}'): {'✅有值' if value else '❌无值'} (长度:{len(value)})\n"
-            self.sender.reply(debug_msg)
-        
+        # 智谱AI配置在用到时才读取（记录、查看、删除等命令不需要）
+        self.config = PoopConfig(self.store)
     
     def get_user_confirmation(self, prompt):
         """
@@ -249,31 +735,27 @@ class PoopPlugin:
     def get_user_records(self):
         """
         获取用户的所有记录
-        :return: 记录列表
+        :return: 记录列表（按时间戳降序）
         """
         try:
-            # 获取用户的所有记录
-            data = middleware.bucketGet(BUCKET_NAME, self.user_id)
-            if not data or data == '':
-                return []
-            
-            records = json.loads(data)
-            # 按时间戳降序排序
-            records.sort(key=lambda x: x['timestamp'], reverse=True)
-            return records
+            records = self.records.load_all()
+            return sorted(records, key=lambda x: x['timestamp'], reverse=True)
         except Exception as e:
             return []
     
-    def save_user_records(self, records):
+    def get_recent_records(self, days):
         """
-        保存用户记录
-        :param records: 记录列表
+        获取最近N天的记录，只读取覆盖该时段的月度分片
+        :param days: 天数
+        :return: 记录列表（按时间戳降序）
         """
+        cutoff = self.get_current_timestamp() - days * 86400
         try:
-            data = json.dumps(records, ensure_ascii=False)
-            middleware.bucketSet(BUCKET_NAME, self.user_id, data)
+            recent = self.records.load_since(cutoff)
         except Exception as e:
-            self.sender.reply(f"❌ 保存失败：{e}")
+            return []
+        recent.reverse()
+        return recent
     
     def show_help(self):
         """显示帮助信息"""
@@ -285,6 +767,7 @@ class PoopPlugin:
         help_text += "• 便便记录 - 查看所有历史记录\n"
         help_text += "• 便便删除 - 删除指定的历史记录\n"
         help_text += "• 便便分析 - AI分析便便健康状况\n"
+        help_text += "• 便便重建统计 - 统计数据异常时重新计算\n"
         help_text += "• 便便帮助 - 显示此帮助信息\n\n"
         help_text += "🔹 确认机制：\n"
         help_text += "记录和删除操作需要确认：\n"
@@ -293,10 +776,10 @@ class PoopPlugin:
         help_text += "  q - 退出流程\n\n"
         
         # 检查AI配置状态
-        if self.zhipu_api_key:
+        if self.config.api_key:
             help_text += "🤖 AI分析：已配置\n"
-            help_text += f"  • 模型：{self.zhipu_model}\n"
-            if self.ai_prompt:
+            help_text += f"  • 模型：{self.config.model}\n"
+            if self.config.prompt:
                 help_text += "  • 自定义提示词：已设置\n"
             help_text += "\n"
         else:
@@ -308,79 +791,90 @@ class PoopPlugin:
         self.sender.reply(help_text)
     
     def record_poop(self):
-        """记录便便事件"""
-        # 第一步：获取确认
-        confirmation = self.get_user_confirmation("📝 确认要记录一次便便事件吗？")
-        
-        if not confirmation:
-            return
-        
+        """记录便便事件（第一步：确认，回复由 resume_dialog 处理）"""
+        self.sender.reply("📝 确认要记录一次便便事件吗？\n\n请输入：\n  y - 确认\n  n - 取消\n  q - 退出")
+        self.dialog.save("record_confirm")
+    
+    def on_record_confirm(self, confirmation):
+        """记录流程：处理确认回复"""
         if confirmation == "q":
+            self.dialog.clear()
             self.sender.reply("👋 已退出记录流程")
             return
         
         if confirmation == "n":
+            self.dialog.clear()
             self.sender.reply("❌ 已取消记录")
             return
         
         if confirmation == "y":
             # 第二步：询问便便过程
             self.sender.reply("💩 请选择便便过程：\n\n  A - 通畅 😊\n  B - 一般 😐\n  C - 费劲 😣\n  D - 拉稀 💧\n  E - 用药 💊\n  q - 退出")
-            
-            process_input = self.sender.listen(INPUT_TIMEOUT)
-            
-            if process_input is None:
-                self.sender.reply("⏱️ 操作超时，已自动取消")
-                return
-            
-            process = process_input.strip().upper()
-            
-            if process == "Q":
-                self.sender.reply("👋 已退出记录流程")
-                return
-            
-            # 验证输入
-            if process not in ["A", "B", "C", "D", "E"]:
-                self.sender.reply("❌ 无效的选项，请输入 A、B、C、D 或 E")
-                return
-            
-            # 映射过程描述
-            process_map = {
-                "A": "通畅 😊",
-                "B": "一般 😐",
-                "C": "费劲 😣",
-                "D": "拉稀 💧",
-                "E": "用药 💊"
-            }
-            process_desc = process_map[process]
-            
-            # 生成记录数据
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            timestamp = self.get_current_timestamp()
-            
-            record_data = {
-                "username": self.username,
-                "userid": self.user_id,
-                "datetime": current_time,
-                "timestamp": timestamp,
-                "imtype": self.imtype,
-                "process": process,  # 添加便便过程
-                "process_desc": process_desc  # 添加过程描述
-            }
-            
-            # 获取现有记录
-            records = self.get_user_records()
-            records.append(record_data)
-            
-            # 保存记录
-            self.save_user_records(records)
-            
-            self.sender.reply(f"✅ 记录成功！\n\n📅 时间：{current_time}\n💩 过程：{process_desc}\n\n💡 发送「便便记录」可查看所有记录")
+            self.dialog.save("record_process")
             return
         
         # 无效输入
+        self.dialog.clear()
         self.sender.reply("❓ 无效的输入，请重新操作")
     
+    def on_record_process(self, process):
+        """记录流程：处理便便过程选择并保存记录"""
+        self.dialog.clear()
+        
+        if process == "Q":
+            self.sender.reply("👋 已退出记录流程")
+            return
+        
+        # 验证输入
+        if process not in PROCESS_MAP:
+            self.sender.reply("❌ 无效的选项，请输入 A、B、C、D 或 E")
+            return
+        
+        process_desc = PROCESS_MAP[process]
+        
+        # 生成记录数据
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = self.get_current_timestamp()
+        
+        record_data = {
+            "username": self.username,
+            "userid": self.user_id,
+            "datetime": current_time,
+            "timestamp": timestamp,
+            "imtype": self.imtype,
+            "process": process,  # 添加便便过程
+            "process_desc": process_desc  # 添加过程描述
+        }
+        
+        # 追加到当月分片
+        try:
+            self.records.append(record_data)
+            self.store.flush()
+        except Exception as e:
+            self.sender.reply(f"❌ 保存失败：{e}")
+            return
+        
+        self.sender.reply(f"✅ 记录成功！\n\n📅 时间：{current_time}\n💩 过程：{process_desc}\n\n💡 发送「便便记录」可查看所有记录")
+    
+    def resume_dialog(self):
+        """
+        处理对话中的回复（y/n/q、A-E）
+        没有进行中的对话时静默退出，对话已超时则提示
+        """
+        state = self.dialog.load()
+        if state is None:
+            if self.dialog.expired:
+                self.sender.reply("⏱️ 操作超时，已自动取消")
+            return
+        
+        step = state["step"]
+        if step == "record_confirm":
+            self.on_record_confirm(self.message.lower())
+        elif step == "record_process":
+            self.on_record_process(self.message.upper())
+        else:
+            self.dialog.clear()
+    
     def get_date_label(self, date_str):
         """获取日期标签（如"今天"、"昨天"）"""
         from datetime import datetime as dt, timedelta
@@ -394,58 +888,24 @@ class PoopPlugin:
         else:
             return f"{date_obj.month}月{date_obj.day}日"
     
-    def get_status_summary(self, day_records):
-        """获取某天的状态概要"""
-        from collections import Counter
-        status_count = Counter([r['status'] for r in day_records])
-        summary_parts = [f"{status}×{count}" for status, count in status_count.items()]
+    def get_status_summary(self, day_status):
+        """
+        获取某天的状态概要
+        :param day_status: 当天各状态次数 {状态: 次数}
+        """
+        summary_parts = [f"{status}×{count}" for status, count in day_status.items()]
         return ", ".join(summary_parts)
     
-    def get_status_distribution(self, records):
-        """计算状态分布"""
-        from collections import Counter
-        status_list = []
-        for record in records:
-            if 'process_desc' in record:
-                status = record['process_desc'].split()[0] if record['process_desc'] else "未知"
-            else:
-                status = "未知"
-            status_list.append(status)
-        return Counter(status_list)
-    
-    def calculate_period_stats(self, records, days=None):
-        """计算指定时段的统计信息"""
-        from datetime import datetime as dt, timedelta
-        
-        if days:
-            cutoff_date = dt.now() - timedelta(days=days)
-            filtered_records = [r for r in records if dt.strptime(r['datetime'], '%Y-%m-%d %H:%M:%S') >= cutoff_date]
-        else:
-            filtered_records = records
-        
-        if not filtered_records:
-            return None
-        
-        status_dist = self.get_status_distribution(filtered_records)
-        total = len(filtered_records)
-        status_percent = {status: (count / total * 100) for status, count in status_dist.items()}
-        
-        return {
-            'total': total,
-            'status_dist': status_dist,
-            'status_percent': status_percent
-        }
-    
     def view_records(self):
         """查看历史记录（交互式菜单）"""
-        records = self.get_user_records()
-        
-        if len(records) == 0:
+        if self.records.count() == 0:
             self.sender.reply("📭 暂无记录\n\n💡 发送「便便」可以记录新的事件")
             return
         
+        aggregates = self.records.aggregates()
+        
         # 显示概览和菜单
-        self.show_overview(records)
+        self.show_overview(aggregates)
         
         # 等待用户选择
         user_input = self.sender.listen(INPUT_TIMEOUT)
@@ -460,60 +920,47 @@ class PoopPlugin:
             self.sender.reply("👋 已退出查看")
             return
         elif choice == "1":
-            self.show_recent_details(records, 7)
+            self.show_recent_details(7)
             return
         elif choice == "2":
-            self.show_recent_details(records, 30)
+            self.show_recent_details(30)
             return
         elif choice == "3":
-            self.show_all_records(records)
+            self.show_all_records(aggregates)
             return
         elif choice == "4":
-            self.show_statistics(records)
+            self.show_statistics(aggregates)
             return
         else:
             self.sender.reply("❌ 无效的选项，请输入 1-4 或 q")
     
-    def show_overview(self, records):
+    def get_overall_stats(self, aggregates):
+        """从聚合快照读取总体统计"""
+        return {
+            'total_count': aggregates.total,
+            'total_days': aggregates.total_days,
+            'first_date': aggregates.first_date,
+            'last_date': aggregates.last_date,
+            'date_span': aggregates.date_span,
+            'avg_freq': aggregates.avg_per_day,
+            'coverage': aggregates.coverage
+        }
+    
+    def show_overview(self, aggregates):
         """显示概览和菜单"""
-        from collections import defaultdict
         from datetime import datetime as dt, timedelta
         
-        # 按日期分组记录
-        records_by_date = defaultdict(list)
-        
-        for record in records:
-            date_str = record['datetime'].split(' ')[0]
-            time_str = record['datetime'].split(' ')[1][:5]
-            
-            if 'process_desc' in record:
-                status = record['process_desc'].split()[0] if record['process_desc'] else "未知"
-            else:
-                status = "未知"
-            
-            records_by_date[date_str].append({
-                'time': time_str,
-                'timestamp': record['timestamp'],
-                'status': status
-            })
-        
         # 计算统计信息
-        total_count = len(records)
-        total_days = len(records_by_date)
-        dates = sorted(records_by_date.keys())
-        first_date = dates[0]
-        last_date = dates[-1]
-        date_span = (dt.strptime(last_date, '%Y-%m-%d') - dt.strptime(first_date, '%Y-%m-%d')).days + 1
-        avg_freq = total_count / total_days if total_days > 0 else 0
+        overall = self.get_overall_stats(aggregates)
         
         # 构建概览消息
         message = "📊 便便记录概览\n\n"
         message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n"
         message += "📈 总体统计\n"
-        message += f"• 记录时段: {first_date} 至 {last_date}\n"
-        message += f"• 记录天数: {total_days}天 (跨度{date_span}天)\n"
-        message += f"• 总计次数: {total_count}次\n"
-        message += f"• 平均频率: {avg_freq:.2f}次/天\n\n"
+        message += f"• 记录时段: {overall['first_date']} 至 {overall['last_date']}\n"
+        message += f"• 记录天数: {overall['total_days']}天 (跨度{overall['date_span']}天)\n"
+        message += f"• 总计次数: {overall['total_count']}次\n"
+        message += f"• 平均频率: {overall['avg_freq']:.2f}次/天\n\n"
         
         # 最近7天概要
         message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n"
@@ -528,10 +975,9 @@ class PoopPlugin:
         
         for date_str in recent_dates:
             date_label = self.get_date_label(date_str)
-            if date_str in records_by_date:
-                day_records = records_by_date[date_str]
-                day_count = len(day_records)
-                summary = self.get_status_summary(day_records)
+            if date_str in aggregates.days:
+                day_count = aggregates.day_count(date_str)
+                summary = self.get_status_summary(aggregates.days[date_str])
                 message += f"{date_label:<20} {day_count}次 [{summary}]\n"
             else:
                 message += f"{date_label:<20} 0次\n"
@@ -549,33 +995,28 @@ class PoopPlugin:
         
         self.sender.reply(message)
     
-    def show_recent_details(self, records, days):
+    def show_recent_details(self, days):
         """显示最近N天的详细记录"""
         from collections import defaultdict
-        from datetime import datetime as dt, timedelta
         
-        # 筛选最近N天的记录
-        cutoff_date = dt.now() - timedelta(days=days)
-        recent_records = [r for r in records if dt.strptime(r['datetime'], '%Y-%m-%d %H:%M:%S') >= cutoff_date]
+        # 筛选最近N天的记录（只读取相关月份分片）
+        recent_records = self.get_recent_records(days)
         
         if not recent_records:
             self.sender.reply(f"📭 最近{days}天没有记录")
             return
         
-        # 按日期分组
+        # 单遍扫描：按日期分组的同时计算统计
+        stats = PoopAggregates()
         records_by_date = defaultdict(list)
         for record in recent_records:
+            stats.add(record)
             date_str = record['datetime'].split(' ')[0]
             time_str = record['datetime'].split(' ')[1][:5]
             
-            if 'process_desc' in record:
-                status = record['process_desc'].split()[0] if record['process_desc'] else "未知"
-            else:
-                status = "未知"
-            
             records_by_date[date_str].append({
                 'time': time_str,
-                'status': status
+                'status': PoopAggregates.status_of(record)
             })
         
         # 构建消息
@@ -598,51 +1039,46 @@ class PoopPlugin:
             message += f"  📊 当天{day_count}次\n\n"
         
         # 统计信息
-        stats = self.calculate_period_stats(recent_records, days)
-        if stats:
-            message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-            message += f"📈 {days}天统计\n"
-            message += f"• 总计: {stats['total']}次\n"
-            message += f"• 平均: {stats['total']/days:.2f}次/天\n"
-            
-            # 状态分布
-            status_parts = []
-            for status, percent in stats['status_percent'].items():
-                status_parts.append(f"{status} {percent:.0f}%")
-            message += f"• 状态分布: {', '.join(status_parts)}"
+        message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+        message += f"📈 {days}天统计\n"
+        message += f"• 总计: {stats.total}次\n"
+        message += f"• 平均: {stats.total/days:.2f}次/天\n"
+        
+        # 状态分布
+        status_parts = []
+        for status, percent in stats.category_percent().items():
+            status_parts.append(f"{status} {percent:.0f}%")
+        message += f"• 状态分布: {', '.join(status_parts)}"
         
         self.sender.reply(message)
     
-    def show_all_records(self, records):
-        """显示全部记录"""
+    def show_all_records(self, aggregates):
+        """显示全部记录（超过30天时只读取最近30个记录日所在的分片）"""
         from collections import defaultdict
         
+        total_days = aggregates.total_days
+        
+        # 如果记录太多，只显示最近30天
+        display_dates = sorted(aggregates.days.keys(), reverse=True)[:30]
+        if total_days > 30:
+            message = f"📊 全部记录 (显示最近30天，共{total_days}天)\n\n"
+        else:
+            message = f"� 全部记录 (共{total_days}天)\n\n"
+        
         # 按日期分组
         records_by_date = defaultdict(list)
-        for record in records:
+        oldest_date = display_dates[-1]
+        for record in self.records.load_since_month(oldest_date[:7]):
             date_str = record['datetime'].split(' ')[0]
+            if date_str < oldest_date:
+                continue
             time_str = record['datetime'].split(' ')[1][:5]
             
-            if 'process_desc' in record:
-                status = record['process_desc'].split()[0] if record['process_desc'] else "未知"
-            else:
-                status = "未知"
-            
             records_by_date[date_str].append({
                 'time': time_str,
-                'status': status
+                'status': PoopAggregates.status_of(record)
             })
         
-        total_days = len(records_by_date)
-        
-        # 如果记录太多，只显示最近30天
-        if total_days > 30:
-            display_dates = sorted(records_by_date.keys(), reverse=True)[:30]
-            message = f"📊 全部记录 (显示最近30天，共{total_days}天)\n\n"
-        else:
-            display_dates = sorted(records_by_date.keys(), reverse=True)
-            message = f"� 全部记录 (共{total_days}天)\n\n"
-        
         message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n"
         
         # 显示记录
@@ -664,48 +1100,26 @@ class PoopPlugin:
         
         self.sender.reply(message)
     
-    def show_statistics(self, records):
-        """显示统计分析"""
-        from collections import defaultdict
-        from datetime import datetime as dt
-        
-        # 按日期分组
-        records_by_date = defaultdict(list)
-        for record in records:
-            date_str = record['datetime'].split(' ')[0]
-            
-            if 'process_desc' in record:
-                status = record['process_desc'].split()[0] if record['process_desc'] else "未知"
-            else:
-                status = "未知"
-            
-            records_by_date[date_str].append({'status': status})
-        
+    def show_statistics(self, aggregates):
+        """显示统计分析（基于聚合快照，不扫描历史记录）"""
         # 计算统计信息
-        total_count = len(records)
-        total_days = len(records_by_date)
-        dates = sorted(records_by_date.keys())
-        first_date = dates[0]
-        last_date = dates[-1]
-        date_span = (dt.strptime(last_date, '%Y-%m-%d') - dt.strptime(first_date, '%Y-%m-%d')).days + 1
-        avg_freq = total_count / total_days if total_days > 0 else 0
-        coverage = (total_days / date_span * 100) if date_span > 0 else 0
+        overall = self.get_overall_stats(aggregates)
+        total_count = overall['total_count']
+        total_days = overall['total_days']
+        avg_freq = overall['avg_freq']
         
         # 状态分布
-        status_dist = self.get_status_distribution(records)
+        status_dist = aggregates.categories
         
         # 频率分布
-        freq_dist = {}
-        for day_records in records_by_date.values():
-            count = len(day_records)
-            freq_dist[count] = freq_dist.get(count, 0) + 1
+        freq_dist = aggregates.freq_hist
         
         # 构建消息
         message = "📊 便便记录统计分析\n\n"
         message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n"
         message += "📈 总体数据\n"
-        message += f"• 记录时段: {first_date} 至 {last_date} ({date_span}天)\n"
-        message += f"• 记录天数: {total_days}天 (覆盖率 {coverage:.1f}%)\n"
+        message += f"• 记录时段: {overall['first_date']} 至 {overall['last_date']} ({overall['date_span']}天)\n"
+        message += f"• 记录天数: {total_days}天 (覆盖率 {overall['coverage']:.1f}%)\n"
         message += f"• 总计次数: {total_count}次\n"
         message += f"• 平均频率: {avg_freq:.2f}次/天\n\n"
         
@@ -747,10 +1161,11 @@ class PoopPlugin:
         
         # 拉稀分析
         if "拉稀" in status_dist:
-            # 检查最近7天是否有拉稀
-            recent_7days_stats = self.calculate_period_stats(records, 7)
-            if recent_7days_stats and "拉稀" in recent_7days_stats['status_dist']:
-                message += f"⚠️ 拉稀情况需注意 (近7天出现{recent_7days_stats['status_dist']['拉稀']}次)\n"
+            # 检查最近7天是否有拉稀（只扫描7天窗口内的记录）
+            cutoff = self.get_current_timestamp() - 7 * 86400
+            recent = PoopAggregates(recent_since=cutoff).feed(self.records.load_since(cutoff))
+            if "拉稀" in recent.recent:
+                message += f"⚠️ 拉稀情况需注意 (近7天出现{recent.recent['拉稀']}次)\n"
         
         message += "\n�💡 建议: 保持良好的饮食习惯和作息规律"
         
@@ -823,117 +1238,153 @@ class PoopPlugin:
         
         if confirmation == "y":
             # 执行删除
-            records.pop(record_index - 1)
-            self.save_user_records(records)
+            try:
+                self.records.remove(selected_record)
+                self.store.flush()
+            except Exception as e:
+                self.sender.reply(f"❌ 保存失败：{e}")
+                return
             self.sender.reply("✅ 删除成功！\n\n💡 发送「便便记录」可查看剩余记录")
             return
         
         # 无效输入
         self.sender.reply("❓ 无效的输入，已取消删除")
     
+    def rebuild_statistics(self):
+        """重新扫描全部记录，重建聚合统计"""
+        if self.records.count() == 0:
+            self.sender.reply("📭 暂无记录，无需重建统计")
+            return
+        
+        try:
+            aggregates = self.records.rebuild_aggregates()
+            self.store.flush()
+        except Exception as e:
+            self.sender.reply(f"❌ 重建失败：{e}")
+            return
+        
+        message = "✅ 统计已重建\n\n"
+        message += f"• 总计次数: {aggregates.total}次\n"
+        message += f"• 记录天数: {aggregates.total_days}天\n"
+        message += f"• 记录时段: {aggregates.first_date} 至 {aggregates.last_date}"
+        self.sender.reply(message)
+    
+    def format_analysis_report(self, analysis_result, source):
+        """
+        格式化AI分析报告
+        :param analysis_result: AI返回的分析内容
+        :param source: 报告来源说明（实时分析 / 缓存报告）
+        """
+        return f"{ANALYSIS_REPORT_HEADER}{analysis_result}\n{self.format_analysis_footer(source)}"
+    
+    def format_analysis_footer(self, source):
+        """
+        AI分析报告的结尾（免责声明、模型和来源），流式发送时在内容之后单独发送
+        :param source: 报告来源说明
+        """
+        result_message = "━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
+        result_message += "⚠️ 免责声明：\n"
+        result_message += "本分析仅供参考，不能替代专业医疗建议。\n"
+        result_message += "如有健康问题，请咨询专业医生。\n\n"
+        result_message += f"🤖 分析模型：{self.config.model}\n"
+        result_message += f"📦 报告来源：{source}\n"
+        result_message += "💡 发送「便便记录」可查看详细记录"
+        return result_message
+    
     def analyze_health(self):
         """AI分析便便健康状况"""
-        print(f"[便便插件] 开始执行 AI 分析")
-        print(f"[便便插件] API Key 状态: {'已配置' if self.zhipu_api_key else '未配置'}")
-        print(f"[便便插件] API Key 长度: {len(self.zhipu_api_key)}")
+        log.debug("开始执行 AI 分析", api_key=Secret(self.config.api_key))
         
         # 检查是否配置了智谱AI
-        if not self.zhipu_api_key:
-            print(f"[便便插件] 检测到 API Key 未配置，返回提示信息")
+        if not self.config.api_key:
+            self.sender.reply(self.config.debug_text())
             self.sender.reply("❌ AI分析功能未配置\n\n请在插件管理中配置智谱AI密钥\n访问 https://open.bigmodel.cn/ 获取API密钥")
             return
         
-        print(f"[便便插件] API Key 已配置，继续执行")
+        # 读取聚合快照（无需加载全部记录）
+        aggregates = self.records.aggregates()
+        log.debug("读取聚合快照", total=aggregates.total)
         
-        # 获取用户记录
-        records = self.get_user_records()
-        print(f"[便便插件] 获取到 {len(records)} 条记录")
-        
-        if len(records) == 0:
-            print(f"[便便插件] 无记录，返回提示信息")
+        if aggregates.total == 0:
             self.sender.reply("📭 暂无记录，无法进行分析\n\n💡 发送「便便」可以记录新的事件")
             return
         
+        # 数据摘要、模型和提示词都没有变化时直接返回缓存的报告（不消耗额度和限流令牌）
+        summary = PoopSummary(aggregates)
+        prompt = build_analysis_prompt(summary, self.config.prompt)
+        cache = AnalysisCache(self.store)
+        cache_key = analysis_cache_key(summary, self.config.model, prompt)
+        cached = cache.get(cache_key)
+        if cached:
+            log.debug("命中AI分析缓存", key=cache_key)
+            created_at = datetime.fromtimestamp(cached["created_at"]).strftime("%m-%d %H:%M")
+            self.sender.reply(self.format_analysis_report(
+                cached["report"], f"♻️ 缓存报告（{created_at} 生成，数据摘要无变化）"))
+            return
+        
+        # 限流：保护智谱AI额度，避免重复发送「便便分析」
+        try:
+            RateLimiter("zhipuai", AI_USER_PER_MINUTE, AI_USER_BURST,
+                        AI_GLOBAL_PER_MINUTE, AI_GLOBAL_BURST, self.store).acquire(self.user_id)
+        except RateLimited as e:
+            self.sender.reply(f"⏳ AI分析{e}")
+            return
+        
         # 显示分析提示
-        print(f"[便便插件] 发送分析中提示")
         self.sender.reply("🤖 正在分析您的便便健康状况...\n\n⏳ 请稍候，这可能需要几秒钟")
         
         try:
-            print(f"[便便插件] 开始调用智谱 AI API")
-            print(f"[便便插件] 使用模型: {self.zhipu_model}")
-            print(f"[便便插件] 自定义提示词: {'是' if self.ai_prompt else '否'}")
-            
-            # 先生成数据摘要,显示给用户确认
-            from collections import Counter
-            from datetime import datetime as dt, timedelta
-            
-            # 使用全部记录进行分析
-            if not records:
-                self.sender.reply("📭 暂无记录，无法进行分析\n\n💡 发送「便便」可以记录新的事件")
-                return
-            
-            # 统计状态分布
-            status_list = []
-            for record in records:
-                if 'process_desc' in record:
-                    status = record['process_desc'].split()[0] if record['process_desc'] else "未知"
-                else:
-                    status = "未知"
-                status_list.append(status)
-            
-            status_dist = Counter(status_list)
-            total_count = len(records)
-            
-            # 计算时间跨度和平均频率
-            dates = sorted(set([r['datetime'].split(' ')[0] for r in records]))
-            first_date = dates[0]
-            last_date = dates[-1]
-            date_span = (dt.strptime(last_date, '%Y-%m-%d') - dt.strptime(first_date, '%Y-%m-%d')).days + 1
-            avg_freq = total_count / date_span if date_span > 0 else total_count
-            
-            # 构建数据摘要
-            data_summary = f"📊 即将发送给AI的数据摘要：\n\n"
-            data_summary += f"便便记录完整数据：\n"
-            data_summary += f"- 记录时段：{first_date} 至 {last_date} (共{date_span}天)\n"
-            data_summary += f"- 总次数：{total_count}次\n"
-            data_summary += f"- 平均频率：{avg_freq:.2f}次/天\n"
-            data_summary += f"- 状态分布：\n"
-            for status, count in status_dist.items():
-                percent = count / total_count * 100
-                data_summary += f"  • {status}：{count}次 ({percent:.1f}%)\n"
+            log.debug("开始调用智谱 AI", model=self.config.model, custom_prompt=bool(self.config.prompt))
             
             # 显示数据摘要给用户
-            self.sender.reply(data_summary + "\n⏳ 正在调用AI分析...")
-            print(f"[便便插件] 数据摘要已发送给用户")
+            self.sender.reply(f"📊 即将发送给AI的数据摘要：\n\n{summary.text}\n⏳ 正在调用AI分析...")
             
             # 调用智谱AI进行分析
-            ai = ZhipuAI(self.zhipu_api_key, self.zhipu_model)
-            analysis_result = ai.analyze_poop_health(records, self.ai_prompt)
-            
-            print(f"[便便插件] AI 分析完成，结果长度: {len(analysis_result)}")
+            ai = ZhipuAI(self.config.api_key, self.config.model)
+            if AI_STREAM:
+                # 边生成边发送：第一段带报告标题，全部收完后发送结尾
+                sent = []
+                
+                def forward(text):
+                    self.sender.reply(text if sent else f"{ANALYSIS_REPORT_HEADER}{text}")
+                    sent.append(text)
+                
+                analysis_result = ai.stream_poop_health(prompt, forward)
+            else:
+                analysis_result = ai.analyze_poop_health(prompt)
             
-            # 格式化并发送分析结果
-            result_message = "🏥 便便健康分析报告\n\n"
-            result_message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-            result_message += f"{analysis_result}\n"
-            result_message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
-            result_message += "⚠️ 免责声明：\n"
-            result_message += "本分析仅供参考，不能替代专业医疗建议。\n"
-            result_message += "如有健康问题，请咨询专业医生。\n\n"
-            result_message += f"🤖 分析模型：{self.zhipu_model}\n"
-            result_message += "💡 发送「便便记录」可查看详细记录"
+            log.debug("AI 分析完成", length=len(analysis_result), connections=get_transport().summary)
+            cache.put(cache_key, analysis_result, self.config.model)
             
-            print(f"[便便插件] 发送分析结果")
-            self.sender.reply(result_message)
+            if AI_STREAM:
+                self.sender.reply(self.format_analysis_footer("🆕 实时分析"))
+            else:
+                self.sender.reply(self.format_analysis_report(analysis_result, "🆕 实时分析"))
             
         except Exception as e:
             error_msg = str(e)
-            print(f"[便便插件] AI 分析失败: {error_msg}")
+            log.error("AI 分析失败", error=error_msg)
+            # 密钥无效时下次重新查找配置（网络错误、熔断等不影响记住的位置）
+            if isinstance(e, ZhipuAuthError):
+                self.config.invalidate()
             self.sender.reply(f"❌ AI分析失败：{error_msg}\n\n可能的原因：\n• API密钥无效或已过期\n• 网络连接问题\n• API调用额度不足\n\n请检查配置后重试")
     
+    def flush_storage(self):
+        """写回本次调用中尚未保存的修改"""
+        try:
+            self.store.flush()
+        except Exception as e:
+            self.sender.reply(f"❌ {e}")
+        log.debug("存储统计", summary=self.store.summary)
+    
     def run(self):
         """主程序入口"""
         try:
+            # 对话中的回复
+            if re.match(DIALOG_REPLY_PATTERN, self.message):
+                self.resume_dialog()
+                return
+            
             # 路由到对应功能
             if self.message == "便便帮助":
                 self.show_help()
@@ -941,6 +1392,8 @@ class PoopPlugin:
                 self.view_records()
             elif self.message == "便便删除":
                 self.delete_record()
+            elif self.message == "便便重建统计":
+                self.rebuild_statistics()
             elif self.message == "便便分析":
                 self.analyze_health()
             elif self.message == "便便":
@@ -951,6 +1404,8 @@ class PoopPlugin:
         
         except Exception as e:
             self.sender.reply(f"❌ 插件执行错误：{e}")
+        finally:
+            self.flush_storage()
 
 
 if __name__ == '__main__':
@@ -1,5 +1,6 @@
 # [disable:false]
 # [rule: ^肚子疼(.*)$]
+# [rule: ^[yYnNqQa-dA-D]$]
 # [admin: false]
 # [price: 0.00]
 # [version: 1.2.1]
@@ -21,13 +22,29 @@ autMan 插件 - 肚子疼记录（Python 版本）
 
 import middleware
 import time
-import json
+import re
 from datetime import datetime
+import os
+import sys
+
+# 共享模块：部署时与插件放在同一目录，仓库中位于 common/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from autman_storage import get_store, ensure_timestamp_order, insert_by_timestamp, records_since, remove_by_timestamp
+from autman_stats import RecordAggregator
+from autman_dialog import Dialog, chat_of
+from autman_log import get_logger
 
 # 配置常量
 BUCKET_NAME = "stomachache"
 VERSION = "v1.2.1"
 INPUT_TIMEOUT = 60000  # 60秒超时
+DIALOG_REPLY_PATTERN = r'^[yYnNqQa-dA-D]$'  # 对话中的回复，与头部 rule 保持一致
+log = get_logger("肚子疼插件")
+LOCATION_MAP = {
+    "A": "爷爷奶奶家 🏠",
+    "B": "爸爸妈妈家 🏡",
+    "C": "车上 🚗"
+}
 
 
 class StomachachePlugin:
@@ -35,6 +52,7 @@ class StomachachePlugin:
         """初始化插件"""
         sender_id = middleware.getSenderID()
         self.sender = middleware.Sender(sender_id)
+        self.store = get_store()
         self.user_id = self.sender.getUserID()
         # 用户名可能需要单独获取，如果没有这个方法就设置为用户ID
         try:
@@ -43,6 +61,7 @@ class StomachachePlugin:
             self.username = self.user_id
         self.imtype = self.sender.getImtype()
         self.message = self.sender.getMessage().strip()
+        self.dialog = Dialog(self.store, BUCKET_NAME, self.user_id, chat_of(self.sender))
     
     def get_user_confirmation(self, prompt):
         """
@@ -81,32 +100,50 @@ class StomachachePlugin:
         else:
             return f"{diff // 86400}天前"
     
-    def get_user_records(self):
+    def get_sorted_records(self):
         """
-        获取用户的所有记录
+        获取用户的所有记录（存储顺序，按时间戳升序）
         :return: 记录列表
         """
-        try:
-            # 获取用户的所有记录
-            data = middleware.bucketGet(BUCKET_NAME, self.user_id)
-            if not data or data == '':
-                return []
-            
-            records = json.loads(data)
-            # 按时间戳降序排序
-            records.sort(key=lambda x: x['timestamp'], reverse=True)
-            return records
-        except Exception as e:
+        records = self.store.get(BUCKET_NAME, self.user_id, [])
+        if not isinstance(records, list):
             return []
+        # 兼容旧版乱序存储
+        ensure_timestamp_order(records)
+        return records
+    
+    def get_user_records(self):
+        """
+        获取用户的所有记录
+        :return: 记录列表（按时间戳降序）
+        """
+        return list(reversed(self.get_sorted_records()))
+    
+    def get_recent_records(self, days, records=None):
+        """
+        获取最近N天的记录（二分查找，只复制窗口内的记录）
+        :param days: 天数
+        :param records: 已读取的升序记录，默认重新获取
+        :return: 记录列表（按时间戳升序）
+        """
+        if records is None:
+            records = self.get_sorted_records()
+        cutoff = self.get_current_timestamp() - days * 86400
+        return records_since(records, cutoff)
+    
+    @staticmethod
+    def location_of(record):
+        """提取记录的地点（旧记录没有地点）"""
+        return record.get('location_desc') or "未记录"
     
     def save_user_records(self, records):
         """
         保存用户记录
-        :param records: 记录列表
+        :param records: 记录列表（按时间戳升序）
         """
         try:
-            data = json.dumps(records, ensure_ascii=False)
-            middleware.bucketSet(BUCKET_NAME, self.user_id, data)
+            self.store.set(BUCKET_NAME, self.user_id, records)
+            self.store.flush()
         except Exception as e:
             self.sender.reply(f"❌ 保存失败：{e}")
     
@@ -130,111 +167,131 @@ class StomachachePlugin:
         self.sender.reply(help_text)
     
     def record_stomachache(self):
-        """记录肚子疼事件"""
-        # 第一步：获取确认
-        confirmation = self.get_user_confirmation("📝 确认要记录一次肚子疼事件吗？")
-        
-        if not confirmation:
-            return
-        
+        """记录肚子疼事件（第一步：确认，回复由 resume_dialog 处理）"""
+        self.sender.reply("📝 确认要记录一次肚子疼事件吗？\n\n请输入：\n  y - 确认\n  n - 取消\n  q - 退出")
+        self.dialog.save("record_confirm")
+    
+    def on_record_confirm(self, confirmation):
+        """记录流程：处理确认回复"""
         if confirmation == "q":
+            self.dialog.clear()
             self.sender.reply("👋 已退出记录流程")
             return
         
         if confirmation == "n":
+            self.dialog.clear()
             self.sender.reply("❌ 已取消记录")
             return
         
         if confirmation == "y":
             # 第二步：询问地点
             self.sender.reply("📍 请选择疼痛发生的地点：\n\n  A - 爷爷奶奶家 🏠\n  B - 爸爸妈妈家 🏡\n  C - 车上 🚗\n  D - 其它\n  q - 退出")
+            self.dialog.save("record_location")
+            return
+        
+        # 无效输入
+        self.dialog.clear()
+        self.sender.reply("❓ 无效的输入，请重新操作")
+    
+    def on_record_location(self, location):
+        """记录流程：处理地点选择并保存记录"""
+        self.dialog.clear()
+        
+        if location == "Q":
+            self.sender.reply("👋 已退出记录流程")
+            return
+        
+        # 验证输入
+        if location not in ["A", "B", "C", "D"]:
+            self.sender.reply("❌ 无效的选项，请输入 A、B、C 或 D")
+            return
+        
+        # 处理地点
+        if location == "D":
+            # 用户选择"其它"，需要输入自定义地点
+            # 自由文本无法用 rule 匹配，这一步仍在当前进程中等待输入
+            self.sender.reply("📝 请输入具体地点：")
             
-            location_input = self.sender.listen(INPUT_TIMEOUT)
+            custom_location_input = self.sender.listen(INPUT_TIMEOUT)
             
-            if location_input is None:
+            if custom_location_input is None:
                 self.sender.reply("⏱️ 操作超时，已自动取消")
                 return
             
-            location = location_input.strip().upper()
+            custom_location = custom_location_input.strip()
             
-            if location == "Q":
+            if not custom_location or custom_location.lower() == "q":
                 self.sender.reply("👋 已退出记录流程")
                 return
             
-            # 验证输入
-            if location not in ["A", "B", "C", "D"]:
-                self.sender.reply("❌ 无效的选项，请输入 A、B、C 或 D")
-                return
-            
-            # 处理地点
-            if location == "D":
-                # 用户选择"其它"，需要输入自定义地点
-                self.sender.reply("📝 请输入具体地点：")
-                
-                custom_location_input = self.sender.listen(INPUT_TIMEOUT)
-                
-                if custom_location_input is None:
-                    self.sender.reply("⏱️ 操作超时，已自动取消")
-                    return
-                
-                custom_location = custom_location_input.strip()
-                
-                if not custom_location or custom_location.lower() == "q":
-                    self.sender.reply("👋 已退出记录流程")
-                    return
-                
-                location_desc = custom_location
-            else:
-                # 使用预设地点
-                location_map = {
-                    "A": "爷爷奶奶家 🏠",
-                    "B": "爸爸妈妈家 🏡",
-                    "C": "车上 🚗"
-                }
-                location_desc = location_map[location]
-            
-            # 生成记录数据
-            current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            timestamp = self.get_current_timestamp()
-            
-            record_data = {
-                "username": self.username,
-                "userid": self.user_id,
-                "datetime": current_time,
-                "timestamp": timestamp,
-                "imtype": self.imtype,
-                "location": location,  # 添加地点选项
-                "location_desc": location_desc  # 添加地点描述
-            }
-            
-            # 获取现有记录
-            records = self.get_user_records()
-            records.append(record_data)
-            
-            # 保存记录
-            self.save_user_records(records)
-            
-            self.sender.reply(f"✅ 记录成功！\n\n📅 时间：{current_time}\n📍 地点：{location_desc}\n\n💡 发送「肚子疼记录」可查看所有记录")
+            location_desc = custom_location
+        else:
+            # 使用预设地点
+            location_desc = LOCATION_MAP[location]
+        
+        # 生成记录数据
+        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = self.get_current_timestamp()
+        
+        record_data = {
+            "username": self.username,
+            "userid": self.user_id,
+            "datetime": current_time,
+            "timestamp": timestamp,
+            "imtype": self.imtype,
+            "location": location,  # 添加地点选项
+            "location_desc": location_desc  # 添加地点描述
+        }
+        
+        # 获取现有记录
+        records = self.get_sorted_records()
+        insert_by_timestamp(records, record_data)
+        
+        # 保存记录
+        self.save_user_records(records)
+        
+        self.sender.reply(f"✅ 记录成功！\n\n📅 时间：{current_time}\n📍 地点：{location_desc}\n\n💡 发送「肚子疼记录」可查看所有记录")
+    
+    def resume_dialog(self):
+        """
+        处理对话中的回复（y/n/q、A-D）
+        没有进行中的对话时静默退出，对话已超时则提示
+        """
+        state = self.dialog.load()
+        if state is None:
+            if self.dialog.expired:
+                self.sender.reply("⏱️ 操作超时，已自动取消")
             return
         
-        # 无效输入
-        self.sender.reply("❓ 无效的输入，请重新操作")
+        step = state["step"]
+        if step == "record_confirm":
+            self.on_record_confirm(self.message.lower())
+        elif step == "record_location":
+            self.on_record_location(self.message.upper())
+        else:
+            self.dialog.clear()
     
     def view_records(self):
         """查看历史记录"""
-        records = self.get_user_records()
+        sorted_records = self.get_sorted_records()
         
-        if len(records) == 0:
+        if len(sorted_records) == 0:
             self.sender.reply("📭 暂无记录\n\n💡 发送「肚子疼」可以记录新的事件")
             return
         
-        # 按日期分组记录
+        # 总体统计单遍批量扫描；最近7天二分查找窗口，不逐条比较时间戳
         from collections import defaultdict
-        records_by_date = defaultdict(list)
+        from datetime import datetime as dt
+        stats = RecordAggregator.from_records(sorted_records, self.location_of, category_field="location_desc")
+        recent_count = len(self.get_recent_records(7, sorted_records))
         
-        for record in records:
+        # 从最新的记录开始按日期分组，只需要显示的最近10天
+        records_by_date = defaultdict(list)
+        for record in reversed(sorted_records):
             # 提取日期部分（YYYY-MM-DD）
             date_str = record['datetime'].split(' ')[0]
+            if date_str not in records_by_date and len(records_by_date) >= 10:
+                break
             time_str = record['datetime'].split(' ')[1][:5]  # HH:MM
             
             # 获取地点信息（兼容旧记录）
@@ -246,21 +303,13 @@ class StomachachePlugin:
                 'location': location_desc  # 添加地点信息
             })
         
-        # 计算统计信息
-        total_count = len(records)
-        total_days = len(records_by_date)
-        
-        # 获取日期范围
-        dates = sorted(records_by_date.keys())
-        first_date = dates[0]
-        last_date = dates[-1]
-        
-        # 计算跨度天数
-        from datetime import datetime as dt
-        date_span = (dt.strptime(last_date, '%Y-%m-%d') - dt.strptime(first_date, '%Y-%m-%d')).days + 1
-        
-        # 计算平均频率
-        avg_freq = total_count / total_days if total_days > 0 else 0
+        # 统计信息
+        total_count = stats.total
+        total_days = stats.total_days
+        first_date = stats.first_date
+        last_date = stats.last_date
+        date_span = stats.date_span
+        avg_freq = stats.avg_per_day
         
         # 构建消息
         message = f"📊 肚子疼记录 (共{total_count}条)\n"
@@ -300,8 +349,8 @@ class StomachachePlugin:
             message += f"  📊 当天{day_count}次\n\n"
         
         # 如果记录超过10天，显示提示
-        if len(records_by_date) > 10:
-            hidden_days = len(records_by_date) - 10
+        if total_days > 10:
+            hidden_days = total_days - 10
             message += f"... 还有{hidden_days}天的记录未显示\n\n"
         
         # 添加统计信息
@@ -310,7 +359,8 @@ class StomachachePlugin:
         message += f"• 记录时段: {first_date} 至 {last_date}\n"
         message += f"• 记录天数: {total_days}天 (跨度{date_span}天)\n"
         message += f"• 总计次数: {total_count}次\n"
-        message += f"• 平均频率: {avg_freq:.2f}次/天\n\n"
+        message += f"• 平均频率: {avg_freq:.2f}次/天\n"
+        message += f"• 最近7天: {recent_count}次\n\n"
         message += "💡 发送「肚子疼删除」可以删除记录"
         
         self.sender.reply(message)
@@ -382,17 +432,31 @@ class StomachachePlugin:
         
         if confirmation == "y":
             # 执行删除
-            records.pop(record_index - 1)
-            self.save_user_records(records)
+            sorted_records = self.get_sorted_records()
+            remove_by_timestamp(sorted_records, selected_record)
+            self.save_user_records(sorted_records)
             self.sender.reply("✅ 删除成功！\n\n💡 发送「肚子疼记录」可查看剩余记录")
             return
         
         # 无效输入
         self.sender.reply("❓ 无效的输入，已取消删除")
     
+    def flush_storage(self):
+        """写回本次调用中尚未保存的修改"""
+        try:
+            self.store.flush()
+        except Exception as e:
+            self.sender.reply(f"❌ {e}")
+        log.debug("存储统计", summary=self.store.summary)
+    
     def run(self):
         """主程序入口"""
         try:
+            # 对话中的回复
+            if re.match(DIALOG_REPLY_PATTERN, self.message):
+                self.resume_dialog()
+                return
+            
             # 路由到对应功能
             if self.message == "肚子疼帮助":
                 self.show_help()
@@ -408,6 +472,8 @@ class StomachachePlugin:
         
         except Exception as e:
             self.sender.reply(f"❌ 插件执行错误：{e}")
+        finally:
+            self.flush_storage()
 
 
 if __name__ == '__main__':
@@ -33,15 +33,179 @@ autMan 插件 - 体重记录
 
 import middleware
 import time
-import json
 import re
-from datetime import datetime
+import base64
+import bisect
+from array import array
+from datetime import datetime, date, timedelta
+import os
+import sys
+
+# 共享模块：部署时与插件放在同一目录，仓库中位于 common/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from autman_storage import get_store
+from autman_log import get_logger
 
 # 配置常量
 BUCKET_NAME = "weight_tracker"
 PENDING_ACTION_BUCKET = "weight_pending_action"
 VERSION = "v2.1.1"
 INPUT_TIMEOUT = 60000  # 60秒超时
+COMPACT_STORAGE = True  # 使用紧凑列式格式保存（False 时保存为旧版 JSON 记录列表）
+DAY_EPOCH = date(2000, 1, 1)  # 紧凑格式中日期偏移的起点
+log = get_logger("体重记录插件")
+
+
+def _pack(values):
+    """把 array 编码为 base64 字符串（统一小端字节序）"""
+    if sys.byteorder == 'big':
+        values = array(values.typecode, values)
+        values.byteswap()
+    return base64.b64encode(values.tobytes()).decode('ascii')
+
+
+def _unpack(typecode, text):
+    """从 base64 字符串还原 array"""
+    values = array(typecode)
+    values.frombytes(base64.b64decode(text))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def parse_weight(text):
+    """
+    解析用户输入的体重（kg），按存储精度四舍五入到 0.01kg，确认提示中显示的就是实际保存的值
+    :return: 体重，不是数字、不在 0-500 之间或四舍五入后为 0 时返回 None
+    """
+    try:
+        weight = float(text)
+    except ValueError:
+        return None
+    if not 0 < weight <= 500:
+        return None
+    weight = WeightSeries.to_centi(weight) / 100
+    return weight if weight > 0 else None
+
+
+class WeightSeries:
+    """
+    体重记录的列式存储
+
+    每天一条记录，按日期升序保存在三个定长数组中（每条共 12 字节）。
+    days 本身就是按日期排序的索引：查找某天用二分查找，修改直接按下标操作，
+    都不需要整体排序或逐条比较。新增（非末尾）和删除要移动后面的元素，
+    是 O(n) 的内存移动；每条命令还要整体解码、编码一次 base64 列数据，也是 O(n)。
+    每天一条记录时 10 年约 3650 条，这些开销都在 1 毫秒以内，因此没有分片；
+    10 万条时解码/编码约 2~5 毫秒（见 benchmarks/bench_weight_index.py）。
+
+    - days：距 DAY_EPOCH 的天数（uint32）
+    - weights：体重 ×100，精确到 0.01kg（uint16，上限 655.35kg）
+    - stamps：最后修改时间戳，单位秒（uint32）
+
+    紧凑格式写入存储桶时为 {"v": 2, "d": ..., "w": ..., "t": ...}，
+    每列是 base64 编码的小端字节数组，读取时无需逐条构建字典。
+    """
+
+    def __init__(self, days=None, weights=None, stamps=None):
+        self.days = days if days is not None else array('I')
+        self.weights = weights if weights is not None else array('H')
+        self.stamps = stamps if stamps is not None else array('I')
+
+    def __len__(self):
+        return len(self.days)
+
+    @staticmethod
+    def date_to_day(date_str):
+        """YYYY-MM-DD 转为天数偏移"""
+        return (datetime.strptime(date_str, '%Y-%m-%d').date() - DAY_EPOCH).days
+
+    @staticmethod
+    def day_to_date(day):
+        """天数偏移转为 YYYY-MM-DD"""
+        return (DAY_EPOCH + timedelta(days=day)).strftime('%Y-%m-%d')
+
+    @staticmethod
+    def to_centi(weight):
+        return int(round(weight * 100))
+
+    def date(self, i):
+        """第 i 条记录的日期"""
+        return self.day_to_date(self.days[i])
+
+    def weight(self, i):
+        """第 i 条记录的体重（kg）"""
+        return self.weights[i] / 100
+
+    @classmethod
+    def from_records(cls, records):
+        """从旧版记录列表 [{'date', 'weight', 'timestamp'}] 转换"""
+        series = cls()
+        for record in sorted(records, key=lambda x: x['date']):
+            series.days.append(cls.date_to_day(record['date']))
+            series.weights.append(cls.to_centi(record['weight']))
+            series.stamps.append(int(record.get('timestamp', 0)) // 1000)
+        return series
+
+    def to_records(self):
+        """转换为旧版记录列表"""
+        return [
+            {'date': self.date(i), 'weight': self.weight(i), 'timestamp': self.stamps[i] * 1000}
+            for i in range(len(self))
+        ]
+
+    @classmethod
+    def decode(cls, data):
+        """从紧凑格式还原"""
+        return cls(_unpack('I', data['d']), _unpack('H', data['w']), _unpack('I', data['t']))
+
+    def encode(self):
+        """编码为紧凑格式的列数据"""
+        return {'d': _pack(self.days), 'w': _pack(self.weights), 't': _pack(self.stamps)}
+
+    def find(self, day):
+        """
+        二分查找某天的记录
+        :return: 下标，不存在时返回 -1
+        """
+        i = bisect.bisect_left(self.days, day)
+        if i < len(self.days) and self.days[i] == day:
+            return i
+        return -1
+
+    def add(self, day, weight, stamp):
+        """新增一天的记录，插入到日期有序的位置（通常是末尾）"""
+        if not self.days or self.days[-1] < day:
+            i = len(self.days)
+        else:
+            i = bisect.bisect_left(self.days, day)
+        self.days.insert(i, day)
+        self.weights.insert(i, self.to_centi(weight))
+        self.stamps.insert(i, stamp)
+        return i
+
+    def upsert(self, day, weight, stamp):
+        """
+        记录某天体重：已有则更新，否则新增
+        :return: (下标, 原体重或 None)
+        """
+        i = self.find(day)
+        if i >= 0:
+            old_weight = self.weight(i)
+            self.update(i, weight, stamp)
+            return i, old_weight
+        return self.add(day, weight, stamp), None
+
+    def update(self, i, weight, stamp):
+        """修改第 i 条记录的体重"""
+        self.weights[i] = self.to_centi(weight)
+        self.stamps[i] = stamp
+
+    def remove(self, i):
+        """删除第 i 条记录"""
+        del self.days[i]
+        del self.weights[i]
+        del self.stamps[i]
 
 
 class WeightPlugin:
@@ -49,6 +213,7 @@ class WeightPlugin:
         """初始化插件"""
         sender_id = middleware.getSenderID()
         self.sender = middleware.Sender(sender_id)
+        self.store = get_store()
         self.user_id = self.sender.getUserID()
         self.username = self.user_id
         self.message = self.sender.getMessage().strip()
@@ -66,68 +231,79 @@ class WeightPlugin:
         return user_input.strip().lower()
     
     def get_data(self):
-        """获取用户数据"""
-        try:
-            data = middleware.bucketGet(BUCKET_NAME, self.user_id)
-            if not data or data == '':
-                return {'records': [], 'target': None}
-            return json.loads(data)
-        except:
-            return {'records': [], 'target': None}
+        """
+        获取用户数据
+        :return: {'series': WeightSeries, 'target': 目标体重或 None}
+        """
+        data = self.store.get(BUCKET_NAME, self.user_id)
+        if not isinstance(data, dict):
+            return {'series': WeightSeries(), 'target': None}
+        
+        if data.get('v') == 2:
+            return {'series': WeightSeries.decode(data), 'target': data.get('target')}
+        
+        # 旧版格式: {'records': [...], 'target': ...}，转换后随本次调用写回
+        result = {'series': WeightSeries.from_records(data.get('records', [])), 'target': data.get('target')}
+        if COMPACT_STORAGE and result['series']:
+            self.store.set(BUCKET_NAME, self.user_id, self.encode_data(result))
+        return result
+    
+    def encode_data(self, data):
+        """把用户数据编码为存储格式"""
+        if COMPACT_STORAGE:
+            value = {'v': 2, 'target': data.get('target')}
+            value.update(data['series'].encode())
+            return value
+        return {'records': data['series'].to_records(), 'target': data.get('target')}
     
     def save_data(self, data):
         """保存用户数据"""
         try:
-            json_data = json.dumps(data, ensure_ascii=False)
-            middleware.bucketSet(BUCKET_NAME, self.user_id, json_data)
+            self.store.set(BUCKET_NAME, self.user_id, self.encode_data(data))
+            self.store.flush()
+        except Exception as e:
+            self.sender.reply(f"❌ 保存失败：{e}")
+    
+    def delete_data(self):
+        """删除用户数据"""
+        try:
+            self.store.delete(BUCKET_NAME, self.user_id)
+            self.store.flush()
         except Exception as e:
             self.sender.reply(f"❌ 保存失败：{e}")
     
     def get_pending_action(self):
         """获取等待确认的操作"""
-        try:
-            pending_str = middleware.bucketGet(PENDING_ACTION_BUCKET, self.user_id)
-            
-            if pending_str and pending_str != '':
-                pending_action = json.loads(pending_str)
-                
-                # 检查是否超时 (30秒)
-                now = int(time.time() * 1000)
-                if now - pending_action.get('timestamp', 0) > 30000:
-                    self.clear_pending_action()
-                    return None
-                
-                return pending_action
-        except:
+        pending_action = self.store.get(PENDING_ACTION_BUCKET, self.user_id)
+        if pending_action is None:
+            return None
+        
+        if not isinstance(pending_action, dict):
+            self.clear_pending_action()
+            return None
+        
+        # 检查是否超时 (30秒)
+        now = int(time.time() * 1000)
+        if now - pending_action.get('timestamp', 0) > 30000:
             self.clear_pending_action()
+            return None
         
-        return None
+        return pending_action
     
     def save_pending_action(self, action):
         """保存等待确认的操作"""
-        try:
-            action['timestamp'] = int(time.time() * 1000)
-            json_data = json.dumps(action, ensure_ascii=False)
-            middleware.bucketSet(PENDING_ACTION_BUCKET, self.user_id, json_data)
-        except Exception as e:
-            print(f"[保存等待状态失败] {e}")
+        action['timestamp'] = int(time.time() * 1000)
+        self.store.set(PENDING_ACTION_BUCKET, self.user_id, action)
     
     def clear_pending_action(self):
         """清除等待确认的操作"""
-        try:
-            middleware.bucketDel(PENDING_ACTION_BUCKET, self.user_id)
-        except:
-            pass
+        self.store.delete(PENDING_ACTION_BUCKET, self.user_id)
     
     def record_weight(self, weight_str):
         """记录体重"""
-        try:
-            weight = float(weight_str)
-            if weight <= 0 or weight > 500:
-                self.sender.reply("❌ 体重数值无效,请输入0-500之间的数字")
-                return
-        except ValueError:
-            self.sender.reply("❌ 体重数值无效,请输入0-500之间的数字")
+        weight = parse_weight(weight_str)
+        if weight is None:
+            self.sender.reply("❌ 体重数值无效,请输入0-500之间的数字（精确到0.01kg）")
             return
         
         # 请求确认
@@ -149,41 +325,25 @@ class WeightPlugin:
         if confirmation == "y":
             # 执行记录
             data = self.get_data()
+            series = data['series']
+            day = WeightSeries.date_to_day(date)
             
-            # 检查当天是否已有记录
-            existing_index = -1
-            for i, record in enumerate(data['records']):
-                if record['date'] == date:
-                    existing_index = i
-                    break
+            # 当天已有记录则更新，否则新增
+            _, old_weight = series.upsert(day, weight, int(time.time()))
+            self.save_data(data)
             
-            if existing_index >= 0:
-                # 更新记录
-                old_weight = data['records'][existing_index]['weight']
-                data['records'][existing_index]['weight'] = weight
-                data['records'][existing_index]['timestamp'] = int(time.time() * 1000)
-                
-                self.save_data(data)
-                
+            if old_weight is not None:
+                # 更新了当天记录
                 diff = weight - old_weight
                 diff_str = f"+{diff:.1f}" if diff > 0 else f"{diff:.1f}"
                 message = f"✅ 已更新 {date} 的体重记录:\n"
                 message += f"{old_weight}kg → {weight}kg ({diff_str}kg)\n\n"
-                message += f"当前共有 {len(data['records'])} 条记录"
+                message += f"当前共有 {len(series)} 条记录"
                 self.sender.reply(message)
             else:
-                # 添加新记录
-                data['records'].append({
-                    'date': date,
-                    'weight': weight,
-                    'timestamp': int(time.time() * 1000)
-                })
-                
-                data['records'].sort(key=lambda x: x['date'])
-                self.save_data(data)
-                
+                # 新增记录
                 message = f"✅ 已记录 {date} 的体重: {weight}kg\n\n"
-                message += f"当前共有 {len(data['records'])} 条记录"
+                message += f"当前共有 {len(series)} 条记录"
                 
                 # 如果设置了目标,显示进度
                 if data.get('target'):
@@ -203,28 +363,29 @@ class WeightPlugin:
     def view_records(self):
         """查看记录"""
         data = self.get_data()
+        series = data['series']
+        data_target = data.get('target')
         
-        if not data['records']:
+        if not series:
             self.sender.reply("📋 暂无体重记录\n\n💡 发送「体重 65.5」开始记录")
             return
         
-        # 按日期排序(最新在前)
-        sorted_records = sorted(data['records'], key=lambda x: x['date'], reverse=True)
-        
-        # 显示最近7条
-        display_records = sorted_records[:7]
+        # 显示最近7条(最新在前)
+        total = len(series)
+        display_indexes = list(range(total - 1, max(total - 7, 0) - 1, -1))
         
-        message = f"📊 体重记录 (共{len(data['records'])}条)\n"
+        message = f"📊 体重记录 (共{total}条)\n"
         message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
         
-        for i, record in enumerate(display_records):
-            year, month, day = record['date'].split('-')
+        for i, idx in enumerate(display_indexes):
+            year, month, day = series.date(idx).split('-')
+            weight = series.weight(idx)
             
             # 计算趋势
             trend = ""
-            if i < len(display_records) - 1:
-                prev_weight = display_records[i + 1]['weight']
-                diff = record['weight'] - prev_weight
+            if i < len(display_indexes) - 1:
+                prev_weight = series.weight(display_indexes[i + 1])
+                diff = weight - prev_weight
                 if diff > 0.1:
                     trend = f" ↑ +{diff:.1f}kg"
                 elif diff < -0.1:
@@ -233,14 +394,14 @@ class WeightPlugin:
                     trend = " → 持平"
             
             message += f"🗓️ {int(month)}月{int(day)}日\n"
-            message += f"  📊 {record['weight']}kg{trend}\n\n"
+            message += f"  📊 {weight}kg{trend}\n\n"
         
         # 显示目标信息
-        if data.get('target'):
-            latest_weight = sorted_records[0]['weight']
-            diff = latest_weight - data['target']
+        if data_target:
+            latest_weight = series.weight(total - 1)
+            diff = latest_weight - data_target
             message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-            message += f"🎯 目标体重: {data['target']}kg\n"
+            message += f"🎯 目标体重: {data_target}kg\n"
             if abs(diff) < 0.1:
                 message += "✅ 已达成目标!"
             elif diff > 0:
@@ -252,21 +413,20 @@ class WeightPlugin:
     
     def show_detailed_records(self):
         """显示带编号的详细记录"""
-        data = self.get_data()
+        series = self.get_data()['series']
         
-        if not data['records']:
+        if not series:
             self.sender.reply("📋 暂无体重记录")
             return
         
-        # 按日期排序(最新在前)
-        sorted_records = sorted(data['records'], key=lambda x: x['date'], reverse=True)
-        
-        message = f"📋 体重详细记录 (共{len(sorted_records)}条)\n"
+        total = len(series)
+        message = f"📋 体重详细记录 (共{total}条)\n"
         message += "━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
         
-        for i, record in enumerate(sorted_records):
-            num = i + 1
-            message += f"[{num}] {record['date']}  {record['weight']}kg\n"
+        # 编号从最新记录开始
+        for num in range(1, total + 1):
+            idx = total - num
+            message += f"[{num}] {series.date(idx)}  {series.weight(idx)}kg\n"
         
         message += "\n━━━━━━━━━━━━━━━━━━━━━━━━━\n"
         message += "💡 (30秒内) 发送数字编号可快速删除\n"
@@ -281,8 +441,9 @@ class WeightPlugin:
     def delete_record(self, index_str):
         """删除指定记录"""
         data = self.get_data()
+        series = data['series']
         
-        if not data['records']:
+        if not series:
             self.sender.reply("📋 暂无记录可删除")
             return
         
@@ -292,18 +453,17 @@ class WeightPlugin:
             self.sender.reply(f'❌ 无效的编号"{index_str}"\n请使用「体重详细记录」查看有效编号')
             return
         
-        # 按日期排序(最新在前)
-        sorted_records = sorted(data['records'], key=lambda x: x['date'], reverse=True)
-        
-        if index < 1 or index > len(sorted_records):
+        if index < 1 or index > len(series):
             self.sender.reply(f'❌ 无效的编号"{index_str}"\n请使用「体重详细记录」查看有效编号')
             return
         
-        # 获取要删除的记录
-        target_record = sorted_records[index - 1]
+        # 编号按最新在前排列
+        idx = len(series) - index
+        target_date = series.date(idx)
+        target_weight = series.weight(idx)
         
         # 请求确认
-        prompt = f"🗑️ 确认要删除记录 [{index}]:\n{target_record['date']}  {target_record['weight']}kg 吗？"
+        prompt = f"🗑️ 确认要删除记录 [{index}]:\n{target_date}  {target_weight}kg 吗？"
         confirmation = self.get_user_confirmation(prompt)
         
         if not confirmation or confirmation in ['q', 'n']:
@@ -311,38 +471,31 @@ class WeightPlugin:
             return
         
         if confirmation == 'y':
-            # 从原数组中删除
-            for i, r in enumerate(data['records']):
-                if r['date'] == target_record['date']:
-                    del data['records'][i]
-                    break
+            series.remove(idx)
             
             # 保存更新后的数据
-            if not data['records'] and not data.get('target'):
-                middleware.bucketDel(BUCKET_NAME, self.user_id)
+            if not series and not data.get('target'):
+                self.delete_data()
             else:
                 self.save_data(data)
             
             message = f"✅ 已删除记录 [{index}]:\n"
-            message += f"{target_record['date']}  {target_record['weight']}kg\n\n"
-            message += f"剩余 {len(data['records'])} 条记录"
+            message += f"{target_date}  {target_weight}kg\n\n"
+            message += f"剩余 {len(series)} 条记录"
             self.sender.reply(message)
     
     def modify_record(self, index_str, new_weight_str):
         """修改指定记录"""
         # 验证新体重值
-        try:
-            new_weight = float(new_weight_str)
-            if new_weight <= 0 or new_weight > 500:
-                self.sender.reply("❌ 体重数值无效,请输入0-500之间的数字")
-                return
-        except ValueError:
-            self.sender.reply("❌ 体重数值无效,请输入0-500之间的数字")
+        new_weight = parse_weight(new_weight_str)
+        if new_weight is None:
+            self.sender.reply("❌ 体重数值无效,请输入0-500之间的数字（精确到0.01kg）")
             return
         
         data = self.get_data()
+        series = data['series']
         
-        if not data['records']:
+        if not series:
             self.sender.reply("📋 暂无记录可修改")
             return
         
@@ -352,18 +505,17 @@ class WeightPlugin:
             self.sender.reply(f'❌ 无效的编号"{index_str}"\n请使用「体重详细记录」查看有效编号')
             return
         
-        # 按日期排序(最新在前)
-        sorted_records = sorted(data['records'], key=lambda x: x['date'], reverse=True)
-        
-        if index < 1 or index > len(sorted_records):
+        if index < 1 or index > len(series):
             self.sender.reply(f'❌ 无效的编号"{index_str}"\n请使用「体重详细记录」查看有效编号')
             return
         
-        # 获取要修改的记录
-        target_record = sorted_records[index - 1]
+        # 编号按最新在前排列
+        idx = len(series) - index
+        target_date = series.date(idx)
+        old_weight = series.weight(idx)
         
         # 请求确认
-        prompt = f"✏️ 确认要修改记录 [{index}]:\n{target_record['date']}\n{target_record['weight']}kg → {new_weight}kg 吗？"
+        prompt = f"✏️ 确认要修改记录 [{index}]:\n{target_date}\n{old_weight}kg → {new_weight}kg 吗？"
         confirmation = self.get_user_confirmation(prompt)
         
         if not confirmation or confirmation in ['q', 'n']:
@@ -371,20 +523,13 @@ class WeightPlugin:
             return
         
         if confirmation == 'y':
-            # 在原数组中找到并修改
-            for i, r in enumerate(data['records']):
-                if r['date'] == target_record['date']:
-                    old_weight = r['weight']
-                    data['records'][i]['weight'] = new_weight
-                    data['records'][i]['timestamp'] = int(time.time() * 1000)
-                    break
-            
+            series.update(idx, new_weight, int(time.time()))
             self.save_data(data)
             
             diff = new_weight - old_weight
             diff_str = f"+{diff:.1f}" if diff > 0 else f"{diff:.1f}"
             message = f"✅ 已修改记录 [{index}]:\n"
-            message += f"{target_record['date']}\n"
+            message += f"{target_date}\n"
             message += f"{old_weight}kg → {new_weight}kg ({diff_str}kg)"
             self.sender.reply(message)
     
@@ -392,12 +537,12 @@ class WeightPlugin:
         """清空所有记录"""
         data = self.get_data()
         
-        if not data['records']:
+        if not data['series']:
             self.sender.reply("📋 暂无记录可清空")
             return
         
         # 请求确认
-        prompt = f"⚠️ 确定要清空所有 {len(data['records'])} 条体重记录吗？\n\n此操作不可恢复!"
+        prompt = f"⚠️ 确定要清空所有 {len(data['series'])} 条体重记录吗？\n\n此操作不可恢复!"
         if data.get('target'):
             prompt += f"\n(目标体重 {data['target']}kg 将被保留)"
         
@@ -409,39 +554,39 @@ class WeightPlugin:
         
         if confirmation == 'y':
             # 保留目标体重,只清空记录
-            data['records'] = []
+            data['series'] = WeightSeries()
             
             if not data.get('target'):
-                middleware.bucketDel(BUCKET_NAME, self.user_id)
+                self.delete_data()
                 self.sender.reply("🗑️ 已清空所有体重记录")
             else:
                 self.save_data(data)
                 self.sender.reply(f"🗑️ 已清空所有体重记录\n\n🎯 目标体重 {data['target']}kg 已保留")
     
     def show_statistics(self):
-        """显示统计信息"""
+        """显示统计信息（直接在列数据上计算）"""
         data = self.get_data()
+        series = data['series']
         
-        if not data['records']:
+        if not series:
             self.sender.reply("📋 暂无体重记录")
             return
         
-        sorted_records = sorted(data['records'], key=lambda x: x['date'])
-        
-        weights = [r['weight'] for r in sorted_records]
-        max_weight = max(weights)
-        min_weight = min(weights)
-        avg_weight = sum(weights) / len(weights)
-        total_change = sorted_records[-1]['weight'] - sorted_records[0]['weight']
-        
-        max_record = next(r for r in sorted_records if r['weight'] == max_weight)
-        min_record = next(r for r in sorted_records if r['weight'] == min_weight)
+        weights = series.weights
+        max_index = weights.index(max(weights))
+        min_index = weights.index(min(weights))
+        max_weight = series.weight(max_index)
+        min_weight = series.weight(min_index)
+        avg_weight = sum(weights) / len(weights) / 100
+        total_change = (weights[-1] - weights[0]) / 100
+        first_date = series.date(0)
+        last_date = series.date(len(series) - 1)
         
         message = "📊 体重统计\n━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
         message += f"📈 最高体重: {max_weight}kg\n"
-        message += f"   🗓️ {max_record['date']}\n\n"
+        message += f"   🗓️ {series.date(max_index)}\n\n"
         message += f"📉 最低体重: {min_weight}kg\n"
-        message += f"   🗓️ {min_record['date']}\n\n"
+        message += f"   🗓️ {series.date(min_index)}\n\n"
         message += f"📊 平均体重: {avg_weight:.1f}kg\n\n"
         message += "📊 总体变化: "
         if total_change > 0.1:
@@ -450,12 +595,12 @@ class WeightPlugin:
             message += f"↓ {total_change:.1f}kg"
         else:
             message += "→ 基本持平"
-        message += f"\n   从 {sorted_records[0]['date']} 到 {sorted_records[-1]['date']}"
+        message += f"\n   从 {first_date} 到 {last_date}"
         
         if data.get('target'):
             message += "\n\n━━━━━━━━━━━━━━━━━━━━━━━━━\n"
             message += f"🎯 目标体重: {data['target']}kg\n"
-            latest_weight = sorted_records[-1]['weight']
+            latest_weight = series.weight(len(series) - 1)
             diff = latest_weight - data['target']
             if abs(diff) < 0.1:
                 message += "✅ 已达成目标!"
@@ -468,13 +613,9 @@ class WeightPlugin:
     
     def set_target(self, target_str):
         """设置目标体重"""
-        try:
-            target = float(target_str)
-            if target <= 0 or target > 500:
-                self.sender.reply("❌ 目标体重数值无效,请输入0-500之间的数字")
-                return
-        except ValueError:
-            self.sender.reply("❌ 目标体重数值无效,请输入0-500之间的数字")
+        target = parse_weight(target_str)
+        if target is None:
+            self.sender.reply("❌ 目标体重数值无效,请输入0-500之间的数字（精确到0.01kg）")
             return
         
         # 请求确认
@@ -499,9 +640,9 @@ class WeightPlugin:
             
             message = f"✅ 已设置目标体重为: {target}kg"
             
-            if data['records']:
-                sorted_records = sorted(data['records'], key=lambda x: x['date'], reverse=True)
-                latest_weight = sorted_records[0]['weight']
+            series = data['series']
+            if series:
+                latest_weight = series.weight(len(series) - 1)
                 diff = latest_weight - target
                 
                 message += f"\n\n📊 当前体重: {latest_weight}kg\n"
@@ -520,17 +661,17 @@ class WeightPlugin:
     def show_target_progress(self):
         """显示目标进度"""
         data = self.get_data()
+        series = data['series']
         
         if not data.get('target'):
             self.sender.reply("❌ 尚未设置目标体重\n\n💡 发送「设置目标体重 60」来设定目标")
             return
         
-        if not data['records']:
+        if not series:
             self.sender.reply(f"🎯 目标体重: {data['target']}kg\n\n📋 暂无体重记录,无法计算进度")
             return
         
-        sorted_records = sorted(data['records'], key=lambda x: x['date'], reverse=True)
-        latest_weight = sorted_records[0]['weight']
+        latest_weight = series.weight(len(series) - 1)
         diff = latest_weight - data['target']
         
         message = "🎯 目标进度\n━━━━━━━━━━━━━━━━━━━━━━━━━\n\n"
@@ -575,6 +716,14 @@ class WeightPlugin:
         
         self.sender.reply(help_text)
     
+    def flush_storage(self):
+        """写回本次调用中尚未保存的修改"""
+        try:
+            self.store.flush()
+        except Exception as e:
+            self.sender.reply(f"❌ {e}")
+        log.debug("存储统计", summary=self.store.summary)
+    
     def run(self):
         """主程序入口"""
         try:
@@ -585,7 +734,7 @@ class WeightPlugin:
                 if pending_action['action'] == 'view_details':
                     # 在详情浏览模式下,检查是否输入了数字
                     if re.match(r'^\d+$', self.content):
-                        print(f"[体重记录插件] 详情浏览模式下检测到数字: {self.content}，快速删除")
+                        log.debug("详情浏览模式下快速删除", index=self.content)
                         self.clear_pending_action()
                         self.delete_record(self.content)
                         return
@@ -639,6 +788,8 @@ class WeightPlugin:
         
         except Exception as e:
             self.sender.reply(f"❌ 插件执行错误：{e}")
+        finally:
+            self.flush_storage()
 
 
 if __name__ == '__main__':